@@ -1,18 +1,70 @@
 import os
+import sys
+import asyncio
 from dotenv import load_dotenv
+from openai import RateLimitError
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler,
+    Application, CommandHandler,
     CallbackQueryHandler, MessageHandler,
     ContextTypes, filters
 )
-import openai
 import json
 
+# .env читаем до импорта общих модулей: их настройки берутся при импорте
 load_dotenv()
+
+# Общие модули лежат в корне репозитория
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.openai_client import (  # noqa: E402
+    close_async_client, get_async_client, hold_async_client
+)
+from common.streaming import (  # noqa: E402
+    STREAM_REPLIES, StreamingReply, stream_chat_completion
+)
+from common.telegram_app import application_builder, run_application  # noqa: E402
+from common.context_builder import count_tokens  # noqa: E402
+from common.response_cache import ResponseCache, make_key  # noqa: E402
+from common.semantic_cache import SemanticCache  # noqa: E402
+from common.quotas import Quotas  # noqa: E402
+from common import metrics, tracing  # noqa: E402
+from common.openai_scheduler import (  # noqa: E402
+    PRIORITY_NORMAL, PRIORITY_PAID, SchedulerBusy, chat_scheduler,
+    image_scheduler
+)
+
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
+# Сколько апдейтов обрабатывается одновременно
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))
+# Отдельные лимиты для текста и картинок: медленный DALL·E не должен
+# занимать слоты текстовых ответов
+TEXT_CONCURRENCY = int(os.getenv("TEXT_CONCURRENCY", "128"))
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "4"))
+# Сколько заявок на картинки может стоять в очереди сверх IMAGE_CONCURRENCY
+IMAGE_QUEUE_LIMIT = int(os.getenv("IMAGE_QUEUE_LIMIT", "50"))
+# Модель и температура текстовых режимов (входят в ключ кэша ответов)
+TEXT_MODEL = os.getenv("TEXT_MODEL", "gpt-4o")
+TEXT_TEMPERATURE = float(os.getenv("TEXT_TEMPERATURE", "1.0"))
+# Режимы, где одинаковый вопрос можно отвечать из кэша. «Развлекать»
+# и «писать» должны каждый раз выдавать новое
+CACHED_MODES = {
+    mode.strip() for mode in
+    os.getenv("RESPONSE_CACHE_MODES", "explain,learn").split(",")
+    if mode.strip()
+}
+# Режимы (из RESPONSE_CACHE_MODES), где ответ переиспользуется и для
+# перефразированного вопроса: «объясни ипотеку» ~ «что такое ипотека»
+SEMANTIC_MODES = {
+    mode.strip() for mode in
+    os.getenv("SEMANTIC_CACHE_MODES", "explain").split(",")
+    if mode.strip()
+}
+# Кому доступна команда /cache_stats (id через запятую)
+ADMIN_IDS = {
+    int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",")
+    if admin_id.strip()
+}
 
 def load_tariffs():
     try:
@@ -24,9 +76,51 @@ def load_tariffs():
 # Загружаем тарифы при запуске
 TARIFFS = load_tariffs()
 
+class WorkerPool:
+    """Ограничивает число одновременных запросов и длину очереди к ним"""
+
+    def __init__(self, concurrency, queue_limit=None):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.queue_limit = queue_limit
+        self.pending = 0
+
+    def is_full(self):
+        return self.queue_limit is not None and self.pending >= self.queue_limit
+
+    async def run(self, coro_fn, *args, **kwargs):
+        self.pending += 1
+        try:
+            async with self.slots:
+                return await coro_fn(*args, **kwargs)
+        finally:
+            self.pending -= 1
+
+
+text_pool = WorkerPool(TEXT_CONCURRENCY)
+image_pool = WorkerPool(IMAGE_CONCURRENCY, IMAGE_CONCURRENCY + IMAGE_QUEUE_LIMIT)
+response_cache = ResponseCache()
+semantic_cache = SemanticCache()
+quotas = Quotas(TARIFFS)
+
+# Что ответить, когда квота не пустила запрос
+QUOTA_MESSAGES = {
+    "rate": "⏳ Слишком много запросов подряд. Подожди минуту и попробуй снова.",
+    "image_generations": (
+        "🎨 Лимит картинок на сегодня исчерпан. "
+        "Больше картинок — в тарифах: /start → 💳 Тарифы."
+    ),
+    "text_requests": (
+        "📝 Лимит запросов на сегодня исчерпан. "
+        "Загляни в тарифы: /start → 💳 Тарифы."
+    ),
+}
+# Планировщик уже повторял запрос, а OpenAI всё ещё перегружен
+BUSY_MESSAGE = "⏳ Сервис сейчас перегружен. Попробуй через минуту."
+
 # ——— Вспомогательные функции ———
 
-def ask_gpt(question, mode="default"):
+@metrics.timed("hub")
+async def ask_gpt(question, mode="default", stream=None, priority=PRIORITY_NORMAL):
     system_prompts = {
         "write": "Ты — профессиональный копирайтер. Пиши живо, понятно, по существу.",
         "explain": "Ты — учитель, объясняй сложное простыми словами, с примерами.",
@@ -42,18 +136,54 @@ def ask_gpt(question, mode="default"):
             "Не имитируй человека. Ты — ИИ нового поколения, сверхрациональный помощник."
         )
     }
-    prompt = system_prompts.get(mode, system_prompts["default"])
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    with tracing.span("prompt_build", mode=mode):
+        prompt = system_prompts.get(mode, system_prompts["default"])
+        messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": question}
         ]
-    )
-    return response.choices[0].message.content.strip()
 
-def draw_image(prompt):
-    response = openai.images.generate(
+    async def create():
+        # В потоковом режиме токены сразу уходят в сообщение пользователя
+        if stream is not None:
+            reply = await chat_scheduler.run(
+                stream_chat_completion, stream, priority=priority,
+                model=TEXT_MODEL, messages=messages,
+                temperature=TEXT_TEMPERATURE
+            )
+            tokens = count_tokens(prompt + question + reply)
+            return reply.strip(), tokens
+        response = await chat_scheduler.run(
+            get_async_client().chat.completions.create,
+            priority=priority,
+            model=TEXT_MODEL,
+            messages=messages,
+            temperature=TEXT_TEMPERATURE
+        )
+        tokens = response.usage.total_tokens if response.usage else 0
+        return response.choices[0].message.content.strip(), tokens
+
+    async def create_or_reuse():
+        if mode not in SEMANTIC_MODES:
+            return await create()
+        similar = semantic_cache.lookup(mode, question)
+        if similar is not None:
+            return similar
+        reply, tokens = await create()
+        semantic_cache.add(mode, question, reply, tokens)
+        return reply, tokens
+
+    if mode not in CACHED_MODES:
+        reply, _ = await create()
+        return reply
+    key = make_key(mode, TEXT_MODEL, TEXT_TEMPERATURE, question)
+    return await response_cache.get_or_create(key, mode, create_or_reuse)
+
+@metrics.timed("hub")
+async def draw_image(prompt, priority=PRIORITY_NORMAL):
+    response = await image_scheduler.run(
+        get_async_client().images.generate,
+        priority=priority,
         model="dall-e-3",
         prompt=prompt,
         n=1,
@@ -117,6 +247,11 @@ async def show_menu(query, context):
 
 # ——— Обработчики ———
 
+def hub_mode(update, context):
+    """Метки метрик обработчика: выбранный режим, персонажей у хаба нет"""
+    return (context.user_data or {}).get("mode") or "", ""
+
+@metrics.instrument_handler("hub", hub_mode)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [InlineKeyboardButton("🚀 Зайти", callback_data="enter")]
@@ -138,6 +273,42 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data["mode"] = None
 
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_text(
+        f"🗄 Кэш ответов: {len(response_cache)} записей\n\n"
+        + response_cache.report()
+        + "\n\n🧭 Похожие вопросы:\n" + semantic_cache.report()
+    )
+
+async def queue_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_text(
+        "🚦 Очередь к OpenAI\n\n"
+        + chat_scheduler.report() + "\n" + image_scheduler.report()
+    )
+
+async def grant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    # Выдаются только платные тарифы
+    paid = [tariff_id for tariff_id, tariff in (TARIFFS or {}).items()
+            if tariff.get("price_rub")]
+    if (len(context.args) != 2 or not context.args[0].isdigit()
+            or context.args[1] not in paid):
+        await update.message.reply_text(
+            "Использование: /grant <user_id> <" + "|".join(paid) + ">"
+        )
+        return
+    user_id, tariff_id = int(context.args[0]), context.args[1]
+    await quotas.grant(user_id, tariff_id)
+    await update.message.reply_text(
+        f"✅ Пользователю {user_id} подключён тариф «{TARIFFS[tariff_id]['name']}»"
+    )
+
+@metrics.instrument_handler("hub", hub_mode)
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -216,27 +387,112 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup
         )
 
+def user_priority(update):
+    """Платные пользователи обгоняют бесплатных в очереди к OpenAI"""
+    if quotas.is_paid(update.effective_user.id):
+        return PRIORITY_PAID
+    return PRIORITY_NORMAL
+
+async def check_quota(update, mode, kind, reply_markup):
+    """Резервирует квоту; при отказе отвечает пользователю и возвращает None"""
+    with tracing.span("state_lookup", mode=mode) as span:
+        allowed, source = await quotas.acquire(update.effective_user.id, mode, kind)
+        span.set("quota.source", source or "")
+    if allowed:
+        return source
+    await update.message.reply_text(
+        QUOTA_MESSAGES["rate" if source == "rate" else kind],
+        reply_markup=reply_markup
+    )
+    return None
+
+@metrics.instrument_handler("hub", hub_mode)
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_mode = context.user_data.get("mode")
     keyboard = [[InlineKeyboardButton("🤖 Выбрать другого бота", callback_data="home")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     if user_mode in ("write", "explain", "learn", "advise", "automate", "entertain"):
-        reply = ask_gpt(update.message.text, mode=user_mode)
-        await update.message.reply_text(get_role_header(user_mode) + "\n" + reply, reply_markup=reply_markup)
+        source = await check_quota(update, user_mode, "text_requests", reply_markup)
+        if source is None:
+            return
+        stream = StreamingReply(
+            update.message,
+            prefix=get_role_header(user_mode) + "\n",
+            reply_markup=reply_markup
+        )
+        try:
+            reply = await text_pool.run(
+                ask_gpt, update.message.text, mode=user_mode,
+                stream=stream if STREAM_REPLIES else None,
+                priority=user_priority(update)
+            )
+        except (RateLimitError, SchedulerBusy):
+            quotas.refund(update.effective_user.id, "text_requests", source)
+            await update.message.reply_text(BUSY_MESSAGE, reply_markup=reply_markup)
+            return
+        except Exception:
+            quotas.refund(update.effective_user.id, "text_requests", source)
+            raise
+        await stream.finish(reply)
     elif user_mode == "draw":
-        url = draw_image(update.message.text)
+        if image_pool.is_full():
+            await update.message.reply_text(
+                "🎨 Художник сейчас завален заказами. Попробуй через минуту.",
+                reply_markup=reply_markup
+            )
+            return
+        source = await check_quota(update, user_mode, "image_generations", reply_markup)
+        if source is None:
+            return
+        try:
+            url = await image_pool.run(
+                draw_image, update.message.text, priority=user_priority(update)
+            )
+        except (RateLimitError, SchedulerBusy):
+            quotas.refund(update.effective_user.id, "image_generations", source)
+            await update.message.reply_text(BUSY_MESSAGE, reply_markup=reply_markup)
+            return
+        except Exception:
+            quotas.refund(update.effective_user.id, "image_generations", source)
+            raise
         await update.message.reply_photo(url, reply_markup=reply_markup)
     else:
         await update.message.reply_text("Пожалуйста, выбери действие в меню /start")
 
 # ——— Запуск ———
 
-def run_bot():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+async def on_startup(app):
+    app.bot_data["quota_writer"] = asyncio.create_task(quotas.run_flusher())
+    hold_async_client()
+    await metrics.start_server()
+    tracing.exporter.start()
+
+async def on_shutdown(app):
+    app.bot_data["quota_writer"].cancel()
+    await quotas.close()
+    response_cache.close()
+    await close_async_client()
+    await metrics.stop_server()
+    await tracing.exporter.stop()
+
+def build_application(token=TELEGRAM_TOKEN) -> Application:
+    app = (
+        application_builder(token, CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("cache_stats", cache_stats))
+    app.add_handler(CommandHandler("grant", grant))
+    app.add_handler(CommandHandler("queue", queue_stats))
     app.add_handler(CallbackQueryHandler(button_handler))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    app.run_polling()
+    return app
+
+def run_bot():
+    # polling или webhook — решает .env (WEBHOOK_URL / BOT_MODE)
+    run_application(build_application())
 
 if __name__ == "__main__":
     run_bot()
\ No newline at end of file
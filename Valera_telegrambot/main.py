@@ -1,16 +1,49 @@
 import os
-import openai
+import sys
+import asyncio
 import json
-import re
 import random
-from typing import Dict, List, TypedDict, Literal
+from typing import Dict, List, Optional, Tuple, TypedDict, Literal
 from dotenv import load_dotenv
+from openai import RateLimitError
 from telegram import Update
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler,
+    Application, CommandHandler,
     MessageHandler, ContextTypes, filters
 )
 
+# .env читаем до импорта общих модулей: их настройки берутся при импорте
+load_dotenv()
+
+# Общие модули лежат в корне репозитория
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.openai_client import (  # noqa: E402
+    close_async_client, get_async_client, hold_async_client, use_transport
+)
+from common.streaming import (  # noqa: E402
+    STREAM_REPLIES, StreamingReply, stream_chat_completion
+)
+from common.conversation_store import (  # noqa: E402
+    ConversationStore, Session, create_store
+)
+from common.context_builder import build_context, make_message  # noqa: E402
+from common.summarizer import Summarizer  # noqa: E402
+from common.openai_scheduler import (  # noqa: E402
+    SchedulerBusy, chat_scheduler
+)
+from common.telegram_app import (  # noqa: E402
+    application_builder, run_application, run_applications
+)
+from common.name_matcher import NameMatcher, flatten_name_map  # noqa: E402
+from common.prompt_registry import Character, PromptRegistry  # noqa: E402
+from common.config_watcher import ConfigWatcher  # noqa: E402
+from common.mock_openai import MockOpenAI  # noqa: E402
+from common import metrics, tracing  # noqa: E402
+from common.sharding import (  # noqa: E402
+    SHARD_INDEX_ENV, SHARD_WORKERS, run_shard_worker, run_sharded
+)
+from users import registry  # noqa: E402
+
 
 class ChatMessage(TypedDict):
     role: Literal["system", "user", "assistant"]
@@ -18,45 +51,58 @@ class ChatMessage(TypedDict):
 
 
 # --- INIT ---
-load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
+# Сколько апдейтов обрабатывается одновременно, пока другие ждут модель
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))
+# Несколько ботов в одном процессе: "персонаж=токен,персонаж=токен".
+# Пусто — один бот с TELEGRAM_TOKEN и персонажем valera
+VALERA_BOTS = os.getenv("VALERA_BOTS", "")
+# Кому доступна команда /stats (id через запятую)
+ADMIN_IDS = {
+    int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",")
+    if admin_id.strip()
+}
+
+# Настройки бота лежат рядом с main.py, откуда бы его ни запустили
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def bot_file(name: str) -> str:
+    return os.path.join(BOT_DIR, name)
+
+
+# --- Настройки ---
+def load_settings() -> dict:
+    try:
+        with open(bot_file("settings.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Ошибка загрузки settings.json: {e}. Использую умолчания.")
+        return {}
+
+
+settings = load_settings()
+# mock_mode: синтетические ответы вместо OpenAI для нагрузочных тестов.
+# MOCK_MODE=1 или 0 в окружении важнее settings.json
+MOCK_MODE = os.getenv(
+    "MOCK_MODE", "1" if settings.get("mock_mode") else "0"
+) == "1"
+mock_openai: Optional[MockOpenAI] = None
+if MOCK_MODE:
+    mock_openai = MockOpenAI.from_settings(settings.get("mock", {}), BOT_DIR)
+    use_transport(mock_openai)
+    print("mock_mode: ответы модели синтетические, OpenAI не вызывается")
 
 
 # --- Загрузка словаря имён ---
 def load_name_gender_map() -> Dict[str, str]:
     try:
-        with open("name_gender_map.json", "r", encoding="utf-8") as f:
-            raw_map = json.load(f)
-            name_map = {}
-            
-            # Обработка мужских имён
-            male_names = raw_map.get(
-                "// МУЖСКИЕ ИМЕНА", {}
-            )
-            for full_name, variations in male_names.items():
-                for name, gender in variations.items():
-                    name_map[name.lower()] = gender
-            
-            # Обработка женских имён
-            female_names = raw_map.get(
-                "// ЖЕНСКИЕ ИМЕНА", {}
-            )
-            for full_name, variations in female_names.items():
-                for name, gender in variations.items():
-                    name_map[name.lower()] = gender
-            
-            # Обработка неопределённых имён
-            unknown_names = raw_map.get(
-                "// ИМЕНА, КОТОРЫЕ МОГУТ БЫТЬ И МУЖСКИМИ И ЖЕНСКИМИ", 
-                {}
-            )
-            for full_name, variations in unknown_names.items():
-                for name, gender in variations.items():
-                    name_map[name.lower()] = gender
-            
-            return name_map
+        with open(bot_file("name_gender_map.json"), "r", encoding="utf-8") as f:
+            # Мужские, женские и неопределённые имена в одном словаре
+            return flatten_name_map(json.load(f))
     except Exception as e:
         print(
             f"Ошибка загрузки name_gender_map.json: {e}. "
@@ -71,7 +117,7 @@ def load_name_gender_map() -> Dict[str, str]:
 # --- Загрузка промптов ---
 def load_characters():
     try:
-        with open("characters.json", "r", encoding="utf-8") as f:
+        with open(bot_file("characters.json"), "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
         print("Ошибка загрузки characters.json. Использую базовый промпт.")
@@ -88,67 +134,131 @@ def load_characters():
 
 
 # Загружаем данные при старте
-name_gender_map = load_name_gender_map()
-characters = load_characters()
-
-
-# --- Глобальные переменные ---
-user_memory: Dict[int, List[ChatMessage]] = {}
-user_gender: Dict[int, str] = {}
-user_state: Dict[int, str] = {}
-# Счетчик сообщений для каждого пользователя
-message_counter: Dict[int, int] = {}
-
-
-def load_promo_messages() -> List[str]:
+# Все падежные формы имён разворачиваются один раз при старте
+name_matcher = NameMatcher(load_name_gender_map())
+# Системные промпты для каждого персонажа и пола собираются при загрузке
+prompts = PromptRegistry(load_characters(), fallback={
+    "prompt": ["Ты Валера, грубый помощник."],
+    "model": "gpt-4o",
+    "temperature": 0.9,
+})
+
+
+# --- Боты и сессии пользователей ---
+class ValeraBot:
+    """Персонаж по умолчанию, сессии и резюме одного бота.
+
+    Персонажи, словарь имён и промо-сообщения общие для всех ботов процесса
+    и только читаются, а сессии у каждого бота свои: один и тот же
+    пользователь в разных ботах ведёт разные разговоры.
+    """
+
+    __slots__ = ("character", "sessions", "summarizer")
+
+    def __init__(self, character: str, store: ConversationStore):
+        self.character = character
+        # Состояние, пол, счётчик сообщений и история живут в
+        # ConversationStore: в памяти только LRU-кэш, остальное — в SQLite
+        self.sessions = store
+        # Старая история сжимается в резюме фоновыми задачами
+        self.summarizer = Summarizer(store)
+
+    def character_of(self, session: Session) -> Character:
+        """Персонаж, выбранный в чате, а если его нет — персонаж бота"""
+        if session.character and session.character in prompts:
+            return prompts.get(session.character)
+        return prompts.get(self.character)
+
+
+# Бот процесса по умолчанию (TELEGRAM_TOKEN, CONVERSATION_DB)
+default_bot = ValeraBot("valera", create_store())
+
+
+def bot_of(context: ContextTypes.DEFAULT_TYPE) -> ValeraBot:
+    return context.bot_data.get("valera", default_bot)
+
+
+def session_labels(update: Update,
+                   context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, str]:
+    """Метки метрик обработчика: состояние сессии до апдейта и персонаж"""
+    if not update.effective_user:
+        return "", ""
+    bot = bot_of(context)
+    # Метки не должны ходить на диск: берём только сессию из памяти
+    session = bot.sessions.peek(update.effective_user.id)
+    if session is None:
+        return "", prompts.get(bot.character).name
+    return session.state, bot.character_of(session).name
+
+
+def parse_bots(value: str) -> List[Tuple[str, str]]:
+    """"valera=123:AAA,nyasha=456:BBB" -> [(персонаж, токен), ...]"""
+    bots = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        character, _, token = item.partition("=")
+        bots.append((character.strip(), token.strip()))
+    return bots
+
+
+def parse_promo_messages(data: dict) -> Tuple[str, ...]:
+    """Промо-сообщения из содержимого promo_messages.json"""
+    messages = data.get("messages", [])
+    if not all(isinstance(message, str) for message in messages):
+        raise ValueError("messages должен быть списком строк")
+    return tuple(messages)
+
+
+def load_promo_messages() -> Tuple[str, ...]:
     """Загружает промо-сообщения из файла"""
     try:
-        with open("promo_messages.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("messages", [])
+        with open(bot_file("promo_messages.json"), "r", encoding="utf-8") as f:
+            return parse_promo_messages(json.load(f))
     except Exception as e:
         print(f"Ошибка загрузки promo_messages.json: {e}")
-        return []
+        return ()
 
 
 # Загружаем промо-сообщения при старте
 promo_messages = load_promo_messages()
 
 
+# --- Горячая перезагрузка настроек ---
+# Правки characters.json, promo_messages.json и name_gender_map.json
+# (например, через editor.py) подхватываются без перезапуска. Снимки
+# собираются в потоке и подменяются целиком: запрос, уже взявший
+# персонажа или список промо, доработает со старой версией
+def set_promo_messages(messages: Tuple[str, ...]) -> None:
+    global promo_messages
+    promo_messages = messages
+
+
+def set_name_matcher(matcher: NameMatcher) -> None:
+    global name_matcher
+    name_matcher = matcher
+
+
+config_watcher = ConfigWatcher()
+config_watcher.watch(bot_file("characters.json"), PromptRegistry.compile,
+                     prompts.swap)
+config_watcher.watch(bot_file("promo_messages.json"), parse_promo_messages,
+                     set_promo_messages)
+config_watcher.watch(
+    bot_file("name_gender_map.json"),
+    lambda data: NameMatcher(flatten_name_map(data)),
+    set_name_matcher,
+)
+
+
 def guess_gender_by_name(name: str) -> str:
-    """Определяет пол по имени из словаря"""
-    if not name:
-        return "unknown"
-    
-    # Берём только первое слово (имя без фамилии)
-    first_word = name.strip().split()[0] if name.strip() else ""
-    clean_name = first_word.lower()
-    
-    return name_gender_map.get(clean_name, "unknown")
+    """Определяет пол по имени из словаря (в любом падеже)"""
+    return name_matcher.gender_of(name)
 
 
 def extract_name_from_text(text: str) -> str:
     """Извлекает имя из текста пользователя"""
-    text = text.strip()
-    
-    # Паттерны для поиска имени
-    patterns = [
-        r'меня зовут\s+([А-ЯЁ][а-яё]+)',
-        r'я\s+([А-ЯЁ][а-яё]+)',
-        r'зовут\s+([А-ЯЁ][а-яё]+)',
-        r'\b([А-ЯЁ][а-яё]+)\b'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            name = match.group(1)
-            # Исключаем служебные слова
-            excluded = ['меня', 'зовут', 'тебя', 'как', 'что', 'где', 'когда']
-            if name.lower() not in excluded:
-                return name
-    
-    return ""
+    return name_matcher.extract(text)
 
 
 def detect_gender_from_response(text: str) -> str:
@@ -169,50 +279,36 @@ def detect_gender_from_response(text: str) -> str:
     return "unknown"
 
 
-def build_system_prompt(gender: str) -> str:
-    """Создаёт системный промпт с учётом пола"""
-    if gender == "male":
-        gender_info = "Пол собеседника: мужской."
-    elif gender == "female":
-        gender_info = "Пол собеседника: женский."
-    else:
-        gender_info = "Пол собеседника: неизвестно."
-    
-    # Берём промпт "valera" из characters.json
-    char_config = characters.get("valera", {
-        "prompt": [
-            "Ты Валера, грубый помощник."
-        ]
-    })
-    
-    # Объединяем строки промпта
-    base_prompt = " ".join(char_config["prompt"])
-    
-    return f"{base_prompt}\n{gender_info}"
-
-
 # --- Команды ---
+@metrics.instrument_handler("valera", session_labels)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
     
     user_id = update.effective_user.id
     first_name = update.effective_user.first_name or ""
+    await registry.add_user(user_id, update.effective_user.username)
     
     # Пытаемся определить пол по имени из профиля
     gender = guess_gender_by_name(first_name)
-    user_gender[user_id] = gender
-    user_memory[user_id] = []
-    message_counter[user_id] = 0
+    bot = bot_of(context)
+    session = await bot.sessions.get(user_id)
+    session.gender = gender
+    session.history.clear()
+    session.summary = ""
+    bot.summarizer.cancel(user_id)
+    session.counter = 0
     
     if gender in ["male", "female"]:
-        user_state[user_id] = "determined"
+        session.state = "determined"
     else:
-        user_state[user_id] = "initial"
+        session.state = "initial"
+    bot.sessions.save(session)
     
     await update.message.reply_text("Че надо?")
 
 
+@metrics.instrument_handler("valera", session_labels)
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
@@ -221,23 +317,82 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     first_name = update.effective_user.first_name or ""
     
     # Очищаем память и счетчик
-    user_memory[user_id] = []
-    message_counter[user_id] = 0
+    bot = bot_of(context)
+    session = await bot.sessions.get(user_id)
+    session.history.clear()
+    session.summary = ""
+    bot.summarizer.cancel(user_id)
+    session.counter = 0
     
     # Заново определяем пол по имени из профиля
     gender = guess_gender_by_name(first_name)
-    user_gender[user_id] = gender
+    session.gender = gender
     
     # Устанавливаем правильное состояние
     if gender in ["male", "female"]:
-        user_state[user_id] = "determined"
+        session.state = "determined"
     else:
-        user_state[user_id] = "initial"
+        session.state = "initial"
+    bot.sessions.save(session)
     
     await update.message.reply_text("🔄 Память очищена!\nЧе надо?")
 
 
+@metrics.instrument_handler("valera", session_labels)
+async def character(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/character — список персонажей, /character имя — сменить в этом чате"""
+    if not update.effective_user or not update.message:
+        return
+    
+    user_id = update.effective_user.id
+    bot = bot_of(context)
+    session = await bot.sessions.get(user_id)
+    current = bot.character_of(session).name
+    
+    if not context.args:
+        names = "\n".join(
+            f"{'👉' if name == current else '•'} {name}"
+            for name in prompts.names()
+        )
+        await update.message.reply_text(
+            f"Персонажи:\n{names}\n\nСменить: /character имя"
+        )
+        return
+    
+    name = " ".join(context.args)
+    if name not in prompts:
+        await update.message.reply_text("Нет такого персонажа. Список: /character")
+        return
+    
+    # Новый персонаж начинает разговор с чистого листа
+    session.character = name
+    session.history.clear()
+    session.summary = ""
+    bot.summarizer.cancel(user_id)
+    session.counter = 0
+    bot.sessions.save(session)
+    await update.message.reply_text(f"🎭 Теперь с тобой говорит {name}.")
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or not update.message:
+        return
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    total, today, week = await registry.get_stats()
+    await update.message.reply_text(
+        f"👥 Всего пользователей: {total}\n"
+        f"📅 Новых сегодня: {today}\n"
+        f"🗓 Новых за неделю: {week}\n\n"
+        f"🚦 {chat_scheduler.report()}\n\n"
+        f"🔄 {config_watcher.report()}"
+        + (f"\n\n🧪 {mock_openai.report()}" if mock_openai else "")
+    )
+
+
 # --- Основной обработчик ---
+@metrics.instrument_handler("valera", session_labels)
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
@@ -248,57 +403,68 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     text = text.strip()
     
-    # Инициализация если пользователь новый
-    if user_id not in user_state:
-        user_state[user_id] = "initial"
-        user_gender[user_id] = "unknown"
-        user_memory[user_id] = []
-    
-    state = user_state[user_id]
-    gender = user_gender[user_id]
+    # Новый пользователь получает сессию в состоянии "initial"
+    bot = bot_of(context)
+    with tracing.span("state_lookup") as span:
+        session = await bot.sessions.get(user_id)
+        span.set("session.state", session.state)
+    try:
+        await handle_state(update, session, text, bot)
+    finally:
+        # Изменения сессии попадут на диск при следующем flush
+        bot.sessions.save(session)
+
+
+async def handle_state(update: Update, session: Session, text: str,
+                       bot: ValeraBot = default_bot):
+    """Ведёт диалог по состояниям: знакомство, выяснение пола, общение"""
+    state = session.state
+    gender = session.gender
     
     # Логика по состояниям
     if state == "initial":
         # Первое сообщение
-        user_memory[user_id].append({"role": "user", "content": text})
-        response_text = await generate_response(user_id, text)
-        await update.message.reply_text(response_text)
-        user_state[user_id] = "waiting_name"
+        session.history.append(make_message("user", text))
+        reply = StreamingReply(update.message)
+        response_text = await generate_response(session, text, reply, bot)
+        await reply.finish(response_text)
+        session.state = "waiting_name"
         
     elif state == "waiting_name":
         # Второе сообщение - спрашиваем имя
-        user_memory[user_id].append({"role": "user", "content": text})
-        response_text = await generate_response(user_id, text)
+        session.history.append(make_message("user", text))
+        reply = StreamingReply(update.message)
+        response_text = await generate_response(session, text, reply, bot)
         
         # Добавляем вопрос об имени
         full_response = (
             f"{response_text}\n\n"
             "Кстати, я Валера. А тебя как звать?"
         )
-        await update.message.reply_text(full_response)
-        user_state[user_id] = "analyzing_name"
+        await reply.finish(full_response)
+        session.state = "analyzing_name"
         
     elif state == "analyzing_name":
         # Анализируем ответ на вопрос об имени
-        user_memory[user_id].append({"role": "user", "content": text})
+        session.history.append(make_message("user", text))
         
         extracted_name = extract_name_from_text(text)
         if extracted_name:
             gender = guess_gender_by_name(extracted_name)
-            user_gender[user_id] = gender
+            session.gender = gender
             
             if gender in ["male", "female"]:
-                user_state[user_id] = "determined"
+                session.state = "determined"
                 await update.message.reply_text("Ок, понял.")
                 return
             else:
-                user_state[user_id] = "waiting_gender"
+                session.state = "waiting_gender"
                 await update.message.reply_text(
                     "Не понял. Это ты мальчик, или девочка?"
                 )
                 return
         else:
-            user_state[user_id] = "waiting_gender"
+            session.state = "waiting_gender"
             await update.message.reply_text(
                 "Не понял. Это ты мальчик, или девочка?"
             )
@@ -309,81 +475,179 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         detected_gender = detect_gender_from_response(text)
         
         if detected_gender in ["male", "female"]:
-            user_gender[user_id] = detected_gender
-            user_state[user_id] = "determined"
+            session.gender = detected_gender
+            session.state = "determined"
             await update.message.reply_text("Ок, понял.")
             return
         else:
-            user_gender[user_id] = "unknown"
-            user_state[user_id] = "determined"
+            session.gender = "unknown"
+            session.state = "determined"
             await update.message.reply_text("Ладно, фиг с тобой.")
             return
     
     elif state == "determined":
         # Обычное общение
-        user_memory[user_id].append({"role": "user", "content": text})
-        response_text = await generate_response(user_id, text)
-        await update.message.reply_text(response_text)
-
-
-async def generate_response(user_id: int, text: str) -> str:
-    """Генерирует ответ с учётом пола пользователя"""
-    gender = user_gender.get(user_id, "unknown")
+        session.history.append(make_message("user", text))
+        reply = StreamingReply(update.message)
+        response_text = await generate_response(session, text, reply, bot)
+        await reply.finish(response_text)
+
+
+@metrics.timed("valera")
+async def generate_response(session: Session, text: str,
+                            reply: Optional[StreamingReply] = None,
+                            bot: ValeraBot = default_bot) -> str:
+    """Генерирует ответ с учётом пола пользователя.
+
+    Если включён STREAM_REPLIES, токены по мере генерации показываются
+    через reply, а окончательный текст всё равно возвращается.
+    """
+    gender = session.gender
     
     # Обновляем счетчик сообщений
-    message_counter[user_id] = message_counter.get(user_id, 0) + 1
-    
-    # Получаем конфигурацию персонажа
-    char_config = characters.get("valera", {
-        "model": "gpt-4o",
-        "temperature": 0.9
-    })
+    session.counter += 1
     
-    # Формируем системный промпт
-    system_prompt = build_system_prompt(gender)
-    
-    # История сообщений
-    history = user_memory.get(user_id, [])
-    messages = [
-        {"role": "system", "content": system_prompt},
-        *history[-15:],
-        {"role": "user", "content": text}
-    ]
+    with tracing.span("prompt_build") as span:
+        # Персонаж и готовый промпт под пол собеседника (токены уже посчитаны)
+        character = bot.character_of(session)
+        system_prompt = character.prompt(gender)
+        
+        # История сообщений: самые свежие, сколько влезает в бюджет
+        # персонажа. Текущий вопрос уже лежит последним в session.history
+        messages: List[ChatMessage] = build_context(
+            system_prompt.text, session.history, character.context_tokens,
+            system_tokens=system_prompt.tokens, summary=session.summary
+        )
+        span.set("character", character.name)
+        span.set("prompt.messages", len(messages))
+    # Сообщения истории, не влезшие в контекст, уйдут в резюме
+    head = 2 if session.summary else 1
+    evicted = len(session.history) - (len(messages) - head)
     
     # Запрос к OpenAI
     try:
-        response = openai.chat.completions.create(
-            model=char_config["model"],
-            messages=messages,
-            temperature=char_config["temperature"]
-        )
-        if not response.choices[0].message.content:
+        if reply is not None and STREAM_REPLIES:
+            content = await chat_scheduler.run(
+                stream_chat_completion,
+                reply,
+                model=character.model,
+                messages=messages,
+                temperature=character.temperature
+            )
+        else:
+            response = await chat_scheduler.run(
+                get_async_client().chat.completions.create,
+                model=character.model,
+                messages=messages,
+                temperature=character.temperature
+            )
+            content = response.choices[0].message.content
+        if not content:
             return "Чет у меня глюк. Попробуй еще раз."
         
-        reply = response.choices[0].message.content.strip()
+        answer = content.strip()
         
         # Добавляем в память
-        user_memory[user_id].append({"role": "assistant", "content": reply})
+        session.history.append(make_message("assistant", answer))
+        bot.summarizer.maybe_schedule(session, evicted)
         
         # Проверяем, нужно ли добавить промо-сообщение
-        if (message_counter[user_id] % random.randint(10, 15) == 0 and 
+        if (session.counter % random.randint(10, 15) == 0 and 
                 promo_messages):
             promo = random.choice(promo_messages)
-            reply = f"{reply}\n\n{promo}"
+            answer = f"{answer}\n\n{promo}"
         
-        return reply
-    except Exception:
+        return answer
+    except (RateLimitError, SchedulerBusy):
+        # Планировщик уже повторял запрос: OpenAI перегружен
+        return "Слишком много желающих поболтать. Напиши через минутку."
+    except Exception as e:
+        print(f"Ошибка генерации ответа: {e}")
         return "Чет у меня глюк. Попробуй еще раз."
 
 
 # --- Запуск ---
-def main():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+# Задачи, общие для всех ботов процесса: запускает первый бот,
+# останавливает последний
+_running_bots = 0
+_shared_tasks: List[asyncio.Task] = []
+
+
+async def on_startup(app):
+    global _running_bots
+    bot = bot_of(app)
+    app.bot_data["flusher"] = asyncio.create_task(bot.sessions.run_flusher())
+    if _running_bots == 0:
+        _shared_tasks[:] = [
+            asyncio.create_task(registry.run_writer()),
+            asyncio.create_task(config_watcher.run()),
+        ]
+        hold_async_client()
+        await metrics.start_server()
+        tracing.exporter.start()
+    _running_bots += 1
+
+
+async def on_shutdown(app):
+    global _running_bots
+    bot = bot_of(app)
+    app.bot_data["flusher"].cancel()
+    await bot.summarizer.close()
+    await bot.sessions.close()
+    _running_bots -= 1
+    if _running_bots == 0:
+        for task in _shared_tasks:
+            task.cancel()
+        # Дожидаемся отмены, чтобы цикл не закрылся с живыми задачами
+        await asyncio.gather(*_shared_tasks, return_exceptions=True)
+        await registry.close()
+        await close_async_client()
+        await metrics.stop_server()
+        await tracing.exporter.stop()
+
+
+def build_application(token: str = TELEGRAM_TOKEN,
+                      bot: ValeraBot = default_bot) -> Application:
+    app = (
+        application_builder(token, CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    app.bot_data["valera"] = bot
+    metrics.ACTIVE_SESSIONS.track(("valera", bot.character),
+                                  bot.sessions.__len__)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("reset", reset))
+    app.add_handler(CommandHandler("character", character))
+    app.add_handler(CommandHandler("stats", stats))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, 
                                   handle_message))
-    app.run_polling()
+    return app
+
+
+def main():
+    # Режим (polling или webhook) задаётся через .env, см. common/telegram_app.py
+    shard = os.getenv(SHARD_INDEX_ENV)
+    if shard is not None:
+        # Процесс-воркер шардированного режима: апдейты приходят от диспетчера
+        run_shard_worker(build_application(), default_bot.sessions, int(shard))
+        return
+    bots = parse_bots(VALERA_BOTS)
+    if not bots:
+        if SHARD_WORKERS > 1:
+            run_sharded(TELEGRAM_TOKEN,
+                        [sys.executable, os.path.abspath(__file__)])
+        else:
+            run_application(build_application())
+        return
+    # Один процесс на несколько ботов: у каждого своя база сессий
+    apps = []
+    for name, token in bots:
+        bot_id = token.split(":")[0]
+        store = create_store(f"conversations_{bot_id}.db")
+        apps.append(build_application(token, ValeraBot(name, store)))
+    run_applications(apps)
 
 
 if __name__ == "__main__":
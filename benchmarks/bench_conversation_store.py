@@ -0,0 +1,68 @@
+"""Память и скорость ConversationStore при росте числа пользователей.
+
+Каждый виртуальный пользователь пишет несколько сообщений; сессии
+проходят через LRU-кэш и пачками сбрасываются в SQLite. Бенчмарк печатает
+объём памяти Python (tracemalloc) после каждой ступени — при SQLite-бэкенде
+он должен оставаться примерно постоянным. Скорость записи занижена:
+tracemalloc сам заметно замедляет Python.
+
+    python benchmarks/bench_conversation_store.py --users 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from common.conversation_store import (  # noqa: E402
+    ConversationStore, MemoryBackend, SQLiteBackend
+)
+
+
+async def run(store: ConversationStore, users: int, messages: int,
+              step: int) -> None:
+    print(f"{'users':>8} {'mem MB':>8} {'cached':>7} {'writes/s':>9}")
+    started = time.perf_counter()
+    written = 0
+    for user_id in range(1, users + 1):
+        session = await store.get(user_id)
+        for i in range(messages):
+            session.history.append(
+                {"role": "user", "content": f"Сообщение {i} от {user_id}"}
+            )
+        session.counter += messages
+        store.save(session)
+        if user_id % 1000 == 0:
+            written += await store.flush()
+        if user_id % step == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            rate = written / (time.perf_counter() - started)
+            print(f"{user_id:>8} {current / 2**20:>8.1f} {len(store):>7} "
+                  f"{rate:>9.0f}")
+    await store.close()
+
+
+def main(args) -> None:
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.backend == "sqlite":
+            backend = SQLiteBackend(os.path.join(tmp, "conversations.db"))
+        else:
+            backend = MemoryBackend()
+        store = ConversationStore(backend, cache_size=args.cache_size)
+        asyncio.run(run(store, args.users, args.messages, args.step))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    parser.add_argument("--step", type=int, default=25_000)
+    parser.add_argument("--backend", choices=["sqlite", "memory"],
+                        default="sqlite")
+    main(parser.parse_args())
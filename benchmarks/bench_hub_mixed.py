@@ -0,0 +1,110 @@
+"""Смешанная нагрузка на GPT_hub_bot: текст, картинки и нажатия кнопок.
+
+Виртуальные пользователи шлют сообщения в текстовых режимах, заказывают
+картинки и жмут кнопки меню. Бенчмарк печатает p50/p99 латентности по
+каждому режиму, чтобы было видно, что медленные картинки не тормозят
+текстовые ответы и меню.
+
+    python benchmarks/bench_hub_mixed.py --users 200 --image-share 0.2
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+from benchmarks.tg_stubs import (  # noqa: E402
+    FakeCallbackUpdate, FakeUpdate, fake_context
+)
+
+TEXT_MODES = ["write", "explain", "learn", "advise", "automate", "entertain"]
+
+
+def load_hub():
+    """Импортирует bot.py хаба из его каталога"""
+    path = os.path.join(ROOT, "GPT_hub_bot")
+    # Бенчмарки меряют пропускную способность, а не тарифы
+    os.environ.setdefault("DEFAULT_TARIFF", "")
+    os.environ.setdefault(
+        "QUOTAS_DB", os.path.join(tempfile.mkdtemp(), "quotas.db")
+    )
+    os.chdir(path)
+    sys.path.insert(0, path)
+    return importlib.import_module("bot")
+
+
+async def virtual_user(hub, user_id: int, requests: int, image_share: float,
+                       latencies) -> None:
+    context = fake_context()
+    rnd = random.Random(user_id)
+    for i in range(requests):
+        roll = rnd.random()
+        if roll < image_share:
+            mode = "draw"
+        elif roll < image_share + 0.2:
+            mode = "button"
+        else:
+            mode = rnd.choice(TEXT_MODES)
+
+        started = time.perf_counter()
+        if mode == "button":
+            await hub.button_handler(
+                FakeCallbackUpdate(user_id, rnd.choice(TEXT_MODES)), context
+            )
+            latencies["button"].append(time.perf_counter() - started)
+            continue
+        context.user_data["mode"] = mode
+        await hub.handle_message(
+            FakeUpdate(user_id, f"Запрос {i} в режиме {mode}"), context
+        )
+        kind = "image" if mode == "draw" else "text"
+        latencies[kind].append(time.perf_counter() - started)
+
+
+async def main(args) -> None:
+    fake = FakeOpenAI(latency=args.text_latency,
+                      image_latency=args.image_latency)
+    await fake.start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    hub = load_hub()
+
+    latencies = defaultdict(list)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        virtual_user(hub, 1000 + i, args.requests, args.image_share,
+                     latencies)
+        for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.users} пользователей, {total} запросов за {elapsed:.1f} с "
+          f"(IMAGE_CONCURRENCY={hub.IMAGE_CONCURRENCY}, "
+          f"TEXT_CONCURRENCY={hub.TEXT_CONCURRENCY})")
+    print(f"{'mode':>7} {'count':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in ("text", "image", "button"):
+        stats = summarize(latencies[mode])
+        print(f"{mode:>7} {stats['count']:>6} {stats['p50_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f}")
+
+    await hub.close_async_client()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--image-share", type=float, default=0.2)
+    parser.add_argument("--text-latency", type=float, default=0.5)
+    parser.add_argument("--image-latency", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""Память и время запуска: по процессу на бота против launcher.py.
+
+Все боты ходят в фейковый Bot API (fake_telegram.py). Бот считается
+запущенным, когда начал опрашивать getUpdates. Память — VmRSS процессов
+из /proc, поэтому бенчмарк работает только на Linux.
+
+    python benchmarks/bench_launcher.py
+    python benchmarks/bench_launcher.py --bots GPT_hub_bot,Valera_test_4.1_nano
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+from benchmarks.stats import rss_mb  # noqa: E402
+
+DEFAULT_BOTS = ("GPT_hub_bot,Valera_test_4.1_nano,Valera_telegrambot,"
+                "Valera_test_4.1_nano:nyasha")
+
+
+async def launch(groups: List[List[Tuple[str, str]]], telegram: FakeTelegram,
+                 env: dict, timeout: float) -> Tuple[float, float, int]:
+    """Запускает по процессу launcher.py на группу ботов.
+
+    Возвращает время до опроса getUpdates всеми ботами, суммарный RSS
+    и число процессов, завершившихся с ошибкой.
+    """
+    telegram.polling.clear()
+    tokens = {token for group in groups for _, token in group}
+    started = time.perf_counter()
+    procs = []
+    for group in groups:
+        bots = ",".join(f"{key}={token}" for key, token in group)
+        procs.append(await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "launcher.py"),
+            env=dict(env, BOTS=bots), cwd=env["BENCH_DIR"],
+            stdout=asyncio.subprocess.DEVNULL,
+        ))
+    while not tokens <= telegram.polling:
+        if time.perf_counter() - started > timeout:
+            raise SystemExit("Боты не запустились за отведённое время")
+        await asyncio.sleep(0.02)
+    startup = time.perf_counter() - started
+    # Даём догрузиться фоновым задачам, потом меряем
+    await asyncio.sleep(1)
+    rss = sum(rss_mb(proc.pid) for proc in procs)
+    for proc in procs:
+        proc.send_signal(signal.SIGTERM)
+    failed = sum(1 for code in await asyncio.gather(
+        *(proc.wait() for proc in procs)) if code != 0)
+    return startup, rss, failed
+
+
+async def main(args) -> None:
+    telegram = FakeTelegram()
+    await telegram.start()
+    workdir = tempfile.mkdtemp(prefix="bench_launcher_")
+    env = dict(
+        os.environ,
+        BENCH_DIR=workdir,
+        TELEGRAM_API_URL=telegram.url,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-bench"),
+        BOT_MODE="polling",
+        CONVERSATION_STORE="memory",
+        USERS_DB=os.path.join(workdir, "users.db"),
+        QUOTAS_DB=os.path.join(workdir, "quotas.db"),
+        RESPONSE_CACHE_DB="",
+        VALERA_BOTS="",
+    )
+    bots = [(key, f"{1000 + i}:bench")
+            for i, key in enumerate(args.bots.split(","))]
+
+    print(f"Ботов: {len(bots)}")
+    print(f"{'':<22} {'старт, с':>9} {'RSS, МБ':>9} {'ошибок':>7}")
+    separate = await launch([[bot] for bot in bots], telegram, env,
+                            args.timeout)
+    print(f"{'процесс на бота':<22} {separate[0]:>9.2f} {separate[1]:>9.0f} "
+          f"{separate[2]:>7}")
+    together = await launch([bots], telegram, env, args.timeout)
+    print(f"{'launcher.py':<22} {together[0]:>9.2f} {together[1]:>9.0f} "
+          f"{together[2]:>7}")
+    print(f"Экономия памяти: {separate[1] - together[1]:.0f} МБ "
+          f"({1 - together[1] / separate[1]:.0%})")
+    await telegram.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", default=DEFAULT_BOTS,
+                        help="каталоги ботов через запятую, как в BOTS")
+    parser.add_argument("--timeout", type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
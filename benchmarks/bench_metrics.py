@@ -0,0 +1,86 @@
+"""Цена записи метрик на горячем пути и отрисовки /metrics.
+
+Меряет наносекунды на одну запись: счётчик, гистограмму, таймер
+обработчика и обёртку instrument_handler вокруг пустой корутины (против
+той же корутины без обёртки). Отдельно — время render() при большом
+числе серий, как после долгой работы нескольких ботов.
+
+    python benchmarks/bench_metrics.py --n 200000 --series 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from common.metrics import (  # noqa: E402
+    HandlerTimer, Registry, instrument_handler
+)
+
+
+def per_call_ns(fn, n: int) -> float:
+    started = time.perf_counter()
+    fn(n)
+    return (time.perf_counter() - started) / n * 1e9
+
+
+async def per_await_ns(coro_fn, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        await coro_fn(None, None)
+    return (time.perf_counter() - started) / n * 1e9
+
+
+async def main(args) -> None:
+    registry = Registry()
+    counter = registry.counter("bench_total", "", ("bot", "type"))
+    histogram = registry.histogram("bench_seconds", "", ("bot", "mode"))
+    labels = ("valera", "determined")
+
+    def inc(n):
+        for _ in range(n):
+            counter.inc(labels)
+
+    def observe(n):
+        for i in range(n):
+            histogram.observe(i * 1e-6, labels)
+
+    def timer(n):
+        for _ in range(n):
+            with HandlerTimer("valera", "handle_message", "determined",
+                              "valera"):
+                pass
+
+    async def handler(update, context):
+        return None
+
+    wrapped = instrument_handler(
+        "valera", lambda update, context: ("determined", "valera")
+    )(handler)
+
+    print(f"Записей: {args.n}")
+    print(f"  Counter.inc            {per_call_ns(inc, args.n):>8.0f} нс")
+    print(f"  Histogram.observe      {per_call_ns(observe, args.n):>8.0f} нс")
+    print(f"  HandlerTimer           {per_call_ns(timer, args.n):>8.0f} нс")
+    bare = await per_await_ns(handler, args.n)
+    instrumented = await per_await_ns(wrapped, args.n)
+    print(f"  instrument_handler     {instrumented - bare:>8.0f} нс "
+          f"сверх пустого обработчика")
+
+    for i in range(args.series):
+        histogram.observe(0.1, (f"bot{i % 4}", f"mode{i}"))
+        counter.inc((f"bot{i % 4}", f"type{i}"))
+    started = time.perf_counter()
+    text = registry.render()
+    elapsed = time.perf_counter() - started
+    print(f"render(): {args.series} серий, {len(text.splitlines())} строк, "
+          f"{len(text) / 1024:.0f} КБ за {elapsed * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--series", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
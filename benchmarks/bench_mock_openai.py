@@ -0,0 +1,108 @@
+"""Собственные накладные расходы Валеры с mock_mode вместо OpenAI.
+
+Прогоняет пользователей через handle_message с разными бэкендами модели:
+фейковый HTTP-сервер OpenAI и MockOpenAI внутри процесса с нулевой
+задержкой, нормальным распределением задержки и инъекцией 429/таймаутов.
+CPU на ответ при нулевой задержке — это цена самого бота: обработчик,
+сборка контекста, планировщик и разбор ответа SDK.
+
+    python benchmarks/bench_mock_openai.py --users 200 --messages 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.bench_valera_async import load_valera  # noqa: E402
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+from benchmarks.tg_stubs import FakeUpdate, fake_context  # noqa: E402
+from common.mock_openai import LatencyModel, MockOpenAI  # noqa: E402
+from common.openai_client import close_async_client, use_transport  # noqa: E402
+from common.openai_scheduler import chat_scheduler  # noqa: E402
+
+ERROR_REPLIES = {
+    "Слишком много желающих поболтать. Напиши через минутку.",
+    "Чет у меня глюк. Попробуй еще раз.",
+}
+
+
+async def run_user(valera, user_id: int, messages: int,
+                   latencies: List[float]) -> List[str]:
+    context = fake_context()
+    await valera.start(FakeUpdate(user_id, "/start", "Сергей"), context)
+    texts = []
+    for i in range(messages):
+        update = FakeUpdate(user_id, f"Валера, вопрос номер {i}")
+        started = time.perf_counter()
+        await valera.handle_message(update, context)
+        latencies.append(time.perf_counter() - started)
+        texts += [reply.get("text", "") for reply in update.replies]
+    return texts
+
+
+async def run_scenario(valera, name: str, transport, args,
+                       base_id: int) -> None:
+    await close_async_client()
+    use_transport(transport)
+    retries = chat_scheduler.retries
+    latencies: List[float] = []
+    cpu, wall = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(
+        run_user(valera, base_id + i, args.messages, latencies)
+        for i in range(args.users)
+    ))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    texts = [text for result in results for text in result]
+    errors = sum(text in ERROR_REPLIES for text in texts)
+    stats = summarize(latencies)
+    print(f"{name:<28} {len(texts) / wall:>9.0f} "
+          f"{cpu / len(texts) * 1e6:>9.0f} {stats['p50_ms']:>8.0f} "
+          f"{stats['p99_ms']:>8.0f} {errors:>7} "
+          f"{chat_scheduler.retries - retries:>7}")
+
+
+async def main(args) -> None:
+    fake = FakeOpenAI(latency=0)
+    await fake.start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["MOCK_MODE"] = "0"
+    os.environ["STREAM_REPLIES"] = "0"
+    valera = load_valera(args.bot)
+
+    print(f"Пользователей: {args.users}, сообщений у каждого: "
+          f"{args.messages}")
+    print(f"{'бэкенд':<28} {'ответов/с':>9} {'CPU мкс':>9} {'p50 мс':>8} "
+          f"{'p99 мс':>8} {'ошибок':>7} {'повторов':>7}")
+    scenarios = [
+        ("фейковый сервер, 0 мс", None),
+        ("mock, 0 мс", MockOpenAI(LatencyModel("fixed", 0.0))),
+        (f"mock, normal {args.latency}±{args.latency / 3:.2f} с",
+         MockOpenAI(LatencyModel("normal", args.latency, args.latency / 3))),
+        # Ошибки последними: после 429 планировщик снижает лимит
+        (f"mock, 429 {args.rate_limit:.0%}, таймаут {args.timeout:.0%}",
+         MockOpenAI(LatencyModel("fixed", 0.0), rate_limit=args.rate_limit,
+                    timeout=args.timeout, timeout_after=0.5)),
+    ]
+    for level, (name, transport) in enumerate(scenarios):
+        await run_scenario(valera, name, transport, args,
+                           base_id=(level + 1) * 1_000_000)
+
+    await close_async_client()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bot", default="Valera_test_4.1_nano")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--rate-limit", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=0.01)
+    asyncio.run(main(parser.parse_args()))
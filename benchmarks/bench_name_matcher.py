@@ -0,0 +1,139 @@
+"""Поиск имени и пола в сообщениях: старые функции Валеры против NameMatcher.
+
+Корпус — типичные ответы на «А тебя как звать?» вперемешку с обычными
+репликами чата, имена берутся из name_gender_map.json в разных падежах.
+Печатается число сообщений в секунду и доля ответов, где пол определился.
+
+    python benchmarks/bench_name_matcher.py --messages 50000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from common.name_matcher import (  # noqa: E402
+    NameMatcher, flatten_name_map, inflect
+)
+
+INTRO_TEMPLATES = [
+    "{name}", "я {name}", "меня зовут {name}", "Меня зовут {name}, а что?",
+    "ну {name}", "это {name}", "зови меня {instrumental}",
+    "друзья зовут {instrumental}", "все зовут меня {instrumental}",
+    "{name}, а тебе зачем?", "Привет, Валера! Я {name}",
+    "пиши {dative}, не ошибёшься",
+]
+CHAT_LINES = [
+    "привет, как дела?", "что ты умеешь вообще", "скучно мне сегодня",
+    "расскажи анекдот про программистов", "ты кто такой?",
+    "почему небо голубое", "я устал после работы", "не скажу",
+    "а ты сам как думаешь?", "погода сегодня ужасная, дождь весь день",
+    "Да мне без разницы, спрашивай что хочешь",
+]
+
+
+def legacy_name_map(raw_map) -> dict:
+    """Как load_name_gender_map до NameMatcher"""
+    name_map = {}
+    for section in ("// МУЖСКИЕ ИМЕНА", "// ЖЕНСКИЕ ИМЕНА",
+                    "// ИМЕНА, КОТОРЫЕ МОГУТ БЫТЬ И МУЖСКИМИ И ЖЕНСКИМИ"):
+        for full_name, variations in raw_map.get(section, {}).items():
+            for name, gender in variations.items():
+                name_map[name.lower()] = gender
+    return name_map
+
+
+def legacy_guess_gender(name_map: dict, name: str) -> str:
+    """Копия guess_gender_by_name до NameMatcher"""
+    if not name:
+        return "unknown"
+    first_word = name.strip().split()[0] if name.strip() else ""
+    return name_map.get(first_word.lower(), "unknown")
+
+
+def legacy_extract_name(text: str) -> str:
+    """Копия extract_name_from_text до NameMatcher"""
+    text = text.strip()
+    patterns = [
+        r'меня зовут\s+([А-ЯЁ][а-яё]+)',
+        r'я\s+([А-ЯЁ][а-яё]+)',
+        r'зовут\s+([А-ЯЁ][а-яё]+)',
+        r'\b([А-ЯЁ][а-яё]+)\b'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            name = match.group(1)
+            excluded = ['меня', 'зовут', 'тебя', 'как', 'что', 'где', 'когда']
+            if name.lower() not in excluded:
+                return name
+    return ""
+
+
+def make_corpus(name_map: dict, size: int, intro_share: float):
+    """[(сообщение, ожидаемый пол или None для обычных реплик)]"""
+    names = [(name, gender) for name, gender in name_map.items()
+             if gender in ("male", "female")]
+    corpus = []
+    for _ in range(size):
+        if random.random() >= intro_share:
+            corpus.append((random.choice(CHAT_LINES), None))
+            continue
+        name, gender = random.choice(names)
+        forms = sorted(inflect(name, gender)) or [name]
+        name = name.capitalize()
+        template = random.choice(INTRO_TEMPLATES)
+        text = template.format(
+            name=name,
+            # Угадывать конкретный падеж не нужно: любая форма годится
+            instrumental=random.choice(forms).capitalize(),
+            dative=random.choice(forms).capitalize(),
+        )
+        corpus.append((text, gender))
+    return corpus
+
+
+def run(label: str, detect, corpus) -> None:
+    started = time.perf_counter()
+    results = [detect(text) for text, _ in corpus]
+    elapsed = time.perf_counter() - started
+    intros = [(result, gender) for result, (_, gender)
+              in zip(results, corpus) if gender is not None]
+    hits = sum(1 for result, gender in intros if result == gender)
+    print(f"{label:>12} {len(corpus) / elapsed:>12,.0f} "
+          f"{hits / max(1, len(intros)):>9.1%}")
+
+
+def main(args) -> None:
+    random.seed(args.seed)
+    path = os.path.join(ROOT, args.bot_dir, "name_gender_map.json")
+    with open(path, encoding="utf-8") as f:
+        raw_map = json.load(f)
+
+    legacy_map = legacy_name_map(raw_map)
+    started = time.perf_counter()
+    matcher = NameMatcher(flatten_name_map(raw_map))
+    build_ms = (time.perf_counter() - started) * 1000
+    corpus = make_corpus(legacy_map, args.messages, args.intro_share)
+
+    print(f"{args.messages} сообщений, словарь {len(legacy_map)} вариантов, "
+          f"с падежами {len(matcher)} (сборка {build_ms:.0f} мс)")
+    print(f"{'engine':>12} {'messages/s':>12} {'gender ok':>9}")
+    run("legacy", lambda text: legacy_guess_gender(
+        legacy_map, legacy_extract_name(text)), corpus)
+    run("NameMatcher",
+        lambda text: matcher.gender_of(matcher.extract(text)), corpus)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--intro-share", type=float, default=0.5,
+                        help="доля ответов с именем")
+    parser.add_argument("--bot-dir", default="Valera_test_4.1_nano")
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
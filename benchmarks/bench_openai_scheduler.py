@@ -0,0 +1,93 @@
+"""Всплеск запросов к OpenAI с ограниченной ёмкостью: без планировщика и с ним.
+
+Фейковый OpenAI обслуживает не больше --capacity запросов одновременно
+и отвечает 429 на остальные. Без планировщика всплеск из --requests
+запросов получает волну 429, которые пользователь видит как ошибку.
+С планировщиком лимит одновременных запросов подстраивается (AIMD), а
+отклонённые запросы повторяются с задержкой.
+
+    python benchmarks/bench_openai_scheduler.py --requests 500 --capacity 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+from common.openai_client import get_async_client  # noqa: E402
+from common.openai_scheduler import (  # noqa: E402
+    PRIORITY_NORMAL, PRIORITY_PAID, OpenAIScheduler
+)
+
+
+async def ask(scheduler, priority: int):
+    create = get_async_client().chat.completions.create
+    kwargs = dict(model="gpt-4.1-nano",
+                  messages=[{"role": "user", "content": "Привет"}])
+    if scheduler is None:
+        return await create(**kwargs)
+    return await scheduler.run(create, priority=priority, **kwargs)
+
+
+async def burst(scheduler, requests: int, paid_share: float):
+    latencies = {PRIORITY_PAID: [], PRIORITY_NORMAL: []}
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        priority = (PRIORITY_PAID if i < requests * paid_share
+                    else PRIORITY_NORMAL)
+        started = time.perf_counter()
+        try:
+            await ask(scheduler, priority)
+        except Exception:
+            errors += 1
+            return
+        latencies[priority].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # Платные запросы приходят последними, чтобы было видно обгон
+    await asyncio.gather(*(one(i) for i in reversed(range(requests))))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def main(args) -> None:
+    fake = FakeOpenAI(latency=args.latency, capacity=args.capacity)
+    await fake.start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+    print(f"{args.requests} запросов, ёмкость сервера {args.capacity}, "
+          f"задержка {args.latency:.2f} с")
+    print(f"{'mode':>10} {'errors':>7} {'429':>6} {'total s':>8} "
+          f"{'paid p50':>9} {'free p50':>9} {'free p99':>9}")
+    for name in ("direct", "scheduler"):
+        scheduler = (OpenAIScheduler("bench", limit=args.initial_limit)
+                     if name == "scheduler" else None)
+        rejected = fake.rejected
+        latencies, errors, total = await burst(scheduler, args.requests,
+                                               args.paid_share)
+        paid = summarize(latencies[PRIORITY_PAID])
+        free = summarize(latencies[PRIORITY_NORMAL])
+        print(f"{name:>10} {errors:>7} {fake.rejected - rejected:>6} "
+              f"{total:>8.1f} {paid['p50_ms']:>9.0f} {free['p50_ms']:>9.0f} "
+              f"{free['p99_ms']:>9.0f}")
+        if scheduler is not None:
+            print()
+            print(scheduler.report())
+
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--capacity", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--initial-limit", type=int, default=64)
+    parser.add_argument("--paid-share", type=float, default=0.1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""Сколько запросов к модели и времени экономит кэш ответов хаба.
+
+Пользователи задают вопросы в режиме «объяснять» из общего пула: частые
+вопросы повторяются (распределение Ципфа), с разным регистром и
+знаками, а часть — перефразами друг друга, которые ловит семантический
+кэш. Прогон идёт дважды — режим в RESPONSE_CACHE_MODES и без него.
+
+    python benchmarks/bench_response_cache.py --users 200 --questions 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.bench_hub_mixed import load_hub  # noqa: E402
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+from benchmarks.tg_stubs import FakeUpdate, fake_context  # noqa: E402
+
+TOPICS = ["ипотека", "биткойн", "инфляция", "налоговый вычет", "гормоны",
+          "квантовый компьютер", "облигации", "нейросеть", "ипотечные каникулы",
+          "кредитная история"]
+
+
+def make_questions(count: int):
+    forms = ["что такое {}", "{} это", "объясни {}", "как работает {}"]
+    return [forms[i % len(forms)].format(TOPICS[i % len(TOPICS)])
+            + ("" if i < len(TOPICS) * len(forms) else f" {i}")
+            for i in range(count)]
+
+
+def spoil(text: str, rnd: random.Random) -> str:
+    """Тот же вопрос, как его напечатал бы живой человек"""
+    if rnd.random() < 0.5:
+        text = text.capitalize()
+    return text + rnd.choice(["", "?", "??", " ?", "!"])
+
+
+async def run(hub, users: int, requests: int, questions, cached: bool):
+    hub.CACHED_MODES.clear()
+    if cached:
+        hub.CACHED_MODES.add("explain")
+    weights = [1 / (rank + 1) for rank in range(len(questions))]
+    latencies = []
+
+    async def user(user_id: int):
+        rnd = random.Random(user_id)
+        context = fake_context({"mode": "explain"})
+        for _ in range(requests):
+            question = spoil(rnd.choices(questions, weights)[0], rnd)
+            started = time.perf_counter()
+            await hub.handle_message(FakeUpdate(user_id, question), context)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(user(10_000 + i) for i in range(users)))
+    return latencies
+
+
+async def main(args) -> None:
+    fake = FakeOpenAI(latency=args.latency)
+    await fake.start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    hub = load_hub()
+    questions = make_questions(args.questions)
+
+    print(f"{'cache':>6} {'openai':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for cached in (False, True):
+        before = fake.requests
+        latencies = await run(hub, args.users, args.requests, questions,
+                              cached)
+        stats = summarize(latencies)
+        print(f"{'on' if cached else 'off':>6} {fake.requests - before:>7} "
+              f"{stats['p50_ms']:>8.0f} {stats['p99_ms']:>8.0f}")
+    print()
+    print(hub.response_cache.report())
+    print(hub.semantic_cache.report())
+
+    await hub.close_async_client()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""Пропускная способность Валеры в шардированном режиме: 1…8 воркеров.
+
+Бот запускается целиком (`SHARD_WORKERS=N python main.py`) против
+фейкового Bot API в этом процессе и фейкового OpenAI в отдельном. Пачка
+апдейтов от многих пользователей кладётся в getUpdates разом; меряется
+время, пока на каждый не придёт ответ. С --kill посреди прогона
+убивается один воркер: видно, сколько ответов потерялось и как быстро
+его пользователи переехали к соседям и вернулись обратно.
+
+Прирост возможен только при свободных ядрах: на одноядерной машине
+воркеры делят одно ядро с фейковыми серверами.
+
+    python benchmarks/bench_sharding.py --workers 1,2,4,8 --users 500
+    python benchmarks/bench_sharding.py --workers 4 --kill
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+from benchmarks.replay_updates import (  # noqa: E402
+    chat_id_of, synthetic_updates
+)
+from benchmarks.stats import summarize  # noqa: E402
+
+BOT = os.path.join(ROOT, "Valera_test_4.1_nano", "main.py")
+TOKEN = "123456:bench"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+async def wait_for(predicate, timeout: float, what: str) -> None:
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"Не дождались: {what}")
+        await asyncio.sleep(0.05)
+
+
+async def run(workers: int, args, openai_url: str) -> dict:
+    telegram = FakeTelegram()
+    await telegram.start()
+    workdir = tempfile.mkdtemp(prefix="bench_sharding_")
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=TOKEN,
+        TELEGRAM_API_URL=telegram.url,
+        OPENAI_BASE_URL=openai_url,
+        OPENAI_API_KEY="sk-bench",
+        BOT_MODE="polling",
+        SHARD_WORKERS=str(workers),
+        CONVERSATION_STORE="sqlite",
+        CONVERSATION_DB=os.path.join(workdir, "conversations.db"),
+        USERS_DB=os.path.join(workdir, "users.db"),
+        STREAM_REPLIES="0",
+        VALERA_BOTS="",
+        SHARD_RESTART_DELAY="0.5",
+    )
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, BOT, env=env, cwd=workdir,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    log: List[str] = []
+
+    async def read_log():
+        async for raw in proc.stdout:
+            log.append(raw.decode("utf-8", "replace").rstrip())
+
+    reader = asyncio.create_task(read_log())
+    await wait_for(lambda: TOKEN in telegram.polling, 60, "опрос getUpdates")
+    if workers > 1:
+        await wait_for(
+            lambda: any(f"живых воркеров: {workers}" in line for line in log),
+            60, "запуск воркеров",
+        )
+
+    updates = synthetic_updates(args.users, args.messages)
+    started = time.perf_counter()
+    for i, update in enumerate(updates):
+        update = dict(update, update_id=i + 1)
+        update["message"] = dict(update["message"], date=int(time.time()))
+        telegram.expect_reply(chat_id_of(update), time.perf_counter())
+        telegram.push_update(update)
+
+    killed = False
+    answered, progress_at = 0, started
+    while telegram.pending_replies:
+        now = time.perf_counter()
+        if len(telegram.latencies) > answered:
+            answered, progress_at = len(telegram.latencies), now
+        elif now - progress_at > args.idle:
+            # Ответов больше не будет: оставшиеся потеряны
+            break
+        if (args.kill and not killed and workers > 1
+                and answered >= len(updates) // 3):
+            os.kill(children(proc.pid)[0], signal.SIGKILL)
+            killed = True
+        await asyncio.sleep(0.02)
+    elapsed = progress_at - started
+
+    proc.send_signal(signal.SIGTERM)
+    await proc.wait()
+    await reader
+    await telegram.stop()
+    answered = len(telegram.latencies)
+    return dict(
+        summarize(telegram.latencies),
+        workers=workers,
+        rate=answered / elapsed,
+        lost=telegram.pending_replies,
+        rebalances=sum("Слоты перераспределены" in line for line in log),
+        redelivered=sum(int(m.group(1)) for line in log for m in
+                        [re.search(r"переотправка апдейтов: (\d+)", line)]
+                        if m),
+    )
+
+
+async def main(args) -> None:
+    port = free_port()
+    openai = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_openai.py"),
+        "--port", str(port), "--latency", str(args.latency),
+        stdout=asyncio.subprocess.DEVNULL,
+    )
+    await asyncio.sleep(1)
+    openai_url = f"http://127.0.0.1:{port}/v1"
+    print(f"Пользователей: {args.users}, сообщений: "
+          f"{args.users * (args.messages + 1)}, задержка модели: "
+          f"{args.latency:.3f} с, ядер: {os.cpu_count()}")
+    print(f"{'воркеров':>8} {'апд/с':>8} {'p50 мс':>8} {'p99 мс':>8} "
+          f"{'потеряно':>9} {'переотпр.':>10} {'перебал.':>9}")
+    try:
+        for workers in (int(n) for n in args.workers.split(",")):
+            r = await run(workers, args, openai_url)
+            print(f"{r['workers']:>8} {r['rate']:>8.0f} {r['p50_ms']:>8.0f} "
+                  f"{r['p99_ms']:>8.0f} {r['lost']:>9} {r['redelivered']:>10} "
+                  f"{r['rebalances']:>9}")
+    finally:
+        openai.terminate()
+        await openai.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--idle", type=float, default=10,
+                        help="сколько ждать новых ответов, прежде чем "
+                             "считать оставшиеся потерянными")
+    parser.add_argument("--kill", action="store_true",
+                        help="убить один воркер посреди прогона")
+    asyncio.run(main(parser.parse_args()))
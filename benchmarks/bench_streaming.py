@@ -0,0 +1,65 @@
+"""Время до первого видимого токена: обычные ответы против потоковых.
+
+Фейковый OpenAI отдаёт длинный ответ по словам. Для каждого режима
+бенчмарк меряет, когда пользователь увидел первый текст, когда получил
+полный ответ и сколько правок сообщения понадобилось.
+
+    python benchmarks/bench_streaming.py --latency 4 --words 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.bench_valera_async import load_valera  # noqa: E402
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+from benchmarks.tg_stubs import FakeUpdate, fake_context  # noqa: E402
+
+
+async def one_user(valera, user_id: int, first, full, edits) -> None:
+    context = fake_context()
+    await valera.start(FakeUpdate(user_id, "/start", "Сергей"), context)
+    update = FakeUpdate(user_id, "Расскажи длинную историю")
+    started = time.perf_counter()
+    await valera.handle_message(update, context)
+    first.append(update.replies[0]["at"] - started)
+    full.append(update.replies[-1]["at"] - started)
+    edits.append(sum(1 for r in update.replies if "edit" in r))
+
+
+async def main(args) -> None:
+    reply = " ".join(f"слово{i}" for i in range(args.words))
+    fake = FakeOpenAI(latency=args.latency, reply=reply)
+    await fake.start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    valera = load_valera(args.bot)
+
+    print(f"{'mode':>8} {'first p50':>10} {'full p50':>9} {'edits':>6}")
+    for mode, enabled in (("blocking", False), ("stream", True)):
+        valera.STREAM_REPLIES = enabled
+        first, full, edits = [], [], []
+        base = 1000 if enabled else 0
+        await asyncio.gather(*(
+            one_user(valera, base + i, first, full, edits)
+            for i in range(args.users)
+        ))
+        print(f"{mode:>8} {summarize(first)['p50_ms']:>8.0f}ms "
+              f"{summarize(full)['p50_ms']:>7.0f}ms "
+              f"{sum(edits) / len(edits):>6.1f}")
+
+    await valera.close_async_client()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bot", default="Valera_test_4.1_nano")
+    parser.add_argument("--latency", type=float, default=4.0)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--users", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""Цена трассировки на апдейт при разных TRACE_SAMPLE_RATE.
+
+Пользователи Валеры прогоняются через handle_message с MockOpenAI без
+задержки, каждый апдейт — в корневом спане, как в PerUserUpdateProcessor.
+Меряется CPU на ответ при доле выборки 0, 1%, 10% и 100%, спаны пишутся
+в файл во временном каталоге настоящим экспортёром.
+
+    python benchmarks/bench_tracing.py --users 200 --messages 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.bench_valera_async import load_valera  # noqa: E402
+from benchmarks.tg_stubs import FakeUpdate, fake_context  # noqa: E402
+from common import tracing  # noqa: E402
+from common.mock_openai import LatencyModel, MockOpenAI  # noqa: E402
+from common.openai_client import close_async_client, use_transport  # noqa: E402
+
+
+async def run_user(valera, user_id: int, messages: int) -> int:
+    context = fake_context()
+    await valera.start(FakeUpdate(user_id, "/start", "Сергей"), context)
+    for i in range(messages):
+        with tracing.trace("update", **{"user.id": user_id}):
+            await valera.handle_message(
+                FakeUpdate(user_id, f"Валера, вопрос номер {i}"), context
+            )
+    return messages
+
+
+async def run_rate(valera, rate: float, args, base_id: int) -> None:
+    tracing.set_sample_rate(rate)
+    await tracing.exporter.flush()
+    exported = tracing.exporter.exported
+    cpu, wall = time.process_time(), time.perf_counter()
+    replies = sum(await asyncio.gather(*(
+        run_user(valera, base_id + i, args.messages)
+        for i in range(args.users)
+    )))
+    await tracing.exporter.flush()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    print(f"{rate:>8.0%} {replies / wall:>10.0f} "
+          f"{cpu / replies * 1e6:>9.0f} "
+          f"{tracing.exporter.exported - exported:>8}")
+
+
+async def main(args) -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["MOCK_MODE"] = "0"
+    os.environ["STREAM_REPLIES"] = "0"
+    valera = load_valera(args.bot)
+    use_transport(MockOpenAI(LatencyModel("fixed", 0.0)))
+    tracing.exporter.path = os.path.join(
+        tempfile.mkdtemp(prefix="bench_tracing_"), "traces.jsonl"
+    )
+    tracing.exporter.url = ""
+
+    print(f"Пользователей: {args.users}, сообщений у каждого: "
+          f"{args.messages}")
+    print(f"{'выборка':>8} {'ответов/с':>10} {'CPU мкс':>9} {'спанов':>8}")
+    # Первый прогон прогревает кэши и клиент, в таблицу не идёт
+    tracing.set_sample_rate(0)
+    await asyncio.gather(*(run_user(valera, i, 1) for i in range(50)))
+    for level, rate in enumerate(float(r) for r in args.rates.split(",")):
+        await run_rate(valera, rate, args, base_id=(level + 1) * 1_000_000)
+    await close_async_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bot", default="Valera_test_4.1_nano")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--rates", default="0,0.01,0.1,1")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""Регистрации в секунду: старый users.add_user против UserRegistry.
+
+Старый вариант открывал соединение на каждый вызов и делал SELECT, затем
+INSERT прямо в потоке бота. UserRegistry держит одно соединение в
+отдельном потоке и пишет очередь пачками через INSERT OR IGNORE.
+
+    python benchmarks/bench_user_registry.py --users 20000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from common.user_registry import UserRegistry  # noqa: E402
+
+
+def legacy_init_db(path: str) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_seen TEXT
+    )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def legacy_add_user(path: str, user_id: int, username: str) -> None:
+    """Копия add_user из users.py до перехода на UserRegistry"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
+    if cursor.fetchone() is None:
+        now = datetime.now().isoformat()
+        cursor.execute(
+            "INSERT INTO users (user_id, username, first_seen) VALUES (?, ?, ?)",
+            (user_id, username, now)
+        )
+        conn.commit()
+    conn.close()
+
+
+async def bench_legacy(path: str, users: int, repeat: float) -> float:
+    legacy_init_db(path)
+    started = time.perf_counter()
+    for i in range(users):
+        legacy_add_user(path, i % int(users / repeat), f"user{i}")
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    return users / (time.perf_counter() - started)
+
+
+async def bench_registry(path: str, users: int, repeat: float) -> float:
+    registry = UserRegistry(path)
+    writer = asyncio.create_task(registry.run_writer())
+    started = time.perf_counter()
+    for i in range(users):
+        await registry.add_user(i % int(users / repeat), f"user{i}")
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    await registry.flush()
+    rate = users / (time.perf_counter() - started)
+    writer.cancel()
+    await registry.close()
+    return rate
+
+
+async def main(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.users} вызовов /start, каждый пользователь "
+              f"в среднем {args.repeat:g} раз(а)")
+        legacy = await bench_legacy(os.path.join(tmp, "legacy.db"),
+                                    args.users, args.repeat)
+        print(f"  старый users.add_user: {legacy:>9.0f} регистраций/с")
+        registry = await bench_registry(os.path.join(tmp, "registry.db"),
+                                        args.users, args.repeat)
+        print(f"  UserRegistry:          {registry:>9.0f} регистраций/с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--repeat", type=float, default=1.5,
+                        help="сколько раз в среднем приходит один пользователь")
+    asyncio.run(main(parser.parse_args()))
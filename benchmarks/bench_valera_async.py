@@ -0,0 +1,86 @@
+"""Нагрузочный бенчмарк асинхронного generate_response Валеры.
+
+Поднимает фейковый сервер OpenAI с фиксированной задержкой и прогоняет
+через handle_message растущее число одновременных пользователей.
+Синхронный клиент обслуживал пользователей строго по одному, поэтому его
+пропускная способность ограничена 1 / latency ответов в секунду.
+
+    python benchmarks/bench_valera_async.py --latency 0.5 --messages 3
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.tg_stubs import FakeUpdate, fake_context  # noqa: E402
+
+
+def load_valera(bot_dir: str):
+    """Импортирует main.py выбранного Валеры из его каталога"""
+    path = os.path.join(ROOT, bot_dir)
+    # Бенчмарки не должны трогать базы в каталоге бота
+    os.environ.setdefault("CONVERSATION_STORE", "memory")
+    os.environ.setdefault(
+        "USERS_DB", os.path.join(tempfile.mkdtemp(), "users.db")
+    )
+    os.chdir(path)
+    sys.path.insert(0, path)
+    return importlib.import_module("main")
+
+
+async def run_user(valera, user_id: int, messages: int) -> int:
+    context = fake_context()
+    await valera.start(FakeUpdate(user_id, "/start", "Сергей"), context)
+    replies = 0
+    for i in range(messages):
+        update = FakeUpdate(user_id, f"Валера, вопрос номер {i}")
+        await valera.handle_message(update, context)
+        replies += len(update.replies)
+    return replies
+
+
+async def run_level(valera, users: int, messages: int,
+                    base_id: int) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_user(valera, base_id + i, messages) for i in range(users)
+    ))
+    elapsed = time.perf_counter() - started
+    return sum(results) / elapsed
+
+
+async def main(args) -> None:
+    fake = FakeOpenAI(latency=args.latency)
+    await fake.start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    valera = load_valera(args.bot)
+
+    print(f"Задержка модели: {args.latency:.3f} с, "
+          f"синхронный потолок: {1 / args.latency:.1f} ответов/с")
+    print(f"{'users':>6} {'replies/s':>10} {'speedup':>8} {'in-flight':>9}")
+    for level, users in enumerate(args.users):
+        fake.max_in_flight = 0
+        rps = await run_level(valera, users, args.messages,
+                              base_id=(level + 1) * 1_000_000)
+        print(f"{users:>6} {rps:>10.1f} {rps * args.latency:>8.1f} "
+              f"{fake.max_in_flight:>9}")
+
+    await valera.close_async_client()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bot", default="Valera_test_4.1_nano")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--users", type=int, nargs="+",
+                        default=[1, 10, 50, 100, 200, 500])
+    asyncio.run(main(parser.parse_args()))
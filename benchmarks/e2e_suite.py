@@ -0,0 +1,267 @@
+"""Сквозной набор сценариев для хаба и Валеры против фейковых серверов.
+
+Оба бота поднимаются целиком в одном процессе (как в launcher.py) и
+опрашивают фейковый Bot API, модель отвечает фейковый OpenAI. Каждый
+виртуальный пользователь проходит сценарий шаг за шагом: следующий
+апдейт уходит только после ответа бота на предыдущий, как у живого
+человека. По каждому сценарию считаются апдейты в секунду, латентность
+до первого ответа по этапам и прирост памяти процесса. Результаты
+сохраняются в JSON, и прогон можно сравнить с предыдущим:
+
+    python benchmarks/e2e_suite.py --users 50
+    python benchmarks/e2e_suite.py --users 50 --compare benchmarks/results/e2e-20250601-120000.json
+    python benchmarks/e2e_suite.py --scenarios valera_onboarding
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.fake_telegram import BOT_USER, FakeTelegram  # noqa: E402
+from benchmarks.stats import rss_mb, summarize  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BOTS = {
+    "hub": ("GPT_hub_bot", "111111:e2e-hub"),
+    "valera": ("Valera_test_4.1_nano", "222222:e2e-valera"),
+}
+
+# Шаг сценария: этап, тип апдейта (command, text, callback) и его текст.
+# {user} и {i} в тексте заменяются, чтобы кэш ответов хаба не подменял модель
+Step = Tuple[str, str, str]
+HUB_ENTER: List[Step] = [
+    ("start", "command", "/start"),
+    ("enter", "callback", "enter"),
+]
+SCENARIOS: Dict[str, Tuple[str, List[Step]]] = {
+    # Меню хаба через button_handler: выбор режима, возврат, тарифы
+    "hub_menu": ("hub", HUB_ENTER + [
+        ("pick_mode", "callback", "write"),
+        ("home", "callback", "home"),
+        ("pricing", "callback", "pricing"),
+    ]),
+    "hub_text": ("hub", HUB_ENTER + [("pick_mode", "callback", "write")] + [
+        ("text", "text", "Напиши объявление о продаже велосипеда, "
+                         "пользователь {user}, вариант {i}")
+    ] * 3),
+    "hub_draw": ("hub", HUB_ENTER + [
+        ("pick_mode", "callback", "draw"),
+        ("draw", "text", "Нарисуй кота в шляпе номер {user}"),
+    ]),
+    # Знакомство Валеры по всем состояниям до determined и два вопроса.
+    # Имя в профиле пустое, «Женя» пола не выдаёт — проходятся все ветки
+    "valera_onboarding": ("valera", [
+        ("start", "command", "/start"),
+        ("initial", "text", "Привет"),
+        ("waiting_name", "text", "Как дела?"),
+        ("analyzing_name", "text", "Меня зовут Женя"),
+        ("waiting_gender", "text", "мальчик"),
+    ] + [("determined", "text", "Валера, вопрос номер {i}")] * 2),
+}
+
+
+class Chat:
+    """Виртуальный пользователь одного бота"""
+
+    def __init__(self, telegram: FakeTelegram, token: str, user_id: int,
+                 update_ids: itertools.count, first_name: str = "Bench"):
+        self.telegram = telegram
+        self.token = token
+        self.user_id = user_id
+        self.update_ids = update_ids
+        self.user = {"id": user_id, "is_bot": False, "first_name": first_name,
+                     "username": f"user{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+
+    def update(self, kind: str, text: str) -> dict:
+        update_id = next(self.update_ids)
+        now = int(time.time())
+        if kind == "callback":
+            return {"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": self.user,
+                "chat_instance": str(self.user_id), "data": text,
+                "message": {"message_id": 1, "date": now, "chat": self.chat,
+                            "from": BOT_USER, "text": "Меню"},
+            }}
+        message = {"message_id": update_id, "date": now, "chat": self.chat,
+                   "from": self.user, "text": text}
+        if kind == "command":
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            ]
+        return {"update_id": update_id, "message": message}
+
+    async def run(self, steps: List[Step], timeout: float) -> int:
+        """Проходит сценарий; возвращает число шагов без ответа (0 или 1)"""
+        for i, (stage, kind, text) in enumerate(steps):
+            text = text.format(user=self.user_id, i=i)
+            if not await self.send(stage, kind, text, timeout):
+                # Состояние бота и сценария разошлись: дальше идти нельзя
+                return 1
+        return 0
+
+    async def send(self, stage: str, kind: str, text: str,
+                   timeout: float) -> bool:
+        """Отправляет апдейт и ждёт ответа; False, если не дождались"""
+        reply = self.telegram.expect_reply(
+            self.user_id, time.perf_counter(), stage
+        )
+        self.telegram.push_update(self.update(kind, text), self.token)
+        try:
+            await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+async def run_scenario(name: str, telegram: FakeTelegram,
+                       update_ids: Dict[str, itertools.count], args,
+                       base_id: int) -> dict:
+    bot, steps = SCENARIOS[name]
+    token = BOTS[bot][1]
+    telegram.stage_latencies.clear()
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    failed = await asyncio.gather(*(
+        Chat(telegram, token, base_id + i, update_ids[bot]).run(
+            steps, args.reply_timeout
+        )
+        for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+    updates = sum(len(v) for v in telegram.stage_latencies.values())
+    return {
+        "bot": bot,
+        "users": args.users,
+        "updates": updates,
+        "failed_users": sum(failed),
+        "seconds": elapsed,
+        "updates_per_s": updates / elapsed,
+        "stages": {
+            stage: summarize(telegram.stage_latencies[stage])
+            for stage in dict.fromkeys(stage for stage, _, _ in steps)
+        },
+        "rss_mb_before": rss_before,
+        "rss_mb_after": rss_mb(),
+    }
+
+
+def print_result(name: str, r: dict) -> None:
+    growth = r["rss_mb_after"] - r["rss_mb_before"]
+    print(f"\n{name}: {r['updates_per_s']:.1f} апд/с, апдейтов "
+          f"{r['updates']}, без ответа {r['failed_users']} польз., "
+          f"память {growth:+.1f} МБ")
+    for stage, s in r["stages"].items():
+        print(f"  {stage:<16} p50 {s['p50_ms']:>7.0f} мс  "
+              f"p99 {s['p99_ms']:>7.0f} мс  n={s['count']}")
+
+
+def compare(results: dict, path: str) -> None:
+    """Разница с сохранённым прогоном: апд/с и p50/p99 по этапам"""
+    with open(path, "r", encoding="utf-8") as f:
+        old = json.load(f)["scenarios"]
+    print(f"\nСравнение с {path}:")
+    for name, r in results.items():
+        if name not in old:
+            continue
+        o = old[name]
+        change = r["updates_per_s"] / o["updates_per_s"] - 1
+        print(f"{name}: {o['updates_per_s']:.1f} → "
+              f"{r['updates_per_s']:.1f} апд/с ({change:+.0%})")
+        for stage, s in r["stages"].items():
+            was = o["stages"].get(stage)
+            if was:
+                print(f"  {stage:<16} p50 {was['p50_ms']:.0f} → "
+                      f"{s['p50_ms']:.0f} мс, p99 {was['p99_ms']:.0f} → "
+                      f"{s['p99_ms']:.0f} мс")
+
+
+def setup_env(openai: FakeOpenAI, telegram: FakeTelegram) -> None:
+    """Окружение до импорта ботов: их настройки читаются при импорте"""
+    workdir = tempfile.mkdtemp(prefix="e2e_")
+    os.environ.update(
+        OPENAI_BASE_URL=openai.base_url,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-bench"),
+        TELEGRAM_API_URL=telegram.url,
+        STREAM_REPLIES="0",
+        MOCK_MODE="0",
+        CONVERSATION_STORE="memory",
+        USERS_DB=os.path.join(workdir, "users.db"),
+        QUOTAS_DB=os.path.join(workdir, "quotas.db"),
+    )
+    # Хаб работает с тарифами из коробки, как у пользователей без подписки
+    os.environ.pop("DEFAULT_TARIFF", None)
+
+
+async def main(args) -> None:
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    openai = FakeOpenAI(latency=args.latency, image_latency=args.image_latency)
+    telegram = FakeTelegram()
+    await openai.start()
+    await telegram.start()
+    setup_env(openai, telegram)
+
+    import launcher
+    from common.telegram_app import start_application, stop_applications
+
+    needed = dict.fromkeys(SCENARIOS[name][0] for name in names)
+    apps = [launcher.build_bot(BOTS[bot][0], "", BOTS[bot][1], set())
+            for bot in needed]
+    for app in apps:
+        await start_application(app, polling=True)
+    update_ids = {bot: itertools.count(1) for bot in BOTS}
+
+    results = {}
+    try:
+        for level, name in enumerate(names):
+            results[name] = await run_scenario(
+                name, telegram, update_ids, args,
+                base_id=(level + 1) * 1_000_000,
+            )
+            print_result(name, results[name])
+    finally:
+        await stop_applications(apps)
+        await telegram.stop()
+        await openai.stop()
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, time.strftime("e2e-%Y%m%d-%H%M%S.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "scenarios": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты: {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="",
+                        help="через запятую; по умолчанию все: "
+                             + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--reply-timeout", type=float, default=30)
+    parser.add_argument("--out", default="",
+                        help="куда сохранить JSON (по умолчанию "
+                             "benchmarks/results/e2e-<время>.json)")
+    parser.add_argument("--compare", default="",
+                        help="JSON прошлого прогона для сравнения")
+    asyncio.run(main(parser.parse_args()))
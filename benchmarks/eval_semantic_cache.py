@@ -0,0 +1,75 @@
+"""Офлайн-оценка семантического кэша на корпусе перефразов.
+
+Первый вопрос каждой группы кладётся в кэш, остальные перефразы ищутся
+в нём. Вопросы из unseen в кэше отсутствуют, любое попадание для них —
+ошибка. Для каждого порога печатаются доля попаданий (перефраз получил
+ответ своей группы) и доля ложных попаданий (ответ чужой группы).
+
+    python benchmarks/eval_semantic_cache.py
+    python benchmarks/eval_semantic_cache.py --corpus my.json --thresholds 0.7 0.8
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from common.semantic_cache import SemanticCache  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "data",
+                              "semantic_questions.json")
+
+
+def evaluate(corpus: dict, threshold: float) -> dict:
+    cache = SemanticCache(threshold=threshold)
+    for group_id, group in enumerate(corpus["groups"]):
+        cache.add("explain", group[0], str(group_id))
+
+    queries = [(str(group_id), question)
+               for group_id, group in enumerate(corpus["groups"])
+               for question in group[1:]]
+    queries += [(None, question) for question in corpus.get("unseen", [])]
+
+    hits = false_hits = 0
+    mistakes = []
+    for expected, question in queries:
+        found = cache.lookup("explain", question)
+        if found is None:
+            continue
+        if found[0] == expected:
+            hits += 1
+        else:
+            false_hits += 1
+            mistakes.append((question, corpus["groups"][int(found[0])][0]))
+    paraphrases = sum(1 for expected, _ in queries if expected is not None)
+    return {
+        "hit_rate": hits / paraphrases if paraphrases else 0.0,
+        "false_hit_rate": false_hits / len(queries) if queries else 0.0,
+        "mistakes": mistakes,
+    }
+
+
+def main(args) -> None:
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    print(f"Групп: {len(corpus['groups'])}, "
+          f"вопросов вне кэша: {len(corpus.get('unseen', []))}")
+    print(f"{'threshold':>9} {'hit rate':>9} {'false hits':>11}")
+    for threshold in args.thresholds:
+        result = evaluate(corpus, threshold)
+        print(f"{threshold:>9.2f} {result['hit_rate']:>9.0%} "
+              f"{result['false_hit_rate']:>11.1%}")
+        if args.verbose:
+            for question, matched in result["mistakes"]:
+                print(f"    «{question}» -> «{matched}»")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=[0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9])
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="печатать ложные попадания")
+    main(parser.parse_args())
@@ -0,0 +1,160 @@
+"""Локальный фейковый сервер OpenAI для нагрузочных тестов"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.http_server import HTTPServer, Request, Response  # noqa: E402
+
+DEFAULT_REPLY = "Отвали, я занят. Ладно, хрен с тобой, помогу."
+
+
+class FakeOpenAI:
+    """Отвечает как /v1/chat/completions и /v1/images/generations с задержкой"""
+
+    def __init__(self, latency: float = 0.5, image_latency: float = 2.0,
+                 reply: str = DEFAULT_REPLY, host: str = "127.0.0.1",
+                 port: int = 0, first_token_latency: Optional[float] = None,
+                 capacity: Optional[int] = None):
+        self.latency = latency
+        # При stream=True первый токен приходит раньше полного ответа
+        self.first_token_latency = (
+            latency / 4 if first_token_latency is None
+            else first_token_latency
+        )
+        self.image_latency = image_latency
+        # Сколько запросов сервер тянет одновременно; сверх этого — 429
+        self.capacity = capacity
+        self.rejected = 0
+        self.reply = reply
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = HTTPServer(self.handle, host, port)
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.server.url}/v1"
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+    async def handle(self, request: Request) -> Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.capacity is not None and self.in_flight > self.capacity:
+                self.rejected += 1
+                return Response.json({"error": {
+                    "message": "Rate limit reached for requests",
+                    "type": "requests", "code": "rate_limit_exceeded",
+                }}, 429)
+            if request.path.endswith("/chat/completions"):
+                return await self.chat_completion(request)
+            if request.path.endswith("/images/generations"):
+                return await self.image_generation(request)
+            return Response.json({"error": {"message": "not found"}}, 404)
+        finally:
+            self.in_flight -= 1
+
+    async def chat_completion(self, request: Request) -> Response:
+        payload = request.json()
+        if payload.get("stream"):
+            return Response(
+                content_type="text/event-stream",
+                stream=self.stream_chunks(payload),
+            )
+        await asyncio.sleep(self.latency)
+        return Response.json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply},
+                "finish_reason": "stop",
+            }],
+            "usage": self.usage(payload),
+        })
+
+    def usage(self, payload) -> dict:
+        prompt_tokens = sum(
+            len(m.get("content", "")) // 4 for m in payload.get("messages", [])
+        )
+        completion_tokens = len(self.reply) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def stream_chunks(self, payload):
+        """Отдаёт ответ по словам в формате server-sent events"""
+        words = self.reply.split(" ")
+        step = max(0.0, self.latency - self.first_token_latency) / len(words)
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await asyncio.sleep(self.first_token_latency)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(step)
+            yield self._sse({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == 0 else " " + word},
+                    "finish_reason": None,
+                }],
+            })
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            # Последний чанк без choices, как у OpenAI
+            yield self._sse({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "gpt-4o"),
+                "choices": [],
+                "usage": self.usage(payload),
+            })
+        yield b"data: [DONE]\n\n"
+
+    @staticmethod
+    def _sse(data) -> bytes:
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+    async def image_generation(self, request: Request) -> Response:
+        await asyncio.sleep(self.image_latency)
+        return Response.json({
+            "created": int(time.time()),
+            "data": [{"url": f"https://example.com/{uuid.uuid4().hex}.png"}],
+        })
+
+
+async def _serve_forever(args) -> None:
+    fake = FakeOpenAI(args.latency, args.image_latency, port=args.port)
+    await fake.start()
+    print(f"Фейковый OpenAI слушает {fake.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    try:
+        asyncio.run(_serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,161 @@
+"""Локальный фейковый Bot API Telegram для нагрузочных тестов.
+
+Бот подключается к нему через TELEGRAM_API_URL. Сервер раздаёт апдейты
+через getUpdates (режим polling) и запоминает, когда бот ответил в чат.
+Несколько ботов могут опрашивать один сервер: у каждого токена своя
+очередь апдейтов.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Set, Tuple
+from urllib.parse import parse_qs
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.http_server import HTTPServer, Request, Response  # noqa: E402
+
+BOT_USER = {
+    "id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+    "can_join_groups": False, "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+# Методы, которые создают или меняют сообщение в чате
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "editMessageText"}
+
+
+def _parse_params(request: Request) -> dict:
+    """Параметры вызова: JSON или форма, где сложные значения в JSON"""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return request.json()
+    params = dict(request.query)
+    if request.body:
+        for key, values in parse_qs(request.body.decode("utf-8")).items():
+            params[key] = values[-1]
+    for key, value in params.items():
+        try:
+            params[key] = json.loads(value)
+        except (TypeError, ValueError):
+            pass
+    return params
+
+
+class FakeTelegram:
+    """Отвечает на вызовы Bot API и отмечает время ответов по чатам"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = HTTPServer(self.handle, host, port)
+        self.calls: Dict[str, int] = defaultdict(int)
+        # токен -> апдейты; "" — общая очередь для любого бота
+        self._updates: Dict[str, List[dict]] = defaultdict(list)
+        self._new_update = asyncio.Event()
+        self._message_id = 0
+        # Когда в чат ушёл апдейт и ещё не было ответа: время, этап
+        # сценария и future, которое получит латентность
+        self._waiting: Dict[int, Deque[Tuple[float, str, asyncio.Future]]] = \
+            defaultdict(deque)
+        self.latencies: List[float] = []
+        self.stage_latencies: Dict[str, List[float]] = defaultdict(list)
+        # Токены ботов, которые уже начали опрашивать getUpdates
+        self.polling: Set[str] = set()
+
+    @property
+    def url(self) -> str:
+        return self.server.url
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        self._new_update.set()
+        await self.server.stop()
+
+    def expect_reply(self, chat_id: int, sent_at: float,
+                     stage: str = "") -> asyncio.Future:
+        """Запоминает апдейт, ответ на который надо засечь.
+
+        Возвращает future с латентностью первого ответа в чат.
+        """
+        reply = asyncio.get_running_loop().create_future()
+        self._waiting[chat_id].append((sent_at, stage, reply))
+        return reply
+
+    def push_update(self, update: dict, token: str = "") -> None:
+        """Кладёт апдейт в очередь getUpdates бота с этим токеном"""
+        self._updates[token].append(update)
+        self._new_update.set()
+
+    @property
+    def pending_replies(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    async def handle(self, request: Request) -> Response:
+        # /bot<token>/<method>
+        method = request.path.rsplit("/", 1)[-1]
+        self.calls[method] += 1
+        params = _parse_params(request)
+        if method == "getUpdates":
+            token = request.path.split("/")[-2][len("bot"):]
+            self.polling.add(token)
+            return self._ok(await self._get_updates(params, token))
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if method in MESSAGE_METHODS:
+            return self._ok(self._message(method, params))
+        # setWebhook, deleteWebhook, answerCallbackQuery, sendChatAction...
+        return self._ok(True)
+
+    @staticmethod
+    def _ok(result) -> Response:
+        return Response.json({"ok": True, "result": result})
+
+    def _queue(self, token: str) -> List[dict]:
+        return self._updates[token if token in self._updates else ""]
+
+    async def _get_updates(self, params: dict, token: str) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        # Подтверждённые апдейты больше не нужны
+        queue = self._queue(token)
+        queue[:] = [u for u in queue if u["update_id"] >= offset]
+        if not queue:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(),
+                                       float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return [u for u in self._queue(token)
+                if u["update_id"] >= offset][:limit]
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        waiting = self._waiting.get(chat_id)
+        if waiting:
+            # Латентность считаем до первого ответа бота в чат
+            sent_at, stage, reply = waiting.popleft()
+            latency = time.perf_counter() - sent_at
+            self.latencies.append(latency)
+            if stage:
+                self.stage_latencies[stage].append(latency)
+            if not reply.done():
+                reply.set_result(latency)
+
+        if method == "editMessageText":
+            message_id = int(params.get("message_id") or 0)
+        else:
+            self._message_id += 1
+            message_id = self._message_id
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if method == "sendPhoto":
+            message["photo"] = []
+        else:
+            message["text"] = str(params.get("text", ""))
+        return message
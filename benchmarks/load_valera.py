@@ -0,0 +1,343 @@
+"""Нагрузка на знакомство Валеры: тысячи виртуальных пользователей.
+
+Каждый пользователь приходит в случайный момент разгона (--ramp), жмёт
+/start и дальше отвечает по состоянию своей сессии: initial — приветствие,
+waiting_name — болтовня, analyzing_name — имя из name_gender_map.json
+(мужское, женское, неоднозначное или ответ без имени по --name-mix),
+waiting_gender — ответ о поле по --gender-mix, determined — --questions
+вопросов. Между сообщениями — пауза «на подумать» (--think). Часть
+пользователей приходит с настоящим именем в профиле (--named) и сразу
+попадает в determined, как и в жизни.
+
+Бот поднимается целиком (как в launcher.py) против фейкового Bot API;
+модель — фейковый сервер OpenAI или MockOpenAI в процессе (--mock).
+Каждую секунду снимаются вызовы модели, очередь и ожидание в
+планировщике, переходы между состояниями; в конце — латентность ответа
+по состояниям и сводка переходов.
+
+    python benchmarks/load_valera.py --users 2000 --ramp 30
+    python benchmarks/load_valera.py --users 5000 --mock --think exp:2 \\
+        --name-mix male=0.4,female=0.4,unknown=0.1,none=0.1
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.e2e_suite import Chat, setup_env  # noqa: E402
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+from benchmarks.stats import rss_mb, summarize  # noqa: E402
+
+BOT_DIR = "Valera_test_4.1_nano"
+TOKEN = "333333:load-valera"
+STATES = ("initial", "waiting_name", "analyzing_name", "waiting_gender",
+          "determined")
+GREETINGS = ("Привет", "Здорово, Валера", "Хай", "Ку", "Добрый вечер")
+SMALL_TALK = ("Как дела?", "Чем занят?", "Скучно мне", "Что нового?",
+              "Расскажи что-нибудь")
+NAME_TEMPLATES = ("Меня зовут {}", "Я {}", "{}", "Зови меня {}",
+                  "Мое имя {}")
+NO_NAME = ("Не скажу", "А тебе зачем?", "Угадай", "Секрет")
+GENDER_ANSWERS = {
+    "male": ("мальчик", "Я парень", "мужчина, а что?"),
+    "female": ("девочка", "Я девушка", "женщина"),
+    "unknown": ("не скажу", "какая разница", "угадай сам"),
+}
+QUESTIONS = ("Валера, что посмотреть вечером?", "Как выучить английский?",
+             "Что подарить другу на день рождения?",
+             "Почему небо голубое?", "Посоветуй книгу, вопрос {i}")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """"male=0.4,female=0.4" -> веса вариантов"""
+    mix = {}
+    for part in spec.split(","):
+        key, _, weight = part.partition("=")
+        mix[key.strip()] = float(weight)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit(f"Пустая смесь: {spec!r}")
+    return mix
+
+
+def pick(rng: random.Random, mix: Dict[str, float]) -> str:
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+
+class ThinkTime:
+    """Пауза перед сообщением: fixed:S, exp:MEAN, normal:MEAN,SD, uniform:A,B"""
+
+    __slots__ = ("kind", "args", "_random")
+
+    def __init__(self, spec: str, rng: random.Random):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        expected = {"fixed": 1, "exp": 1, "normal": 2, "uniform": 2}
+        if expected.get(kind) != len(self.args):
+            raise SystemExit(f"Не понял --think {spec!r}")
+        self._random = rng
+
+    def sample(self) -> float:
+        if self.kind == "exp":
+            return self._random.expovariate(1 / self.args[0]) \
+                if self.args[0] > 0 else 0.0
+        if self.kind == "normal":
+            return max(0.0, self._random.gauss(*self.args))
+        if self.kind == "uniform":
+            return self._random.uniform(*self.args)
+        return self.args[0]
+
+
+def load_names() -> Dict[str, List[str]]:
+    """Имена по полу из name_gender_map.json; "unknown" — неоднозначные"""
+    with open(os.path.join(ROOT, BOT_DIR, "name_gender_map.json"),
+              "r", encoding="utf-8") as f:
+        sections = list(json.load(f).values())
+    # Порядок разделов в файле: мужские, женские, общие
+    return {"male": list(sections[0]), "female": list(sections[1]),
+            "unknown": list(sections[2])}
+
+
+class Load:
+    """Общее состояние прогона: бот, генераторы и собранные метрики"""
+
+    def __init__(self, args, telegram: FakeTelegram, app, valera):
+        self.args = args
+        self.telegram = telegram
+        self.app = app
+        self.valera = valera
+        self.rng = random.Random(args.seed)
+        self.think = ThinkTime(args.think, self.rng)
+        self.name_mix = parse_mix(args.name_mix)
+        self.gender_mix = parse_mix(args.gender_mix)
+        self.names = load_names()
+        self.update_ids = itertools.count(1)
+        self.active = 0
+        self.finished = 0
+        self.failed = 0
+        self.transitions: Counter = Counter()
+        # Итог знакомства: (задуманный пол, пол в сессии) -> пользователей
+        self.outcomes: Counter = Counter()
+
+    async def state_of(self, user_id: int) -> str:
+        session = await self.valera.default_bot.sessions.get(user_id)
+        return session.state
+
+    async def settled(self, user_id: int) -> None:
+        """Ждёт, пока бот допишет апдейт пользователя.
+
+        Ответ в чат уходит раньше, чем обработчик сменит состояние сессии.
+        """
+        processor = self.app.update_processor
+        while user_id in processor.busy_keys():
+            await asyncio.sleep(0.005)
+
+    def message_for(self, state: str, persona: dict, asked: int) -> str:
+        rng = self.rng
+        if state == "initial":
+            return rng.choice(GREETINGS)
+        if state == "waiting_name":
+            return rng.choice(SMALL_TALK)
+        if state == "analyzing_name":
+            if persona["name"] is None:
+                return rng.choice(NO_NAME)
+            return rng.choice(NAME_TEMPLATES).format(persona["name"])
+        if state == "waiting_gender":
+            return rng.choice(GENDER_ANSWERS[persona["gender"]])
+        return rng.choice(QUESTIONS).format(i=asked)
+
+    def persona(self) -> dict:
+        """Кем пользователь представится: имя в ответе, пол, имя в профиле"""
+        kind = pick(self.rng, self.name_mix)
+        name = self.rng.choice(self.names[kind]) if kind in self.names \
+            else None
+        gender = pick(self.rng, self.gender_mix)
+        if kind in ("male", "female"):
+            gender = kind
+        profile = "Bench"
+        if self.rng.random() < self.args.named:
+            gender = self.rng.choice(("male", "female"))
+            profile = self.rng.choice(self.names[gender])
+        return {"name": name, "gender": gender, "profile": profile}
+
+    async def user(self, user_id: int) -> None:
+        args = self.args
+        await asyncio.sleep(self.rng.uniform(0, args.ramp))
+        persona = self.persona()
+        chat = Chat(self.telegram, TOKEN, user_id, self.update_ids,
+                    first_name=persona["profile"])
+        self.active += 1
+        try:
+            if not await chat.send("start", "command", "/start",
+                                   args.reply_timeout):
+                self.failed += 1
+                return
+            await self.settled(user_id)
+            asked = 0
+            while asked < args.questions:
+                await asyncio.sleep(max(self.think.sample(), 0.0))
+                state = await self.state_of(user_id)
+                text = self.message_for(state, persona, asked)
+                if not await chat.send(state, "text", text,
+                                       args.reply_timeout):
+                    self.failed += 1
+                    return
+                await self.settled(user_id)
+                self.transitions[(state, await self.state_of(user_id))] += 1
+                if state == "determined":
+                    asked += 1
+            session = await self.valera.default_bot.sessions.get(user_id)
+            self.outcomes[(persona["gender"], session.gender)] += 1
+            self.finished += 1
+        finally:
+            self.active -= 1
+
+
+async def sample(load: Load, openai, timeline: List[dict],
+                 every: float) -> None:
+    """Раз в every секунд: вызовы модели, очередь планировщика, переходы"""
+    from common.openai_scheduler import chat_scheduler
+
+    started = time.perf_counter()
+    calls, moves = openai.requests, 0
+    while True:
+        await asyncio.sleep(every)
+        snap = chat_scheduler.snapshot()
+        now_calls = openai.requests
+        now_moves = sum(load.transitions.values())
+        point = {
+            "t": time.perf_counter() - started,
+            "active": load.active,
+            "calls_per_s": (now_calls - calls) / every,
+            "transitions_per_s": (now_moves - moves) / every,
+            "queue_depth": snap["queue_depth"],
+            "in_flight": snap["in_flight"],
+            "wait_p50_ms": snap["wait_p50_ms"],
+            "wait_p95_ms": snap["wait_p95_ms"],
+            "busy_users": len(load.app.update_processor.busy_keys()),
+        }
+        timeline.append(point)
+        calls, moves = now_calls, now_moves
+        print(f"{point['t']:>6.0f} {point['active']:>7} "
+              f"{point['busy_users']:>7} {point['calls_per_s']:>9.1f} "
+              f"{point['transitions_per_s']:>9.1f} {point['queue_depth']:>7} "
+              f"{point['in_flight']:>8} {point['wait_p50_ms']:>8.0f} "
+              f"{point['wait_p95_ms']:>8.0f}")
+
+
+def print_summary(load: Load, timeline: List[dict], elapsed: float,
+                  calls: int, rss: Tuple[float, float]) -> None:
+    moves = sum(load.transitions.values())
+    print(f"\nЗа {elapsed:.1f} с: дошли до конца {load.finished}, без ответа "
+          f"{load.failed}; вызовов модели {calls} ({calls / elapsed:.1f}/с), "
+          f"переходов {moves} ({moves / elapsed:.1f}/с); память "
+          f"{rss[0]:.0f} → {rss[1]:.0f} МБ")
+    if timeline:
+        print(f"Пик: очередь планировщика {max(p['queue_depth'] for p in timeline)}, "
+              f"ожидание p95 {max(p['wait_p95_ms'] for p in timeline):.0f} мс, "
+              f"вызовов модели {max(p['calls_per_s'] for p in timeline):.1f}/с")
+
+    print("\nОтвет бота по состоянию, из которого пришло сообщение:")
+    for state in ("start",) + STATES:
+        latencies = load.telegram.stage_latencies.get(state)
+        if latencies:
+            s = summarize(latencies)
+            print(f"  {state:<16} p50 {s['p50_ms']:>7.0f} мс  "
+                  f"p99 {s['p99_ms']:>7.0f} мс  n={s['count']}")
+
+    print("\nПереходы:")
+    for (source, target), count in sorted(
+            load.transitions.items(),
+            key=lambda item: (STATES.index(item[0][0]), -item[1])):
+        print(f"  {source:>14} → {target:<14} {count:>7} "
+              f"{count / elapsed:>8.1f}/с")
+
+    print("\nПол в сессии против задуманного:")
+    for (wanted, got), count in sorted(load.outcomes.items()):
+        print(f"  {wanted:>8} → {got:<8} {count:>7}")
+
+
+async def main(args) -> None:
+    telegram = FakeTelegram()
+    openai = FakeOpenAI(latency=args.latency)
+    await telegram.start()
+    await openai.start()
+    setup_env(openai, telegram)
+
+    import launcher
+    from common.mock_openai import LatencyModel, MockOpenAI
+    from common.openai_client import close_async_client, use_transport
+    from common.telegram_app import start_application, stop_applications
+
+    backend = openai
+    if args.mock:
+        backend = MockOpenAI(LatencyModel("normal", args.latency,
+                                          args.latency / 3))
+        use_transport(backend)
+    app = launcher.build_bot(BOT_DIR, "", TOKEN, set())
+    valera = launcher.load_bot_module(BOT_DIR)
+    await start_application(app, polling=True)
+
+    load = Load(args, telegram, app, valera)
+    print(f"Пользователей: {args.users}, разгон {args.ramp:.0f} с, пауза "
+          f"{args.think}, вопросов {args.questions}, модель "
+          f"{'mock' if args.mock else 'фейковый сервер'} {args.latency} с")
+    print(f"{'t, с':>6} {'в деле':>7} {'в боте':>7} {'модель/с':>9} "
+          f"{'перех/с':>9} {'очередь':>7} {'в полёте':>8} {'ожид50':>8} "
+          f"{'ожид95':>8}")
+    timeline: List[dict] = []
+    sampler = asyncio.create_task(sample(load, backend, timeline,
+                                         args.report_every))
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(load.user(1_000_000 + i)
+                               for i in range(args.users)))
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        rss_after = rss_mb()
+        await stop_applications([app])
+        await close_async_client()
+        await telegram.stop()
+        await openai.stop()
+    print_summary(load, timeline, elapsed, backend.requests,
+                  (rss_before, rss_after))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=20,
+                        help="за сколько секунд приходят все пользователи")
+    parser.add_argument("--think", default="exp:1",
+                        help="пауза перед сообщением: fixed:S, exp:MEAN, "
+                             "normal:MEAN,SD, uniform:A,B")
+    parser.add_argument("--questions", type=int, default=3,
+                        help="вопросов после знакомства")
+    parser.add_argument("--name-mix",
+                        default="male=0.4,female=0.4,unknown=0.1,none=0.1",
+                        help="какое имя называют: мужское, женское, "
+                             "неоднозначное или никакое")
+    parser.add_argument("--gender-mix",
+                        default="male=0.45,female=0.45,unknown=0.1",
+                        help="ответ на вопрос о поле")
+    parser.add_argument("--named", type=float, default=0.2,
+                        help="доля пользователей с настоящим именем в профиле")
+    parser.add_argument("--latency", type=float, default=0.3,
+                        help="задержка модели, с")
+    parser.add_argument("--mock", action="store_true",
+                        help="MockOpenAI в процессе вместо HTTP-сервера")
+    parser.add_argument("--reply-timeout", type=float, default=60)
+    parser.add_argument("--report-every", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,201 @@
+"""Воспроизводит апдейты Telegram с заданной частотой и меряет латентность.
+
+Бот запускается целиком — с Application, обработчиками и HTTP-клиентом
+Bot API — против фейковых серверов Telegram и OpenAI. Апдейты доставляются
+либо через getUpdates (polling), либо POST-запросами на webhook, так что
+оба режима можно сравнить по времени от апдейта до первого ответа в чат.
+
+Апдейты берутся из JSONL-файла (по объекту Update на строку, например
+`curl .../getUpdates | jq -c '.result[]'` на тестовом боте) или
+генерируются: /start и несколько вопросов от каждого пользователя.
+
+    python benchmarks/replay_updates.py --mode polling --rate 50
+    python benchmarks/replay_updates.py --mode webhook --rate 50 --bot hub
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+
+BOTS = {
+    "valera": "Valera_test_4.1_nano",
+    "valera-prod": "Valera_telegrambot",
+    "hub": "GPT_hub_bot",
+}
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+
+
+def load_bot(name: str):
+    """Импортирует модуль бота; окружение к этому моменту уже настроено"""
+    if name == "hub":
+        from benchmarks.bench_hub_mixed import load_hub
+        return load_hub()
+    from benchmarks.bench_valera_async import load_valera
+    return load_valera(BOTS[name])
+
+
+def synthetic_updates(users: int, messages: int) -> List[dict]:
+    """/start и вопросы от users пользователей вперемешку"""
+    texts = ["/start"] + [f"Вопрос номер {i}" for i in range(messages)]
+    updates = []
+    for text in texts:
+        for user in range(users):
+            user_id = 5_000_000 + user
+            message = {
+                "message_id": len(updates) + 1,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False,
+                         "first_name": "Сергей", "username": f"user{user_id}"},
+                "text": text,
+            }
+            if text.startswith("/"):
+                message["entities"] = [
+                    {"type": "bot_command", "offset": 0, "length": len(text)}
+                ]
+            updates.append({"update_id": 0, "message": message})
+    return updates
+
+
+def read_updates(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def chat_id_of(update: dict) -> int:
+    for key in ("message", "edited_message", "callback_query"):
+        if key in update:
+            payload = update[key]
+            message = payload.get("message", payload)
+            return message["chat"]["id"]
+    return 0
+
+
+async def start_polling(app) -> None:
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.updater.start_polling(poll_interval=0, timeout=10)
+    await app.start()
+
+
+async def stop_polling(app) -> None:
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+
+async def replay(args, telegram: FakeTelegram, deliver) -> float:
+    updates = (read_updates(args.updates) if args.updates
+               else synthetic_updates(args.users, args.messages))
+    started = time.perf_counter()
+    for i, update in enumerate(updates):
+        # Держим темп по расписанию, а не паузой после каждой отправки
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = dict(update, update_id=i + 1)
+        if "message" in update:
+            update["message"] = dict(update["message"], date=int(time.time()))
+        telegram.expect_reply(chat_id_of(update), time.perf_counter())
+        await deliver(update)
+    sent_for = time.perf_counter() - started
+
+    deadline = time.perf_counter() + args.drain
+    while telegram.pending_replies and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    return len(updates) / sent_for if sent_for else 0.0
+
+
+async def main(args) -> None:
+    openai = FakeOpenAI(latency=args.latency)
+    telegram = FakeTelegram()
+    await openai.start()
+    await telegram.start()
+    os.environ["OPENAI_BASE_URL"] = openai.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["TELEGRAM_API_URL"] = telegram.url
+    os.environ.setdefault("STREAM_REPLIES", "0")
+
+    bot = load_bot(args.bot)
+    app = bot.build_application(TOKEN)
+
+    if args.mode == "polling":
+        await start_polling(app)
+
+        async def deliver(update):
+            telegram.push_update(update)
+
+        rate = await replay(args, telegram, deliver)
+        await stop_polling(app)
+    else:
+        from common.webhook import WebhookServer, serve_webhook
+        server = WebhookServer(app, secret=SECRET, host="127.0.0.1", port=0)
+        stop = asyncio.Event()
+        serving = asyncio.create_task(
+            serve_webhook(app, url="", server=server, stop=stop)
+        )
+        while not server.http.port:
+            await asyncio.sleep(0.01)
+        client = httpx.AsyncClient(
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+            limits=httpx.Limits(max_connections=100),
+        )
+
+        posts = set()
+
+        async def deliver(update):
+            # Telegram не ждёт конца обработки: шлёт параллельно
+            task = asyncio.create_task(client.post(server.url, json=update))
+            posts.add(task)
+            task.add_done_callback(posts.discard)
+
+        rate = await replay(args, telegram, deliver)
+        await asyncio.gather(*posts)
+        stop.set()
+        await serving
+        await client.aclose()
+
+    stats = summarize(telegram.latencies)
+    print(f"Режим: {args.mode}, бот: {args.bot}, "
+          f"задержка модели: {args.latency:.3f} с")
+    print(f"Отправлено со скоростью {rate:.1f} апдейтов/с, "
+          f"без ответа: {telegram.pending_replies}")
+    print(f"{'count':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8}")
+    print(f"{stats['count']:>6} {stats['p50_ms']:>8.0f} "
+          f"{stats['p90_ms']:>8.0f} {stats['p99_ms']:>8.0f} "
+          f"{stats['max_ms']:>8.0f}")
+
+    await telegram.stop()
+    await openai.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bot", choices=sorted(BOTS), default="valera")
+    parser.add_argument("--mode", choices=["polling", "webhook"],
+                        default="polling")
+    parser.add_argument("--updates", help="JSONL с записанными апдейтами")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=50.0,
+                        help="апдейтов в секунду")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--drain", type=float, default=30.0,
+                        help="сколько ждать ответы после отправки, с")
+    asyncio.run(main(parser.parse_args()))
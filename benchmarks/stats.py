@@ -0,0 +1,31 @@
+"""Вспомогательные функции статистики для бенчмарков"""
+from typing import Dict, List, Union
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль p (0..100) без интерполяции"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Сводка латентностей в миллисекундах"""
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p90_ms": percentile(values, 90) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (max(values) if values else 0.0) * 1000,
+    }
+
+
+def rss_mb(pid: Union[int, str] = "self") -> float:
+    """Резидентная память процесса (VmRSS) в МБ; только Linux"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
@@ -0,0 +1,120 @@
+"""Стресс-тест порядка апдейтов: тысячи пользователей, сообщения вперемешку.
+
+Апдейты проходят через настоящий Application (очередь, процессор,
+обработчики), а обработчик со случайными паузами пишет протокол
+«начал/закончил» по каждому пользователю. Порядок нарушен, если
+сообщения одного пользователя обрабатывались одновременно или не по
+очереди. Для сравнения тот же поток прогоняется через стандартный
+SimpleUpdateProcessor.
+
+    python benchmarks/stress_update_order.py --users 5000 --messages 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+
+
+def make_update(update_id: int, user_id: int, seq: int) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        "text": str(seq),
+    }}
+
+
+def violations(transcripts) -> int:
+    """Сколько пользователей видели сообщения не по порядку или внахлёст"""
+    broken = 0
+    for events in transcripts.values():
+        expected = [(kind, seq) for seq in range(len(events) // 2)
+                    for kind in ("start", "end")]
+        if events != expected:
+            broken += 1
+    return broken
+
+
+async def run(processor, concurrency: int, users: int, messages: int,
+              max_delay: float):
+    from telegram import Update
+    from telegram.ext import MessageHandler, filters
+    from common.telegram_app import application_builder
+
+    transcripts = defaultdict(list)
+    done = asyncio.Event()
+    total = users * messages
+    handled = 0
+
+    async def record(update, context):
+        nonlocal handled
+        user_id, seq = update.effective_user.id, int(update.message.text)
+        transcripts[user_id].append(("start", seq))
+        await asyncio.sleep(random.random() * max_delay)
+        transcripts[user_id].append(("end", seq))
+        handled += 1
+        if handled == total:
+            done.set()
+
+    app = (application_builder("123456:stress", concurrency)
+           .concurrent_updates(processor).build())
+    app.add_handler(MessageHandler(filters.TEXT, record))
+    await app.initialize()
+    await app.start()
+
+    # Все сообщения с номером seq приходят раньше сообщений seq + 1,
+    # а внутри раунда пользователи перемешаны
+    started = time.perf_counter()
+    update_id = 0
+    for seq in range(messages):
+        order = list(range(users))
+        random.shuffle(order)
+        for user in order:
+            update_id += 1
+            await app.update_queue.put(Update.de_json(
+                make_update(update_id, 1000 + user, seq), app.bot
+            ))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    active = getattr(app.update_processor, "active_users", 0)
+    await app.stop()
+    await app.shutdown()
+    return violations(transcripts), elapsed, active
+
+
+async def main(args) -> None:
+    telegram = FakeTelegram()
+    await telegram.start()
+    os.environ["TELEGRAM_API_URL"] = telegram.url
+    from telegram.ext import SimpleUpdateProcessor
+    from common.update_processor import PerUserUpdateProcessor
+
+    print(f"{args.users} пользователей × {args.messages} сообщений")
+    print(f"{'processor':>22} {'broken users':>13} {'updates/s':>10} "
+          f"{'locks left':>11}")
+    total = args.users * args.messages
+    for processor in (SimpleUpdateProcessor(args.concurrency),
+                      PerUserUpdateProcessor(args.concurrency)):
+        broken, elapsed, active = await run(processor, args.concurrency,
+                                            args.users, args.messages,
+                                            args.max_delay)
+        print(f"{type(processor).__name__:>22} {broken:>13} "
+              f"{total / elapsed:>10.0f} {active:>11}")
+    await telegram.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--max-delay", type=float, default=0.005,
+                        help="наибольшая пауза внутри обработчика, с")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,76 @@
+"""Заглушки объектов Telegram для прямого вызова обработчиков в бенчмарках"""
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+
+class FakeMessage:
+    """Сообщение, которое запоминает ответы бота вместо отправки"""
+
+    def __init__(self, text: str, chat_id: int, replies: List[dict]):
+        self.text = text
+        self.chat_id = chat_id
+        self.message_id = len(replies) + 1
+        self._replies = replies
+
+    async def reply_text(self, text: str, **kwargs):
+        self._replies.append({"text": text, "at": time.perf_counter()})
+        return FakeMessage(text, self.chat_id, self._replies)
+
+    async def reply_photo(self, photo, **kwargs):
+        self._replies.append({"photo": photo, "at": time.perf_counter()})
+        return FakeMessage("", self.chat_id, self._replies)
+
+    async def edit_text(self, text: str, **kwargs):
+        self._replies.append({
+            "edit": text, "at": time.perf_counter()
+        })
+        self.text = text
+        return self
+
+
+class FakeUpdate:
+    """Апдейт с пользователем и текстовым сообщением"""
+
+    def __init__(self, user_id: int, text: str,
+                 first_name: Optional[str] = None,
+                 replies: Optional[List[dict]] = None):
+        self.replies = replies if replies is not None else []
+        self.effective_user = SimpleNamespace(
+            id=user_id, first_name=first_name, username=f"user{user_id}"
+        )
+        self.effective_chat = SimpleNamespace(id=user_id)
+        self.message = FakeMessage(text, user_id, self.replies)
+
+
+def fake_context(user_data: Optional[dict] = None):
+    """Минимальный ContextTypes.DEFAULT_TYPE для вызова обработчиков"""
+    return SimpleNamespace(
+        user_data=user_data if user_data is not None else {},
+        bot_data={}, args=[],
+    )
+
+
+class FakeCallbackQuery:
+    """Нажатие inline-кнопки"""
+
+    def __init__(self, data: str, chat_id: int, replies: List[dict]):
+        self.data = data
+        self._replies = replies
+        self.message = FakeMessage("", chat_id, replies)
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text: str, **kwargs):
+        self._replies.append({"edit": text, "at": time.perf_counter()})
+        return self.message
+
+
+class FakeCallbackUpdate(FakeUpdate):
+    """Апдейт с нажатием кнопки вместо сообщения"""
+
+    def __init__(self, user_id: int, data: str):
+        super().__init__(user_id, "")
+        self.message = None
+        self.callback_query = FakeCallbackQuery(data, user_id, self.replies)
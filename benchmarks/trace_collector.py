@@ -0,0 +1,126 @@
+"""Заглушка коллектора OTLP/HTTP и разбор трасс: куда ушло время апдейта.
+
+Принимает POST /v1/traces в JSON-кодировке OTLP (как шлёт
+common/tracing.py при TRACE_OTLP_URL) или читает TRACE_FILE. По каждому
+имени спана печатает число, p50/p99 и долю от времени корневых спанов
+"update"; так видно, что съело время: очередь апдейтов (dispatch),
+планировщик OpenAI (queue), модель (model_call) или Bot API (send).
+
+    python benchmarks/trace_collector.py --port 4318
+    TRACE_SAMPLE_RATE=0.1 TRACE_OTLP_URL=http://127.0.0.1:4318/v1/traces python main.py
+    python benchmarks/trace_collector.py --file traces.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.stats import summarize  # noqa: E402
+from common.http_server import HTTPServer, Request, Response  # noqa: E402
+
+
+def spans_of(payload: dict) -> List[dict]:
+    """Спаны из ExportTraceServiceRequest"""
+    return [span
+            for resource in payload.get("resourceSpans", [])
+            for scope in resource.get("scopeSpans", [])
+            for span in scope.get("spans", [])]
+
+
+def duration(span: dict) -> float:
+    return (int(span["endTimeUnixNano"])
+            - int(span["startTimeUnixNano"])) / 1e9
+
+
+class Collector:
+    """Копит спаны и считает разбивку по именам"""
+
+    def __init__(self, out: str = ""):
+        self.spans: List[dict] = []
+        self.out = out
+
+    def add(self, payload: dict) -> int:
+        spans = spans_of(payload)
+        self.spans.extend(spans)
+        if self.out:
+            with open(self.out, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        return len(spans)
+
+    async def handle(self, request: Request) -> Response:
+        if request.method != "POST" or request.path != "/v1/traces":
+            return Response(b"not found", 404)
+        self.add(request.json())
+        return Response.json({})
+
+    def report(self) -> str:
+        by_name: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        for span in self.spans:
+            by_name[span["name"]].append(duration(span))
+            if span.get("status", {}).get("code") == 2:
+                errors[span["name"]] += 1
+        total = sum(by_name.get("update", [])) or 1.0
+        traces = len({span["traceId"] for span in self.spans})
+        lines = [f"Трасс: {traces}, спанов: {len(self.spans)}",
+                 f"{'спан':<14} {'число':>7} {'p50 мс':>8} {'p99 мс':>8} "
+                 f"{'доля':>6} {'ошибок':>7}"]
+        for name, values in sorted(by_name.items(),
+                                   key=lambda item: -sum(item[1])):
+            s = summarize(values)
+            lines.append(
+                f"{name:<14} {s['count']:>7} {s['p50_ms']:>8.1f} "
+                f"{s['p99_ms']:>8.1f} {sum(values) / total:>6.0%} "
+                f"{errors[name]:>7}"
+            )
+        return "\n".join(lines)
+
+
+async def serve(collector: Collector, args) -> None:
+    # Пачка спанов из буфера экспортёра бывает в десятки мегабайт
+    server = HTTPServer(collector.handle, args.host, args.port,
+                        max_body=64 * 2**20)
+    await server.start()
+    print(f"Коллектор слушает {server.url}/v1/traces")
+    shown = 0
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            if len(collector.spans) != shown:
+                shown = len(collector.spans)
+                print(collector.report() + "\n")
+    finally:
+        await server.stop()
+
+
+def main(args) -> None:
+    collector = Collector(args.out)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    collector.add(json.loads(line))
+        print(collector.report())
+        return
+    try:
+        asyncio.run(serve(collector, args))
+    except KeyboardInterrupt:
+        print(collector.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--report", type=float, default=10,
+                        help="раз в сколько секунд печатать разбивку")
+    parser.add_argument("--out", default="",
+                        help="дописывать принятые пачки в этот файл")
+    parser.add_argument("--file", default="",
+                        help="разобрать файл TRACE_FILE вместо приёма")
+    main(parser.parse_args())
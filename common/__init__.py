@@ -0,0 +1 @@
+"""Общие модули для всех ботов Bot-lab"""
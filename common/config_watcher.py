@@ -0,0 +1,146 @@
+"""Горячая перезагрузка JSON-настроек без перезапуска бота.
+
+ConfigWatcher раз в CONFIG_RELOAD_INTERVAL секунд сравнивает mtime и
+размер отслеживаемых файлов. Изменившийся файл читается, разбирается и
+превращается в готовый неизменяемый снимок в отдельном потоке, а в цикле
+событий остаётся только подмена ссылки. Если файл битый (или его как раз
+дописывает editor.py), бот продолжает работать со старым снимком. Время
+перезагрузок и ошибки попадают в /metrics (config_reload_*).
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common import metrics
+
+# Как часто проверять файлы, секунды; 0 — не следить
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", "2"))
+
+Stamp = Optional[Tuple[int, int]]
+
+
+def file_stamp(path: str) -> Stamp:
+    """(mtime_ns, размер) файла или None, если его нет"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class WatchedFile:
+    """Файл, функция сборки снимка и функция его подмены"""
+
+    __slots__ = ("path", "build", "apply", "stamp", "reloads", "failures",
+                 "last_error", "last_reload_ms", "reloaded_at")
+
+    def __init__(self, path: str, build: Callable[[Any], Any],
+                 apply: Callable[[Any], None]):
+        self.path = path
+        self.build = build
+        self.apply = apply
+        # Файл уже загружен при старте: перечитываем только изменения
+        self.stamp = file_stamp(path)
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = ""
+        self.last_reload_ms = 0.0
+        self.reloaded_at = 0.0
+
+
+def _read_and_build(item: WatchedFile) -> Tuple[Stamp, Any]:
+    """Выполняется в потоке: чтение, разбор JSON и сборка снимка"""
+    before = file_stamp(item.path)
+    with open(item.path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    snapshot = item.build(data)
+    return before, snapshot
+
+
+class ConfigWatcher:
+    """Следит за файлами настроек и подменяет снимки при изменениях"""
+
+    def __init__(self, interval: float = CONFIG_RELOAD_INTERVAL):
+        self.interval = interval
+        self._files: List[WatchedFile] = []
+
+    def watch(self, path: str, build: Callable[[Any], Any],
+              apply: Callable[[Any], None]) -> None:
+        """build(data) собирает снимок из JSON, apply(snapshot) его ставит.
+
+        build выполняется в потоке и должен бросать исключение на
+        неподходящих данных; apply вызывается в цикле событий.
+        """
+        self._files.append(WatchedFile(path, build, apply))
+
+    async def check(self) -> int:
+        """Один проход по файлам; возвращает число перезагруженных"""
+        reloaded = 0
+        for item in self._files:
+            stamp = file_stamp(item.path)
+            # Удалённый файл не трогаем: остаётся последний снимок
+            if stamp is None or stamp == item.stamp:
+                continue
+            started = time.perf_counter()
+            labels = (os.path.basename(item.path),)
+            try:
+                before, snapshot = await asyncio.to_thread(
+                    _read_and_build, item
+                )
+                if before != file_stamp(item.path):
+                    # Файл меняли, пока мы его читали — заберём на следующем
+                    # проходе
+                    continue
+                item.apply(snapshot)
+            except Exception as e:
+                item.stamp = stamp
+                item.failures += 1
+                item.last_error = f"{type(e).__name__}: {e}"
+                metrics.CONFIG_RELOAD_ERRORS.inc(labels)
+                print(f"Не удалось перечитать {item.path}: {item.last_error}. "
+                      "Оставляю прежние настройки.")
+                continue
+            item.stamp = before
+            item.reloads += 1
+            item.last_error = ""
+            elapsed = time.perf_counter() - started
+            item.last_reload_ms = elapsed * 1000
+            metrics.CONFIG_RELOAD_SECONDS.observe(elapsed, labels)
+            item.reloaded_at = time.time()
+            reloaded += 1
+            print(f"Перечитан {item.path} за {item.last_reload_ms:.0f} мс")
+        return reloaded
+
+    async def run(self) -> None:
+        """Фоновая задача: проверяет файлы, пока её не отменят"""
+        if self.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Метрики перезагрузок по каждому файлу"""
+        return {
+            item.path: {
+                "reloads": item.reloads,
+                "failures": item.failures,
+                "last_reload_ms": item.last_reload_ms,
+                "reloaded_at": item.reloaded_at,
+                "last_error": item.last_error,
+            }
+            for item in self._files
+        }
+
+    def report(self) -> str:
+        lines = []
+        for path, s in self.snapshot().items():
+            line = (f"{os.path.basename(path)}: перезагрузок {s['reloads']}, "
+                    f"ошибок {s['failures']}, последняя "
+                    f"{s['last_reload_ms']:.0f} мс")
+            if s["last_error"]:
+                line += f" ({s['last_error']})"
+            lines.append(line)
+        return "\n".join(lines)
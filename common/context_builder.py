@@ -0,0 +1,86 @@
+"""Сборка контекста для модели в пределах бюджета токенов"""
+import math
+import os
+from typing import List, Optional, Sequence
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Бюджет по умолчанию, если у персонажа нет "context_tokens"
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "2000"))
+# Служебные токены chat-формата на каждое сообщение (роль, разделители)
+MESSAGE_OVERHEAD = 4
+# Без токенизатора считаем грубо: в среднем ~3 символа русского текста на токен
+CHARS_PER_TOKEN = 3
+
+SUMMARY_HEADER = "Краткое содержание вашего прошлого разговора: "
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding, tiktoken
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # Словарь токенизатора не скачался — работаем на оценке
+            print(f"Токенизатор недоступен ({e}), считаю токены приближённо")
+            tiktoken = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов в тексте (tiktoken, если установлен, иначе оценка)"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def make_message(role: str, content: str) -> dict:
+    """Сообщение для истории с заранее посчитанными токенами"""
+    return {
+        "role": role,
+        "content": content,
+        "tokens": count_tokens(content) + MESSAGE_OVERHEAD,
+    }
+
+
+def message_tokens(message: dict) -> int:
+    """Токены сообщения; посчитанное значение сохраняется в самом сообщении"""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message["content"]) + MESSAGE_OVERHEAD
+        message["tokens"] = tokens
+    return tokens
+
+
+def build_context(system_prompt: str, history: Sequence[dict], budget: int,
+                  system_tokens: Optional[int] = None,
+                  summary: str = "") -> List[dict]:
+    """Системный промпт плюс самые свежие сообщения, влезающие в budget.
+
+    Последнее сообщение (текущий вопрос) попадает в контекст всегда,
+    даже если само по себе больше бюджета. Резюме старой части разговора
+    идёт сразу после системного промпта и тоже расходует бюджет.
+    """
+    if system_tokens is None:
+        system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD
+    used = system_tokens
+    head = [{"role": "system", "content": system_prompt}]
+    if summary:
+        summary_text = SUMMARY_HEADER + summary
+        head.append({"role": "system", "content": summary_text})
+        used += count_tokens(summary_text) + MESSAGE_OVERHEAD
+    selected = []
+    for message in reversed(history):
+        tokens = message_tokens(message)
+        if selected and used + tokens > budget:
+            break
+        selected.append({"role": message["role"], "content": message["content"]})
+        used += tokens
+    selected.reverse()
+    return [*head, *selected]
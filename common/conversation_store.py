@@ -0,0 +1,300 @@
+"""Хранилище диалогов: LRU-кэш сессий в памяти поверх SQLite (WAL)"""
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Сколько последних сообщений пользователя хранится (кольцевой буфер)
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "50"))
+# Сколько сессий держим в памяти; остальные живут только в SQLite
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+# Как часто и какими пачками изменённые сессии пишутся на диск
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "1.0"))
+FLUSH_BATCH_SIZE = int(os.getenv("FLUSH_BATCH_SIZE", "500"))
+
+
+class Session:
+    """Состояние диалога одного пользователя"""
+
+    __slots__ = ("user_id", "state", "gender", "counter", "history",
+                 "summary", "character", "released")
+
+    def __init__(self, user_id: int, state: str = "initial",
+                 gender: str = "unknown", counter: int = 0,
+                 history: Iterable[dict] = (),
+                 history_limit: int = HISTORY_LIMIT,
+                 summary: str = "", character: str = ""):
+        self.user_id = user_id
+        self.state = state
+        self.gender = gender
+        self.counter = counter
+        self.history = deque(history, maxlen=history_limit)
+        # Сжатое содержание сообщений, ушедших из истории
+        self.summary = summary
+        # Персонаж, выбранный в этом чате; пустой — персонаж бота
+        self.character = character
+        # Сессию отдали другому процессу (см. ConversationStore.release):
+        # её больше нельзя сохранять
+        self.released = False
+
+    def to_row(self) -> tuple:
+        return (
+            self.user_id, self.state, self.gender, self.counter,
+            json.dumps(list(self.history), ensure_ascii=False),
+            self.summary, self.character, int(time.time()),
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple, history_limit: int) -> "Session":
+        user_id, state, gender, counter, history, summary, character = row[:7]
+        return cls(user_id, state, gender, counter, json.loads(history),
+                   history_limit, summary, character)
+
+
+class ConversationBackend(abc.ABC):
+    """Интерфейс постоянного хранилища сессий"""
+
+    # Вызовы ходят на диск: load выполняется в отдельном потоке
+    blocking = True
+
+    @abc.abstractmethod
+    def load(self, user_id: int) -> Optional[tuple]:
+        """Строка сессии или None, если пользователя ещё нет"""
+
+    @abc.abstractmethod
+    def save_many(self, rows: List[tuple]) -> None:
+        """Записывает пачку строк одной транзакцией"""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(ConversationBackend):
+    """Хранит сериализованные сессии в словаре (для тестов и бенчмарков)"""
+
+    blocking = False
+
+    def __init__(self):
+        self.rows: Dict[int, tuple] = {}
+
+    def load(self, user_id: int) -> Optional[tuple]:
+        return self.rows.get(user_id)
+
+    def save_many(self, rows: List[tuple]) -> None:
+        for row in rows:
+            self.rows[row[0]] = row
+
+
+class SQLiteBackend(ConversationBackend):
+    """SQLite в режиме WAL: чтение и запись идут через разные соединения"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = self._connect()
+        self._writer.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL,
+            gender TEXT NOT NULL,
+            counter INTEGER NOT NULL,
+            history TEXT NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            character TEXT NOT NULL DEFAULT '',
+            updated_at INTEGER NOT NULL
+        )
+        """)
+        # Базы, созданные до появления резюме и выбора персонажа,
+        # получают недостающие колонки
+        columns = {
+            row[1] for row in self._writer.execute("PRAGMA table_info(sessions)")
+        }
+        for column in ("summary", "character"):
+            if column not in columns:
+                self._writer.execute(
+                    f"ALTER TABLE sessions ADD COLUMN {column} "
+                    "TEXT NOT NULL DEFAULT ''"
+                )
+        self._writer.commit()
+        # WAL позволяет читать параллельно с записью через второе соединение
+        self._reader = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self, user_id: int) -> Optional[tuple]:
+        return self._reader.execute(
+            "SELECT user_id, state, gender, counter, history, summary, "
+            "character FROM sessions WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+
+    def save_many(self, rows: List[tuple]) -> None:
+        with self._writer:
+            self._writer.executemany(
+                "INSERT OR REPLACE INTO sessions "
+                "(user_id, state, gender, counter, history, summary, "
+                "character, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
+
+
+class ConversationStore:
+    """LRU-кэш сессий с отложенной пакетной записью в бэкенд"""
+
+    def __init__(self, backend: ConversationBackend,
+                 cache_size: int = SESSION_CACHE_SIZE,
+                 history_limit: int = HISTORY_LIMIT,
+                 batch_size: int = FLUSH_BATCH_SIZE):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.history_limit = history_limit
+        self.batch_size = batch_size
+        self._cache: "OrderedDict[int, Session]" = OrderedDict()
+        self._dirty: Dict[int, Session] = {}
+        # Сессии из пачки, которая прямо сейчас пишется на диск
+        self._writing: Dict[int, Session] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="conversation-store"
+        )
+        # Чтения идут своим потоком, чтобы не ждать за пачкой записи
+        self._reader = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="conversation-store-read"
+        )
+        # Загрузки с диска в процессе: второй get того же пользователя ждёт их
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def peek(self, user_id: int) -> Optional[Session]:
+        """Сессия из памяти без обращения к диску и без сдвига в LRU"""
+        return (self._cache.get(user_id) or self._dirty.get(user_id)
+                or self._writing.get(user_id))
+
+    async def get(self, user_id: int) -> Session:
+        """Возвращает сессию пользователя, создавая новую при первом обращении"""
+        session = self._cache.get(user_id)
+        if session is not None:
+            self._cache.move_to_end(user_id)
+            return session
+
+        # Вытесненная, но ещё не записанная сессия всё ещё главная копия
+        session = self._dirty.get(user_id) or self._writing.get(user_id)
+        if session is not None:
+            self._remember(session)
+            return session
+
+        if not self.backend.blocking:
+            return self._loaded(user_id, self.backend.load(user_id))
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = loading
+            loading.add_done_callback(
+                lambda _: self._loading.pop(user_id, None)
+            )
+        return await asyncio.shield(loading)
+
+    async def _load(self, user_id: int) -> Session:
+        loop = asyncio.get_running_loop()
+        row = await loop.run_in_executor(
+            self._reader, self.backend.load, user_id
+        )
+        return self._loaded(user_id, row)
+
+    def _loaded(self, user_id: int, row: Optional[tuple]) -> Session:
+        # Пока строка читалась, сессию могли сохранить — она новее
+        session = self.peek(user_id)
+        if session is None:
+            if row is not None:
+                session = Session.from_row(row, self.history_limit)
+            else:
+                session = Session(user_id, history_limit=self.history_limit)
+        self._remember(session)
+        return session
+
+    def save(self, session: Session) -> None:
+        """Помечает сессию изменённой; на диск она попадёт при flush"""
+        if session.released:
+            # Устаревшая копия затёрла бы строку, которую пишет новый владелец
+            return
+        self._dirty[session.user_id] = session
+        if session.user_id not in self._cache:
+            self._remember(session)
+
+    def _remember(self, session: Session) -> None:
+        self._cache[session.user_id] = session
+        while len(self._cache) > self.cache_size:
+            # Грязные сессии остаются в _dirty до записи, так что не теряются
+            self._cache.popitem(last=False)
+
+    async def flush(self) -> int:
+        """Пишет изменённые сессии пачками в отдельном потоке"""
+        async with self._flush_lock:
+            written = 0
+            loop = asyncio.get_running_loop()
+            while self._dirty:
+                for user_id in list(self._dirty)[:self.batch_size]:
+                    self._writing[user_id] = self._dirty.pop(user_id)
+                rows = [session.to_row() for session in self._writing.values()]
+                try:
+                    await loop.run_in_executor(
+                        self._executor, self.backend.save_many, rows
+                    )
+                except Exception:
+                    for user_id, session in self._writing.items():
+                        self._dirty.setdefault(user_id, session)
+                    raise
+                finally:
+                    self._writing.clear()
+                written += len(rows)
+            return written
+
+    async def release(self, moved: Callable[[int], bool]) -> int:
+        """Сбрасывает на диск и забывает сессии, которые теперь ведёт другой процесс"""
+        await self.flush()
+        gone = {user_id for user_id in [*self._cache, *self._dirty]
+                if moved(user_id)}
+        for user_id in gone:
+            session = self._cache.pop(user_id, None)
+            session = self._dirty.pop(user_id, None) or session
+            if session is not None:
+                session.released = True
+        return len(gone)
+
+    async def run_flusher(self, interval: float = FLUSH_INTERVAL) -> None:
+        """Фоновая задача: периодически сбрасывает изменения на диск"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ошибка записи сессий: {e}")
+
+    async def close(self) -> None:
+        await self.flush()
+        self._reader.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+        self.backend.close()
+
+
+def create_store(path: Optional[str] = None) -> ConversationStore:
+    """Создаёт хранилище по переменной окружения CONVERSATION_STORE"""
+    kind = os.getenv("CONVERSATION_STORE", "sqlite")
+    if kind == "memory":
+        return ConversationStore(MemoryBackend())
+    path = path or os.getenv("CONVERSATION_DB", "conversations.db")
+    return ConversationStore(SQLiteBackend(path))
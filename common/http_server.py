@@ -0,0 +1,230 @@
+"""Минимальный асинхронный HTTP/1.1 сервер для служебных эндпоинтов.
+
+Разбор и сборку HTTP/1.1 делает h11 (он уже стоит как зависимость httpx),
+здесь — только чтение из сокета, лимиты и таймауты.
+"""
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import h11
+
+# Предельный размер тела запроса: апдейт Telegram весит несколько КБ
+HTTP_MAX_BODY = int(os.getenv("HTTP_MAX_BODY", str(256 * 1024)))
+HTTP_MAX_HEADERS = 100
+# Предельный размер строки запроса и заголовков вместе
+HTTP_MAX_HEAD = 16 * 1024
+READ_SIZE = 64 * 1024
+# Сколько ждём следующий запрос на keep-alive соединении и сколько —
+# заголовки и тело уже начатого запроса
+HTTP_IDLE_TIMEOUT = float(os.getenv("HTTP_IDLE_TIMEOUT", "75"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+REASONS = {
+    200: "OK", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+    403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests",
+    431: "Request Header Fields Too Large", 500: "Internal Server Error",
+    501: "Not Implemented", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """Запрос не разобран: отвечаем статусом и закрываем соединение"""
+
+    def __init__(self, status: int = 400):
+        super().__init__(REASONS.get(status, ""))
+        self.status = status
+
+
+class Request:
+    """Входящий HTTP-запрос"""
+
+    def __init__(self, method: str, target: str,
+                 headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        if not self.body:
+            return {}
+        return json.loads(self.body)
+
+
+class Response:
+    """Ответ сервера"""
+
+    def __init__(self, body: bytes = b"", status: int = 200,
+                 content_type: str = "text/plain; charset=utf-8",
+                 headers: Optional[Dict[str, str]] = None,
+                 stream: Optional[AsyncIterator[bytes]] = None):
+        self.body = body
+        self.status = status
+        self.headers = {"Content-Type": content_type, **(headers or {})}
+        # Если задан stream, тело отдаётся кусками (chunked)
+        self.stream = stream
+
+    @classmethod
+    def json(cls, data, status: int = 200,
+             headers: Optional[Dict[str, str]] = None) -> "Response":
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return cls(body, status, "application/json", headers)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """Обслуживает keep-alive соединения и передаёт запросы в handler"""
+
+    def __init__(self, handler: Handler, host: str = "127.0.0.1",
+                 port: int = 0, max_body: int = HTTP_MAX_BODY,
+                 idle_timeout: float = HTTP_IDLE_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._serve, self.host, self.port, backlog=1024
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(),
+                                 return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _serve(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        conn = h11.Connection(h11.SERVER,
+                              max_incomplete_event_size=HTTP_MAX_HEAD)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(conn, reader)
+                except HTTPError as e:
+                    if conn.our_state in (h11.IDLE, h11.SEND_RESPONSE):
+                        await self._write_response(writer, conn, Response(
+                            str(e).encode("utf-8"), e.status,
+                            headers={"Connection": "close"},
+                        ))
+                    break
+                if request is None:
+                    break
+                try:
+                    response = await self.handler(request)
+                except Exception as e:
+                    # Текст исключения остаётся в логе, клиенту он ни к чему
+                    print(f"Ошибка обработчика {request.method} "
+                          f"{request.path}: {type(e).__name__}: {e}")
+                    response = Response(REASONS[500].encode("utf-8"), 500)
+                await self._write_response(writer, conn, response)
+                if conn.our_state is not h11.DONE \
+                        or conn.their_state is not h11.DONE:
+                    # Connection: close с любой стороны
+                    break
+                conn.start_next_cycle()
+        except (ConnectionError, asyncio.TimeoutError, h11.ProtocolError):
+            # Молчащий или оборвавшийся клиент не держит соединение вечно
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _read_request(self, conn: h11.Connection,
+                            reader: asyncio.StreamReader) -> Optional[Request]:
+        loop = asyncio.get_running_loop()
+        # Следующий запрос на keep-alive соединении ждём idle_timeout, а
+        # начатый запрос целиком должен прийти за read_timeout
+        deadline: Optional[float] = None
+        request: Optional[h11.Request] = None
+        body = bytearray()
+        while True:
+            try:
+                event = conn.next_event()
+            except h11.RemoteProtocolError as e:
+                raise HTTPError(e.error_status_hint)
+            if event is h11.NEED_DATA:
+                if deadline is None:
+                    timeout = self.idle_timeout
+                else:
+                    timeout = deadline - loop.time()
+                data = await asyncio.wait_for(reader.read(READ_SIZE), timeout)
+                if deadline is None:
+                    deadline = loop.time() + self.read_timeout
+                conn.receive_data(data)
+            elif isinstance(event, h11.Request):
+                request = event
+                headers = request.headers
+                if len(headers) > HTTP_MAX_HEADERS:
+                    raise HTTPError(431)
+                # Telegram и наши клиенты шлют Content-Length; chunked-тело
+                # не принимаем, чтобы не было двух способов узнать его длину
+                if any(name == b"transfer-encoding" for name, _ in headers):
+                    raise HTTPError(501)
+                for name, value in headers:
+                    if name == b"content-length" \
+                            and int(value) > self.max_body:
+                        raise HTTPError(413)
+            elif isinstance(event, h11.Data):
+                body += event.data
+                if len(body) > self.max_body:
+                    raise HTTPError(413)
+            elif isinstance(event, h11.EndOfMessage):
+                return Request(
+                    request.method.decode("latin-1"),
+                    request.target.decode("latin-1"),
+                    {name.decode("latin-1"): value.decode("latin-1")
+                     for name, value in request.headers},
+                    bytes(body),
+                )
+            else:
+                # ConnectionClosed: клиент закрыл соединение между запросами
+                return None
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter,
+                              conn: h11.Connection,
+                              response: Response) -> None:
+        headers = list(response.headers.items())
+        if response.stream is None:
+            headers.append(("Content-Length", str(len(response.body))))
+        else:
+            headers.append(("Transfer-Encoding", "chunked"))
+        writer.write(conn.send(h11.Response(
+            status_code=response.status, headers=headers,
+            reason=REASONS.get(response.status, ""),
+        )))
+        if response.stream is None:
+            if response.body:
+                writer.write(conn.send(h11.Data(data=response.body)))
+        else:
+            async for chunk in response.stream:
+                if chunk:
+                    writer.write(conn.send(h11.Data(data=chunk)))
+                    await writer.drain()
+        writer.write(conn.send(h11.EndOfMessage()))
+        await writer.drain()
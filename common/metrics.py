@@ -0,0 +1,371 @@
+"""Метрики в формате Prometheus: счётчики, гистограммы, gauge и /metrics.
+
+Все записи делаются из потока цикла событий, поэтому обходятся без
+блокировок: счётчик — сложение в словаре, наблюдение гистограммы —
+bisect по границам корзин и два сложения. Накопительные суммы по корзинам
+и значения gauge считаются только при чтении /metrics.
+
+Сервер /metrics поднимается, если задан METRICS_PORT, и слушает
+METRICS_HOST (по умолчанию только localhost):
+
+    METRICS_PORT=9100 python main.py
+    curl -s localhost:9100/metrics
+"""
+import functools
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.http_server import HTTPServer, Request, Response
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Порт /metrics; пусто — сервер не запускается, но метрики всё равно пишутся
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+
+# Границы корзин по умолчанию, секунды: от быстрых команд до DALL·E
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_labels(names: Sequence[str], values: Labels,
+                   extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Общее у всех метрик: имя, описание, метки и значения по запросу.
+
+    track(labels, fn) подключает значение, которое считается только при
+    чтении /metrics (размер кэша, очередь планировщика). Несколько функций
+    с одинаковыми метками складываются.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str,
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._functions: Dict[Labels, List[Callable[[], float]]] = {}
+
+    def track(self, labels: Labels, fn: Callable[[], float]) -> None:
+        self._functions.setdefault(tuple(labels), []).append(fn)
+
+    def _tracked(self) -> Dict[Labels, float]:
+        values = {}
+        for labels, functions in self._functions.items():
+            try:
+                values[labels] = sum(fn() for fn in functions)
+            except Exception as e:
+                print(f"Метрика {self.name}{labels} не посчиталась: {e}")
+        return values
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} "
+            f"{_format_value(value)}"
+            for labels, value in self._tracked().items()
+        ]
+
+    def render(self) -> str:
+        lines = self.samples()
+        if not lines:
+            return ""
+        head = [f"# HELP {self.name} {self.help}",
+                f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(head + lines) + "\n"
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str,
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        for labels, value in self._tracked().items():
+            values[labels] = values.get(labels, 0) + value
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} "
+            f"{_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Текущее значение: заданное через set или посчитанное при чтении"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str,
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self._values[labels] = value
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        values.update(self._tracked())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} "
+            f"{_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Распределение по корзинам: на метки — список счётчиков и сумма"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1),
+                                             0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.labelnames, labels, le)} "
+                    f"{cumulative}"
+                )
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Метрики процесса по именам; повторная регистрация отдаёт ту же"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str,
+                labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str,
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+registry = Registry()
+
+# ——— метрики ботов ———
+
+HANDLER_SECONDS = registry.histogram(
+    "bot_handler_seconds", "Время обработчика апдейта",
+    ("bot", "handler", "mode", "character"),
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Исключения, вылетевшие из обработчиков",
+    ("bot", "handler", "type"),
+)
+CALL_SECONDS = registry.histogram(
+    "bot_call_seconds",
+    "Время ask_gpt, draw_image, generate_response с очередью и кэшем",
+    ("bot", "function"),
+)
+UPDATES_IN_PROGRESS = registry.gauge(
+    "bot_users_in_progress", "Пользователи с необработанными апдейтами",
+    ("bot_id",),
+)
+ACTIVE_SESSIONS = registry.gauge(
+    "bot_active_sessions", "Сессии в памяти (LRU-кэш ConversationStore)",
+    ("bot", "character"),
+)
+
+# ——— OpenAI ———
+
+OPENAI_SECONDS = registry.histogram(
+    "openai_request_seconds", "Время одной попытки запроса к OpenAI",
+    ("api", "model"),
+)
+OPENAI_TOKENS = registry.counter(
+    "openai_tokens_total", "Токены из usage ответов OpenAI",
+    ("model", "kind"),
+)
+OPENAI_ERRORS = registry.counter(
+    "openai_errors_total", "Ошибки запросов к OpenAI по типу исключения",
+    ("api", "type"),
+)
+
+# ——— горячая перезагрузка настроек ———
+
+CONFIG_RELOAD_SECONDS = registry.histogram(
+    "config_reload_seconds",
+    "Время перезагрузки файла настроек: чтение, разбор и подмена снимка",
+    ("file",), (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+CONFIG_RELOAD_ERRORS = registry.counter(
+    "config_reload_errors_total",
+    "Перезагрузки, после которых остались прежние настройки",
+    ("file",),
+)
+
+
+def observe_usage(model: str, usage) -> None:
+    """Токены из usage ответа (обычного или последнего чанка стрима)"""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc((model, "prompt"), usage.prompt_tokens or 0)
+    OPENAI_TOKENS.inc((model, "completion"), usage.completion_tokens or 0)
+
+
+class HandlerTimer:
+    """Контекстный менеджер: время обработчика и вылетевшие исключения"""
+
+    __slots__ = ("labels", "started")
+
+    def __init__(self, bot: str, handler: str, mode: str = "",
+                 character: str = ""):
+        self.labels = (bot, handler, mode, character)
+
+    def __enter__(self) -> "HandlerTimer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        HANDLER_SECONDS.observe(time.perf_counter() - self.started,
+                                self.labels)
+        if exc_type is not None:
+            HANDLER_ERRORS.inc(self.labels[:2] + (exc_type.__name__,))
+        return False
+
+
+def instrument_handler(bot: str,
+                       labels: Optional[Callable[..., Tuple[str, str]]] = None):
+    """Декоратор обработчика PTB: labels(update, context) -> (режим, персонаж)"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            mode, character = labels(update, context) if labels else ("", "")
+            with HandlerTimer(bot, handler.__name__, mode, character):
+                return await handler(update, context)
+        return wrapper
+    return decorate
+
+
+def timed(bot: str):
+    """Декоратор корутины: время вызова в bot_call_seconds"""
+    def decorate(fn):
+        labels = (bot, fn.__name__)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                CALL_SECONDS.observe(time.perf_counter() - started, labels)
+        return wrapper
+    return decorate
+
+
+# ——— /metrics ———
+
+_server: Optional[HTTPServer] = None
+_users = 0
+
+
+async def handle(request: Request) -> Response:
+    if request.path != "/metrics":
+        return Response(b"not found", 404)
+    return Response(registry.render().encode("utf-8"),
+                    content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def start_server(port: str = METRICS_PORT) -> None:
+    """Запускает /metrics один раз на процесс; парный вызов — stop_server"""
+    global _server, _users
+    _users += 1
+    if _server is not None or not port:
+        return
+    server = HTTPServer(handle, METRICS_HOST, int(port))
+    try:
+        await server.start()
+    except OSError as e:
+        print(f"Не удалось открыть /metrics на порту {port}: {e}")
+        return
+    _server = server
+    print(f"Метрики: {server.url}/metrics")
+
+
+async def stop_server() -> None:
+    """Останавливает /metrics, когда его отпустил последний бот процесса"""
+    global _server, _users
+    _users = max(0, _users - 1)
+    if _users == 0 and _server is not None:
+        await _server.stop()
+        _server = None
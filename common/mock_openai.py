@@ -0,0 +1,255 @@
+"""Офлайн-замена OpenAI для нагрузочных тестов (mock_mode в settings.json).
+
+MockOpenAI — транспорт httpx для общего клиента OpenAI: запросы не уходят
+в сеть, а получают синтетический ответ в формате API. Планировщик,
+повторы, разбор ответа SDK и стриминг при этом остаются настоящими, так
+что нагрузочный прогон меряет собственные накладные расходы бота без
+шума и стоимости OpenAI.
+
+Настройки — объект "mock" рядом с "mock_mode":
+
+    "mock": {
+      "latency": {"distribution": "normal", "mean": 0.8, "stddev": 0.3},
+      "errors": {"rate_limit": 0.02, "timeout": 0.01},
+      "timeout_after": 5,
+      "first_token": 0.25,
+      "chunks": 16
+    }
+
+distribution — fixed (всегда mean), normal или replay: задержки берутся
+случайно из файла "trace" (по числу секунд на строку или JSON-объекты с
+полем "latency"). first_token — доля задержки до первого токена при
+stream=True, chunks — на сколько кусков режется потоковый ответ.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+
+DISTRIBUTIONS = ("fixed", "normal", "replay")
+DEFAULT_REPLIES = (
+    "Отвали, я занят.",
+    "Сам догадайся.",
+    "Ты серьёзно? Ладно, хрен с тобой, помогу.",
+    "Мне лень. Но если коротко — всё у тебя получится, не ной.",
+)
+MOCK_IMAGE_URL = "https://example.com/mock.png"
+
+
+def load_trace(path: str) -> List[float]:
+    """Задержки реальных ответов в секундах из файла трассы"""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            value = json.loads(line)
+            if isinstance(value, dict):
+                value = value["latency"]
+            samples.append(float(value))
+    if not samples:
+        raise ValueError(f"в трассе {path} нет задержек")
+    return samples
+
+
+class LatencyModel:
+    """Распределение задержки ответа модели"""
+
+    __slots__ = ("distribution", "mean", "stddev", "samples", "_random")
+
+    def __init__(self, distribution: str = "fixed", mean: float = 0.5,
+                 stddev: float = 0.0, samples: Sequence[float] = (),
+                 rng: Optional[random.Random] = None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"неизвестное распределение {distribution}")
+        if distribution == "replay" and not samples:
+            raise ValueError("для replay нужна трасса задержек")
+        self.distribution = distribution
+        self.mean = mean
+        self.stddev = stddev
+        self.samples = list(samples)
+        self._random = rng or random.Random()
+
+    @classmethod
+    def from_config(cls, config: dict, base_dir: str = "",
+                    rng: Optional[random.Random] = None) -> "LatencyModel":
+        distribution = config.get("distribution", "fixed")
+        samples: List[float] = []
+        if distribution == "replay":
+            samples = load_trace(os.path.join(base_dir, config["trace"]))
+        return cls(distribution, float(config.get("mean", 0.5)),
+                   float(config.get("stddev", 0.0)), samples, rng)
+
+    def sample(self) -> float:
+        if self.distribution == "replay":
+            return self._random.choice(self.samples)
+        if self.distribution == "normal":
+            return max(0.0, self._random.gauss(self.mean, self.stddev))
+        return self.mean
+
+
+class MockOpenAI(httpx.AsyncBaseTransport):
+    """Отвечает на chat/completions и images/generations сам, без сети"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None,
+                 rate_limit: float = 0.0, timeout: float = 0.0,
+                 timeout_after: float = 5.0, first_token: float = 0.25,
+                 chunks: int = 16, replies: Sequence[str] = DEFAULT_REPLIES,
+                 rng: Optional[random.Random] = None):
+        self._random = rng or random.Random()
+        self.latency = latency or LatencyModel(rng=self._random)
+        # Доли запросов, которые получат 429 или повиснут до таймаута
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+        self.timeout_after = timeout_after
+        self.first_token = first_token
+        self.chunks = max(1, chunks)
+        self.replies = list(replies)
+        self.requests = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.tokens = 0
+
+    @classmethod
+    def from_settings(cls, config: dict, base_dir: str = "") -> "MockOpenAI":
+        """MockOpenAI по объекту "mock" из settings.json"""
+        # seed делает прогоны с ошибками воспроизводимыми
+        rng = random.Random(config.get("seed"))
+        errors = config.get("errors", {})
+        return cls(
+            LatencyModel.from_config(config.get("latency", {}), base_dir, rng),
+            rate_limit=float(errors.get("rate_limit", 0.0)),
+            timeout=float(errors.get("timeout", 0.0)),
+            timeout_after=float(config.get("timeout_after", 5.0)),
+            first_token=float(config.get("first_token", 0.25)),
+            chunks=int(config.get("chunks", 16)),
+            replies=config.get("replies") or DEFAULT_REPLIES,
+            rng=rng,
+        )
+
+    async def handle_async_request(self, request: httpx.Request
+                                   ) -> httpx.Response:
+        self.requests += 1
+        body = json.loads(await request.aread() or b"{}")
+        roll = self._random.random()
+        if roll < self.rate_limit:
+            self.rate_limited += 1
+            return httpx.Response(429, json={"error": {
+                "message": "Rate limit reached (mock)",
+                "type": "requests", "code": "rate_limit_exceeded",
+            }})
+        if roll < self.rate_limit + self.timeout:
+            self.timeouts += 1
+            await asyncio.sleep(self.timeout_after)
+            raise httpx.ReadTimeout("mock timeout", request=request)
+
+        delay = self.latency.sample()
+        path = request.url.path
+        if path.endswith("/images/generations"):
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json={
+                "created": int(time.time()),
+                "data": [{"url": MOCK_IMAGE_URL}],
+            })
+        if not path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {
+                "message": f"{path} не поддерживается mock_mode",
+                "type": "invalid_request_error",
+            }})
+
+        text = self._random.choice(self.replies)
+        # Примерно как у OpenAI: 4 символа на токен
+        prompt_tokens = sum(
+            len(str(m.get("content", ""))) for m in body.get("messages", [])
+        ) // 4
+        completion_tokens = len(text) // 4 + 1
+        self.tokens += prompt_tokens + completion_tokens
+        model = body.get("model", "mock")
+        if body.get("stream"):
+            usage = None
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": prompt_tokens,
+                         "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+            return httpx.Response(
+                200, headers={"content-type": "text/event-stream"},
+                content=self._stream(model, text, delay, usage),
+            )
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    async def _stream(self, model: str, text: str, delay: float,
+                      usage: Optional[dict] = None) -> AsyncIterator[bytes]:
+        """SSE-чанки: первый через first_token задержки, остальные равномерно"""
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        step = max(1, -(-len(text) // self.chunks))
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        await asyncio.sleep(delay * self.first_token)
+        rest = delay * (1 - self.first_token) / max(1, len(pieces) - 1)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(rest)
+            yield _sse(chunk_id, model, {"content": piece}, None)
+        yield _sse(chunk_id, model, {}, "stop")
+        if usage is not None:
+            # Как у OpenAI при stream_options.include_usage: чанк без choices
+            yield _usage_sse(chunk_id, model, usage)
+        yield b"data: [DONE]\n\n"
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "timeouts": self.timeouts,
+            "tokens": self.tokens,
+        }
+
+    def report(self) -> str:
+        return (f"mock_mode: запросов {self.requests}, 429 — "
+                f"{self.rate_limited}, таймаутов {self.timeouts}")
+
+
+def _sse(chunk_id: str, model: str, delta: dict,
+         finish_reason: Optional[str]) -> bytes:
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta,
+                     "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+
+
+def _usage_sse(chunk_id: str, model: str, usage: dict) -> bytes:
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "usage": usage,
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
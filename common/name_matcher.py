@@ -0,0 +1,113 @@
+"""Поиск имени в сообщении и определение пола по словарю имён.
+
+Словарь (name_gender_map.json) разворачивается один раз при старте: к
+каждому имени добавляются его падежные формы от Petrovich («Сашей»,
+«Лёхе»), а ё приравнивается к е. Дальше поиск — один проход скомпилированной
+регуляркой по словам сообщения и поиск в словаре.
+"""
+import re
+from typing import Dict, Iterable, Optional
+
+from petrovich.enums import Case, Gender
+from petrovich.main import Petrovich
+
+# Имена, чьи падежные формы — обычные слова («любви», «милой», «славу»);
+# для них узнаём только словарные варианты
+COMMON_WORD_NAMES = frozenset({"вера", "любовь", "надежда", "слава", "мила",
+                               "рая"})
+# После этих слов стоит имя: «меня зовут Саша», «я Настя», «это Женя»
+INTRO_WORDS = frozenset({"я", "зовут", "это", "звать"})
+
+_WORD = re.compile(r"[а-яё]+(?:-[а-яё]+)?", re.IGNORECASE)
+
+
+def normalize(word: str) -> str:
+    return word.lower().replace("ё", "е")
+
+
+def flatten_name_map(raw_map: Dict[str, Dict[str, Dict[str, str]]]
+                     ) -> Dict[str, str]:
+    """{раздел: {имя: {вариант: пол}}} из JSON в {вариант: пол}"""
+    name_map: Dict[str, str] = {}
+    for variants_by_name in raw_map.values():
+        for variants in variants_by_name.values():
+            for name, gender in variants.items():
+                name_map[name.lower()] = gender
+    return name_map
+
+
+def inflect(name: str, gender: str,
+            petrovich: Optional[Petrovich] = None) -> Iterable[str]:
+    """Косвенные падежи имени.
+
+    Правила Petrovich для мужских имён не склоняют имена на -а/-я
+    («Саша», «Лёха»), поэтому, если род ничего не дал, пробуем женские
+    правила — склонение у таких имён одинаковое.
+    """
+    petrovich = petrovich or Petrovich()
+    if gender == "female":
+        order = (Gender.FEMALE, Gender.MALE)
+    else:
+        order = (Gender.MALE, Gender.FEMALE)
+    for grammatical in order:
+        forms = {petrovich.firstname(name, case, grammatical)
+                 for case in Case.CASES}
+        forms.discard(name)
+        if forms:
+            return forms
+    return set()
+
+
+class NameMatcher:
+    """Словарь всех форм имён с поиском по тексту"""
+
+    def __init__(self, name_map: Dict[str, str], inflected: bool = True):
+        genders: Dict[str, str] = {}
+        if inflected:
+            petrovich = Petrovich()
+            for name, gender in name_map.items():
+                if normalize(name) in COMMON_WORD_NAMES:
+                    continue
+                for form in inflect(name, gender, petrovich):
+                    key = normalize(form)
+                    # Форма, общая для мужского и женского имени («Яну»),
+                    # пол не определяет
+                    known = genders.get(key, gender)
+                    genders[key] = gender if known == gender else "unknown"
+        # Словарные варианты важнее сгенерированных форм
+        for name, gender in name_map.items():
+            genders[normalize(name)] = gender
+        self.genders = genders
+
+    def __len__(self) -> int:
+        return len(self.genders)
+
+    def gender_of(self, name: str) -> str:
+        """Пол по имени (первое слово), в любом падеже"""
+        words = name.split()
+        if not words:
+            return "unknown"
+        return self.genders.get(normalize(words[0]), "unknown")
+
+    def extract(self, text: str) -> str:
+        """Имя из сообщения в том виде, как его написали, или ''.
+
+        Имя сразу после «меня зовут»/«я»/«это» важнее первого попавшегося
+        («Привет, Валера! Я Аня»).
+        """
+        # Замена ё на е и смена регистра не меняют границ слов
+        keys = _WORD.findall(normalize(text))
+        # Большинство реплик имён не содержит: отсекаем их одним
+        # пересечением множеств без цикла на Python
+        if self.genders.keys().isdisjoint(keys):
+            return ""
+        found = -1
+        for i, key in enumerate(keys):
+            if key not in self.genders:
+                continue
+            if i and keys[i - 1] in INTRO_WORDS:
+                found = i
+                break
+            if found < 0:
+                found = i
+        return _WORD.findall(text)[found]
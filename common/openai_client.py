@@ -0,0 +1,73 @@
+"""Общий асинхронный клиент OpenAI с пулом HTTP-соединений"""
+import os
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from common.openai_scheduler import scheduler_for_path
+
+# Размер пула соединений к OpenAI: столько запросов может ждать ответа модели
+# одновременно, не открывая новых TCP/TLS-соединений
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "100"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+_client: Optional[AsyncOpenAI] = None
+# Сколько ботов процесса держат общий клиент (см. hold_async_client)
+_users = 0
+# Подменный транспорт httpx (см. common/mock_openai.py); None — настоящий OpenAI
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+async def _observe_rate_limits(response: httpx.Response) -> None:
+    # Заголовки x-ratelimit-* подсказывают планировщику, сколько осталось
+    scheduler_for_path(response.request.url.path).observe_headers(
+        response.headers
+    )
+
+
+def use_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """Клиенты, созданные после вызова, ходят через transport, а не в сеть"""
+    global _transport
+    _transport = transport
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Возвращает общий AsyncOpenAI, создавая его при первом обращении"""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+            event_hooks={"response": [_observe_rate_limits]},
+            transport=_transport,
+        )
+        _client = AsyncOpenAI(
+            # Подменному транспорту ключ не нужен, а SDK без ключа не создаётся
+            api_key=os.getenv("OPENAI_API_KEY")
+            or ("sk-mock" if _transport is not None else None),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+            # Повторами при 429/5xx управляет планировщик, а не SDK
+            max_retries=0,
+        )
+    return _client
+
+
+def hold_async_client() -> None:
+    """Бот пользуется общим клиентом; парный вызов — close_async_client"""
+    global _users
+    _users += 1
+
+
+async def close_async_client(*_args) -> None:
+    """Закрывает общий клиент, когда его отпустил последний бот процесса"""
+    global _client, _users
+    _users = max(0, _users - 1)
+    if _users == 0 and _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,366 @@
+"""Общий планировщик запросов к OpenAI: приоритеты, AIMD и повторы.
+
+Все запросы бота к модели проходят через OpenAIScheduler.run(). Он
+держит очередь по приоритетам, ограничивает число одновременных запросов
+лимитом, который растёт на единицу за «окно» успешных ответов и делится
+пополам на 429 (AIMD), по заголовкам x-ratelimit-* растягивает остаток
+минутного бюджета до его сброса и повторяет запросы с экспоненциальной
+задержкой со случайным разбросом.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+from common import metrics, tracing
+
+# Приоритеты: чем меньше, тем раньше
+PRIORITY_PAID = 0
+PRIORITY_NORMAL = 1
+# Фоновые задачи (резюме диалогов) уступают ответам пользователям
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_PAID: "paid", PRIORITY_NORMAL: "normal",
+                  PRIORITY_BACKGROUND: "background"}
+
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "32"))
+OPENAI_CONCURRENCY_MIN = int(os.getenv("OPENAI_CONCURRENCY_MIN", "2"))
+OPENAI_CONCURRENCY_MAX = int(os.getenv("OPENAI_CONCURRENCY_MAX", "256"))
+IMAGE_API_CONCURRENCY = int(os.getenv("IMAGE_API_CONCURRENCY", "4"))
+IMAGE_API_CONCURRENCY_MAX = int(os.getenv("IMAGE_API_CONCURRENCY_MAX", "16"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_RETRY_BASE = float(os.getenv("OPENAI_RETRY_BASE", "0.5"))
+OPENAI_RETRY_MAX = float(os.getenv("OPENAI_RETRY_MAX", "20"))
+# Сколько запрос может ждать своей очереди, прежде чем сдаться
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "60"))
+
+T = TypeVar("T")
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class SchedulerBusy(Exception):
+    """Запрос слишком долго простоял в очереди"""
+
+
+def parse_duration(value: str) -> float:
+    """'6m0s', '1.5s', '20ms' из x-ratelimit-reset-* в секунды"""
+    return sum(float(n) * _UNITS[unit] for n, unit in _DURATION.findall(value))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class OpenAIScheduler:
+    """Очередь с приоритетами и адаптивным лимитом одновременных запросов"""
+
+    def __init__(self, name: str, limit: int = OPENAI_CONCURRENCY,
+                 min_limit: int = OPENAI_CONCURRENCY_MIN,
+                 max_limit: int = OPENAI_CONCURRENCY_MAX,
+                 max_retries: int = OPENAI_MAX_RETRIES,
+                 retry_base: float = OPENAI_RETRY_BASE,
+                 retry_max: float = OPENAI_RETRY_MAX,
+                 queue_timeout: float = OPENAI_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        # Темп выдачи слотов, пока бюджет запросов OpenAI на исходе
+        self._pace_interval = 0.0
+        self._pace_until = 0.0
+        self._next_at = 0.0
+        self._resume_handle: Optional[asyncio.TimerHandle] = None
+        self._last_decrease = 0.0
+        # Метрики
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.retries = 0
+        self.timeouts = 0
+        self._waits: deque = deque(maxlen=1000)
+
+    # ——— очередь ———
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def _ready_at(self) -> float:
+        return max(self._paused_until, self._next_at)
+
+    def _has_slot(self) -> bool:
+        return (self.in_flight < max(1, int(self.limit))
+                and time.monotonic() >= self._ready_at())
+
+    def _take_slot(self) -> None:
+        self.in_flight += 1
+        now = time.monotonic()
+        if now < self._pace_until:
+            self._next_at = now + self._pace_interval
+
+    async def _acquire(self, priority: int) -> None:
+        started = time.monotonic()
+        if not self._queue and self._has_slot():
+            self._take_slot()
+            self._waits.append(0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise SchedulerBusy(
+                f"OpenAI ({self.name}): очередь не дошла за "
+                f"{self.queue_timeout:.0f} с"
+            ) from None
+        except asyncio.CancelledError:
+            # Слот могли выдать в момент отмены — возвращаем его
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        self._waits.append(time.monotonic() - started)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue and self._has_slot():
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._take_slot()
+            future.set_result(None)
+        delay = self._ready_at() - time.monotonic()
+        if self._queue and delay > 0 and self._resume_handle is None:
+            self._resume_handle = asyncio.get_running_loop().call_later(
+                delay, self._resume
+            )
+
+    def _resume(self) -> None:
+        self._resume_handle = None
+        self._dispatch()
+
+    # ——— AIMD ———
+
+    def _on_success(self) -> None:
+        self.completed += 1
+        # +1 к лимиту за каждые limit успешных ответов
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_throttle(self, retry_after: Optional[float]) -> None:
+        self.throttled += 1
+        now = time.monotonic()
+        # Волна 429 от одного всплеска уменьшает лимит один раз
+        if now - self._last_decrease >= 1.0:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = now
+        if retry_after:
+            self.pause(retry_after)
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать новых слотов ближайшие seconds секунд"""
+        self._paused_until = max(self._paused_until,
+                                 time.monotonic() + seconds)
+
+    def pace(self, interval: float, seconds: float) -> None:
+        """Ближайшие seconds секунд выдавать слоты не чаще раза в interval"""
+        self._pace_interval = interval
+        self._pace_until = time.monotonic() + seconds
+
+    def observe_headers(self, headers) -> None:
+        """Учитывает x-ratelimit-* из ответа OpenAI.
+
+        remaining — бюджет до сброса окна, а не число одновременных
+        запросов, поэтому лимит AIMD он не трогает: пустой бюджет ставит
+        выдачу на паузу, а остаток запросов растягивается до сброса.
+        """
+        for resource in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{resource}")
+            if remaining is None or not remaining.isdigit():
+                continue
+            reset = parse_duration(
+                headers.get(f"x-ratelimit-reset-{resource}", "")
+            )
+            if int(remaining) == 0:
+                self.pause(reset or 1.0)
+            elif resource != "requests":
+                continue
+            elif reset and int(remaining) < self.limit:
+                self.pace(reset / int(remaining), reset)
+            else:
+                # Новое окно: бюджета хватает, темп больше не нужен
+                self._pace_until = self._next_at = 0.0
+
+    # ——— запуск ———
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        ceiling = min(self.retry_max, self.retry_base * 2 ** attempt)
+        delay = random.uniform(0, ceiling)
+        return max(delay, retry_after or 0.0)
+
+    async def run(self, fn: Callable[..., Awaitable[T]], *args,
+                  priority: int = PRIORITY_NORMAL, **kwargs) -> T:
+        """Выполняет fn(*args, **kwargs) в свой черёд, повторяя при 429/5xx"""
+        model = kwargs.get("model", "")
+        with tracing.span("model_call", tracing.KIND_CLIENT, **{
+            "openai.api": self.name, "openai.model": model,
+        }):
+            return await self._run(fn, args, kwargs, priority, model)
+
+    async def _run(self, fn: Callable[..., Awaitable[T]], args: tuple,
+                   kwargs: dict, priority: int, model: str) -> T:
+        attempt = 0
+        while True:
+            queued = tracing.span("queue")
+            try:
+                await self._acquire(priority)
+            finally:
+                queued.end()
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except RateLimitError as e:
+                self._release()
+                self._observe(model, started, error=e)
+                # Кончились деньги на счёте — повторять бесполезно
+                if getattr(e, "code", None) == "insufficient_quota":
+                    self.failed += 1
+                    raise
+                retry_after = _retry_after(e)
+                self._on_throttle(retry_after)
+                error: Exception = e
+            except (InternalServerError, APIConnectionError) as e:
+                self._release()
+                self._observe(model, started, error=e)
+                retry_after = _retry_after(e)
+                error = e
+            except Exception as e:
+                self._release()
+                self._observe(model, started, error=e)
+                self.failed += 1
+                raise
+            except BaseException:
+                self._release()
+                self.failed += 1
+                raise
+            else:
+                self._release()
+                self._on_success()
+                self._observe(model, started, result=result)
+                return result
+
+            if attempt >= self.max_retries:
+                self.failed += 1
+                raise error
+            self.retries += 1
+            tracing.annotate(**{"openai.retries": attempt + 1})
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    def _observe(self, model: str, started: float, result=None,
+                 error: Optional[Exception] = None) -> None:
+        """Время попытки, токены из usage и ошибки — в common/metrics.py"""
+        metrics.OPENAI_SECONDS.observe(time.perf_counter() - started,
+                                       (self.name, model))
+        if error is not None:
+            metrics.OPENAI_ERRORS.inc((self.name, type(error).__name__))
+            tracing.annotate(**{"openai.error": type(error).__name__})
+            return
+        # У потокового ответа usage нет: его учитывает streaming.py
+        usage = getattr(result, "usage", None)
+        metrics.observe_usage(model, usage)
+        if usage is not None:
+            tracing.annotate(**{
+                "openai.prompt_tokens": usage.prompt_tokens or 0,
+                "openai.completion_tokens": usage.completion_tokens or 0,
+            })
+
+    def snapshot(self) -> Dict[str, float]:
+        """Текущие метрики для логов и админских команд"""
+        waits = sorted(self._waits)
+        p50 = waits[len(waits) // 2] if waits else 0.0
+        p95 = waits[int(len(waits) * 0.95)] if waits else 0.0
+        depth: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._queue:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "queue_depth": sum(depth.values()),
+            **{f"queue_{name}": count for name, count in depth.items()},
+            "wait_p50_ms": p50 * 1000,
+            "wait_p95_ms": p95 * 1000,
+            "completed": self.completed,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+        }
+
+    def report(self) -> str:
+        s = self.snapshot()
+        return (
+            f"{self.name}: лимит {s['limit']:g}, в работе {s['in_flight']}, "
+            f"в очереди {s['queue_depth']} "
+            f"(платных {s['queue_paid']}), ожидание p50 "
+            f"{s['wait_p50_ms']:.0f} мс / p95 {s['wait_p95_ms']:.0f} мс, "
+            f"429: {s['throttled']}, повторов: {s['retries']}"
+        )
+
+
+chat_scheduler = OpenAIScheduler("chat")
+image_scheduler = OpenAIScheduler(
+    "images", limit=IMAGE_API_CONCURRENCY, min_limit=1,
+    max_limit=IMAGE_API_CONCURRENCY_MAX,
+)
+
+
+def track_metrics(scheduler: OpenAIScheduler) -> None:
+    """Очередь, лимит и повторы планировщика — в /metrics при чтении"""
+    labels = (scheduler.name,)
+    metrics.registry.gauge(
+        "openai_in_flight", "Запросы к OpenAI в работе", ("api",)
+    ).track(labels, lambda: scheduler.in_flight)
+    metrics.registry.gauge(
+        "openai_queue_depth", "Запросы в очереди планировщика", ("api",)
+    ).track(labels, lambda: scheduler.queue_depth)
+    metrics.registry.gauge(
+        "openai_concurrency_limit", "Текущий лимит AIMD", ("api",)
+    ).track(labels, lambda: scheduler.limit)
+    metrics.registry.counter(
+        "openai_retries_total", "Повторы запросов после 429/5xx", ("api",)
+    ).track(labels, lambda: scheduler.retries)
+
+
+track_metrics(chat_scheduler)
+track_metrics(image_scheduler)
+
+
+def scheduler_for_path(path: str) -> OpenAIScheduler:
+    return image_scheduler if "/images/" in path else chat_scheduler
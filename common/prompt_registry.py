@@ -0,0 +1,113 @@
+"""Готовые системные промпты персонажей для каждого пола собеседника.
+
+Склейка строк промпта из characters.json, приписка о поле и подсчёт
+токенов делаются один раз при загрузке. На каждое сообщение остаётся
+один поиск в словаре. При изменении персонажей реестр собирается заново
+и подменяется одной ссылкой, так что запрос никогда не увидит смесь
+старых и новых настроек.
+"""
+from typing import Dict, Iterable, List, Union
+
+from common.context_builder import (
+    DEFAULT_CONTEXT_TOKENS, MESSAGE_OVERHEAD, count_tokens
+)
+
+GENDER_INFO = {
+    "male": "Пол собеседника: мужской.",
+    "female": "Пол собеседника: женский.",
+    "unknown": "Пол собеседника: неизвестно.",
+}
+DEFAULT_MODEL = "gpt-4.1-nano"
+DEFAULT_TEMPERATURE = 0.9
+
+
+class SystemPrompt:
+    """Текст системного промпта и его токены вместе со служебными"""
+
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = count_tokens(text) + MESSAGE_OVERHEAD
+
+
+class Character:
+    """Настройки персонажа с промптами под каждый пол"""
+
+    __slots__ = ("name", "model", "temperature", "context_tokens", "prompts")
+
+    def __init__(self, name: str, config: Union[dict, str]):
+        # editor.py сохраняет персонажа просто строкой промпта
+        if isinstance(config, str):
+            config = {"prompt": config}
+        self.name = name
+        self.model = config.get("model", DEFAULT_MODEL)
+        self.temperature = config.get("temperature", DEFAULT_TEMPERATURE)
+        self.context_tokens = config.get("context_tokens",
+                                         DEFAULT_CONTEXT_TOKENS)
+        base = join_prompt(config.get("prompt", ""))
+        self.prompts: Dict[str, SystemPrompt] = {
+            gender: SystemPrompt(f"{base}\n{info}")
+            for gender, info in GENDER_INFO.items()
+        }
+
+    def prompt(self, gender: str) -> SystemPrompt:
+        return self.prompts.get(gender) or self.prompts["unknown"]
+
+
+def join_prompt(prompt: Union[str, Iterable[str]]) -> str:
+    """В characters.json промпт — список строк, но бывает и одной строкой"""
+    if isinstance(prompt, str):
+        return prompt
+    return " ".join(prompt)
+
+
+class PromptRegistry:
+    """Персонажи по именам; load() подменяет всех разом"""
+
+    def __init__(self, characters: Dict[str, dict], fallback: dict):
+        self._fallback = Character("fallback", fallback)
+        self._characters: Dict[str, Character] = {}
+        try:
+            self.load(characters)
+        except ValueError as e:
+            print(f"Ошибка в описании персонажей: {e}. Использую базовый промпт.")
+
+    @staticmethod
+    def compile(characters: Dict[str, dict]) -> Dict[str, Character]:
+        """Проверяет определения и собирает персонажей (можно в потоке)"""
+        if not isinstance(characters, dict) or not characters:
+            raise ValueError("ожидается непустой объект с персонажами")
+        compiled = {}
+        for name, config in characters.items():
+            if not isinstance(config, (dict, str)):
+                raise ValueError(f"персонаж {name}: ожидается объект")
+            character = Character(name, config)
+            if not isinstance(character.temperature, (int, float)):
+                raise ValueError(f"персонаж {name}: temperature не число")
+            tokens = character.context_tokens
+            if (not isinstance(tokens, int) or isinstance(tokens, bool)
+                    or tokens <= 0):
+                raise ValueError(
+                    f"персонаж {name}: context_tokens не положительное целое"
+                )
+            compiled[name] = character
+        return compiled
+
+    def swap(self, compiled: Dict[str, Character]) -> None:
+        """Подменяет всех персонажей одной ссылкой"""
+        self._characters = compiled
+
+    def load(self, characters: Dict[str, dict]) -> None:
+        """Собирает новый набор персонажей и только потом подменяет старый"""
+        self.swap(self.compile(characters))
+
+    def get(self, name: str) -> Character:
+        """Персонаж по имени, а если его нет — запасной"""
+        return self._characters.get(name) or self._fallback
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._characters
+
+    def names(self) -> List[str]:
+        return list(self._characters)
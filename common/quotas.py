@@ -0,0 +1,340 @@
+"""Квоты по тарифам: ограничение частоты запросов и дневные лимиты в SQLite.
+
+Лимиты берутся из раздела limits тарифа. Для вида запроса kind
+(image_generations, text_requests) понимаются ключи:
+
+- {kind}_per_minute — сколько запросов в минуту (token bucket на
+  пользователя и режим);
+- {kind}_per_day — сколько запросов в сутки (UTC);
+- {kind} — разовый пакет, который расходуется после дневного лимита.
+
+Отсутствующий ключ означает «без ограничений».
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+
+QUOTAS_DB = os.getenv("QUOTAS_DB", "quotas.db")
+# Тариф тех, у кого нет действующей подписки (id из tariffs.json);
+# пустой — без ограничений, как было до тарифов
+DEFAULT_TARIFF = os.getenv("DEFAULT_TARIFF", "")
+QUOTA_FLUSH_INTERVAL = float(os.getenv("QUOTA_FLUSH_INTERVAL", "1.0"))
+# Сколько пользователей и счётчиков частоты держим в памяти
+QUOTA_CACHE_SIZE = int(os.getenv("QUOTA_CACHE_SIZE", "100000"))
+SECONDS_PER_DAY = 86400
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        user_id INTEGER PRIMARY KEY,
+        tariff TEXT NOT NULL,
+        expires_at INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS credits (
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        remaining INTEGER NOT NULL,
+        PRIMARY KEY (user_id, kind)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_usage (
+        user_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day, kind)
+    )
+    """,
+]
+
+
+def today() -> int:
+    return int(time.time()) // SECONDS_PER_DAY
+
+
+class TokenBucket:
+    """per_minute запросов в минуту, не больше per_minute подряд"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class UserQuota:
+    """Тариф, пакеты и расход пользователя за текущие сутки"""
+
+    __slots__ = ("tariff", "expires_at", "credits", "used", "day")
+
+    def __init__(self, tariff: Optional[str], expires_at: Optional[int],
+                 credits: Dict[str, int], used: Dict[str, int], day: int):
+        self.tariff = tariff
+        self.expires_at = expires_at
+        self.credits = credits
+        self.used = used
+        self.day = day
+
+
+class Quotas:
+    """Проверка и учёт квот; изменения пишутся в SQLite пачками"""
+
+    def __init__(self, tariffs: Optional[dict], path: str = QUOTAS_DB,
+                 default_tariff: str = DEFAULT_TARIFF,
+                 cache_size: int = QUOTA_CACHE_SIZE):
+        self.tariffs = tariffs or {}
+        self.default_tariff = default_tariff
+        self.cache_size = cache_size
+        self._users: "OrderedDict[int, UserQuota]" = OrderedDict()
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = (
+            OrderedDict()
+        )
+        self._dirty: Set[int] = set()
+        self._writing: Set[int] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="quotas"
+        )
+        self._conn: Optional[sqlite3.Connection] = None
+        self._flush_lock = asyncio.Lock()
+        self._executor.submit(self._open, path).result()
+
+    def _open(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in TABLES:
+                self._conn.execute(statement)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # ——— состояние пользователя ———
+
+    def _load(self, user_id: int, day: int) -> UserQuota:
+        row = self._conn.execute(
+            "SELECT tariff, expires_at FROM subscriptions WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        credits = dict(self._conn.execute(
+            "SELECT kind, remaining FROM credits WHERE user_id = ?",
+            (user_id,)
+        ))
+        used = dict(self._conn.execute(
+            "SELECT kind, count FROM daily_usage "
+            "WHERE user_id = ? AND day = ?", (user_id, day)
+        ))
+        tariff, expires_at = row if row else (None, None)
+        return UserQuota(tariff, expires_at, credits, used, day)
+
+    async def _state(self, user_id: int) -> UserQuota:
+        day = today()
+        state = self._users.get(user_id)
+        if state is None:
+            loaded = await self._run(self._load, user_id, day)
+            # Пока читали, параллельный запрос мог уже загрузить и изменить
+            state = self._users.setdefault(user_id, loaded)
+            self._evict()
+        self._users.move_to_end(user_id)
+        if state.day != day:
+            state.day = day
+            state.used = {}
+        return state
+
+    def _evict(self) -> None:
+        while len(self._users) > self.cache_size:
+            for user_id in self._users:
+                if user_id not in self._dirty and user_id not in self._writing:
+                    del self._users[user_id]
+                    break
+            else:
+                return
+
+    @staticmethod
+    def _subscription(state: UserQuota) -> Optional[str]:
+        if state.expires_at is not None and state.expires_at < time.time():
+            return None
+        return state.tariff
+
+    def limits(self, state: UserQuota) -> dict:
+        tariff = self._subscription(state) or self.default_tariff
+        return self.tariffs.get(tariff, {}).get("limits", {})
+
+    def is_paid(self, user_id: int) -> bool:
+        """Есть ли у пользователя действующая подписка или пакет"""
+        state = self._users.get(user_id)
+        if state is None:
+            return False
+        return (self._subscription(state) is not None
+                or any(n > 0 for n in state.credits.values()))
+
+    def _bucket(self, user_id: int, mode: str, per_minute: float,
+                now: float) -> TokenBucket:
+        key = (user_id, mode)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != per_minute:
+            bucket = self._buckets[key] = TokenBucket(per_minute, now)
+            # Вытесняется давно неактивный — его ведро всё равно полное
+            if len(self._buckets) > self.cache_size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    # ——— проверки ———
+
+    async def acquire(self, user_id: int, mode: str,
+                      kind: str) -> Tuple[bool, str]:
+        """Резервирует запрос. Возвращает (разрешён, источник или причина).
+
+        Источник: "free" (без лимита), "daily" или "credit"; причина
+        отказа: "rate" (слишком часто) или "daily" (лимит исчерпан).
+        """
+        state = await self._state(user_id)
+        limits = self.limits(state)
+        now = time.monotonic()
+
+        bucket = None
+        per_minute = limits.get(f"{kind}_per_minute")
+        if per_minute is not None:
+            bucket = self._bucket(user_id, mode, per_minute, now)
+            if not bucket.take(now):
+                return False, "rate"
+
+        per_day = limits.get(f"{kind}_per_day")
+        if per_day is None:
+            return True, "free"
+        if state.used.get(kind, 0) < per_day:
+            state.used[kind] = state.used.get(kind, 0) + 1
+            self._dirty.add(user_id)
+            return True, "daily"
+        if state.credits.get(kind, 0) > 0:
+            state.credits[kind] -= 1
+            self._dirty.add(user_id)
+            return True, "credit"
+        if bucket is not None:
+            # Отказанный запрос не должен съедать частоту
+            bucket.tokens += 1
+        return False, "daily"
+
+    def refund(self, user_id: int, kind: str, source: str) -> None:
+        """Возвращает квоту, если запрос к модели не удался"""
+        state = self._users.get(user_id)
+        if state is None:
+            return
+        if source == "daily" and state.used.get(kind, 0) > 0:
+            state.used[kind] -= 1
+        elif source == "credit":
+            state.credits[kind] = state.credits.get(kind, 0) + 1
+        else:
+            return
+        self._dirty.add(user_id)
+
+    async def remaining(self, user_id: int, kind: str) -> Optional[int]:
+        """Сколько запросов ещё доступно сегодня (None — без лимита)"""
+        state = await self._state(user_id)
+        per_day = self.limits(state).get(f"{kind}_per_day")
+        if per_day is None:
+            return None
+        return (max(0, per_day - state.used.get(kind, 0))
+                + state.credits.get(kind, 0))
+
+    # ——— тарифы ———
+
+    def _save_subscription(self, user_id: int, tariff: str,
+                           expires_at: Optional[int]) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO subscriptions "
+                "(user_id, tariff, expires_at) VALUES (?, ?, ?)",
+                (user_id, tariff, expires_at)
+            )
+
+    async def grant(self, user_id: int, tariff_id: str) -> None:
+        """Подключает тариф: подписку на срок или разовый пакет"""
+        tariff = self.tariffs[tariff_id]
+        state = await self._state(user_id)
+        if tariff.get("duration_days"):
+            expires_at = int(time.time()) + tariff["duration_days"] * SECONDS_PER_DAY
+            state.tariff, state.expires_at = tariff_id, expires_at
+            await self._run(self._save_subscription, user_id, tariff_id,
+                            expires_at)
+            return
+        # Пакет без срока: разовые {kind} добавляются к остатку, а лимиты
+        # частоты (*_per_day, *_per_minute) к пакету не относятся
+        for kind, amount in tariff.get("limits", {}).items():
+            if kind.endswith(("_per_day", "_per_minute")):
+                continue
+            state.credits[kind] = state.credits.get(kind, 0) + amount
+        self._dirty.add(user_id)
+        await self.flush()
+
+    # ——— запись ———
+
+    def _write(self, usage, credits) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO daily_usage (user_id, day, kind, count) "
+                "VALUES (?, ?, ?, ?)", usage
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO credits (user_id, kind, remaining) "
+                "VALUES (?, ?, ?)", credits
+            )
+
+    async def flush(self) -> int:
+        """Пишет изменённые счётчики одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            self._writing, self._dirty = self._dirty, set()
+            usage, credits = [], []
+            for user_id in self._writing:
+                state = self._users[user_id]
+                usage.extend((user_id, state.day, kind, count)
+                             for kind, count in state.used.items())
+                credits.extend((user_id, kind, remaining)
+                               for kind, remaining in state.credits.items())
+            try:
+                await self._run(self._write, usage, credits)
+            except Exception:
+                self._dirty |= self._writing
+                raise
+            finally:
+                written = len(self._writing)
+                self._writing = set()
+            return written
+
+    async def run_flusher(self,
+                          interval: float = QUOTA_FLUSH_INTERVAL) -> None:
+        """Фоновая задача: периодически сбрасывает счётчики на диск"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ошибка записи квот: {e}")
+
+    async def close(self) -> None:
+        await self.flush()
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
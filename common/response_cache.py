@@ -0,0 +1,205 @@
+"""Кэш ответов модели для повторяющихся вопросов: TTL + LRU, опционально SQLite"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Сколько секунд ответ считается свежим
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+# Сколько ответов держим в памяти
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+# Файл SQLite, чтобы кэш переживал перезапуск; пусто — только память
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Приводит вопрос к виду, в котором совпадают перефразы регистра и знаков"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def make_key(mode: str, model: str, temperature: float, question: str) -> str:
+    raw = f"{mode}\x1f{model}\x1f{temperature:g}\x1f{normalize_question(question)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """Счётчики кэша по одному режиму"""
+
+    __slots__ = ("hits", "misses", "coalesced", "saved_tokens",
+                 "saved_seconds")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # Запросы, дождавшиеся уже идущего запроса с тем же ключом
+        self.coalesced = 0
+        self.saved_tokens = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.coalesced + self.misses
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+
+class ResponseCache:
+    """LRU с TTL в памяти; при заданном path — ещё и таблица в SQLite"""
+
+    def __init__(self, ttl: int = RESPONSE_CACHE_TTL,
+                 max_size: int = RESPONSE_CACHE_SIZE,
+                 path: str = RESPONSE_CACHE_DB):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (ответ, токены, секунды генерации, истекает в)
+        self._entries: "OrderedDict[str, Tuple[str, int, float, float]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, CacheStats] = defaultdict(CacheStats)
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if path:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="response-cache"
+            )
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """)
+            with self._db:
+                self._db.execute("DELETE FROM responses WHERE expires_at < ?",
+                                 (time.time(),))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_create(
+            self, key: str, mode: str,
+            create: Callable[[], Awaitable[Tuple[str, int]]]) -> str:
+        """Отдаёт ответ из кэша или вызывает create() -> (ответ, токены).
+
+        Одинаковые вопросы, пришедшие одновременно, ждут один запрос к модели.
+        """
+        stats = self.stats[mode]
+        entry = await self._lookup(key)
+        if entry is not None:
+            answer, tokens, seconds, _ = entry
+            stats.hits += 1
+            stats.saved_tokens += tokens
+            stats.saved_seconds += seconds
+            return answer
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            await asyncio.wait({pending})
+            # Если первый запрос упал, спрашиваем модель сами
+            if not pending.cancelled():
+                answer, tokens, seconds = pending.result()
+                stats.coalesced += 1
+                stats.saved_tokens += tokens
+                stats.saved_seconds += seconds
+                return answer
+
+        stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        started = time.perf_counter()
+        try:
+            answer, tokens = await create()
+        except BaseException:
+            future.cancel()
+            self._release(key, future)
+            raise
+        seconds = time.perf_counter() - started
+        entry = (answer, tokens, seconds, time.time() + self.ttl)
+        self._remember(key, entry)
+        future.set_result(entry[:3])
+        self._release(key, future)
+        await self._persist(key, entry)
+        return answer
+
+    def _release(self, key: str, future: asyncio.Future) -> None:
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    async def _lookup(self, key: str) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._load, key
+            )
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        if entry[3] < time.time():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _persist(self, key: str, entry: tuple) -> None:
+        if self._db is not None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._save, key, entry
+                )
+            except sqlite3.Error as e:
+                print(f"Ошибка записи кэша ответов: {e}")
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[tuple]:
+        return self._db.execute(
+            "SELECT answer, tokens, seconds, expires_at FROM responses "
+            "WHERE key = ?", (key,)
+        ).fetchone()
+
+    def _save(self, key: str, entry: tuple) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, answer, tokens, seconds, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)", (key, *entry)
+            )
+
+    def report(self) -> str:
+        """Текстовая сводка попаданий по режимам"""
+        if not self.stats:
+            return "Кэш ответов ещё не использовался."
+        lines = []
+        for mode, s in sorted(self.stats.items()):
+            lines.append(
+                f"{mode}: {s.hit_rate:.0%} из кэша "
+                f"({s.hits} попаданий, {s.coalesced} склеено, "
+                f"{s.misses} промахов), сэкономлено "
+                f"{s.saved_tokens} токенов и {s.saved_seconds:.0f} с"
+            )
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._executor.shutdown(wait=True)
+            self._db.close()
+            self._db = None
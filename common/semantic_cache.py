@@ -0,0 +1,146 @@
+"""Семантический кэш: похожие по смыслу вопросы получают уже готовый ответ.
+
+Вопрос превращается в вектор хэшированных символьных n-грамм (без внешних
+моделей), векторы режима лежат в матрице NumPy, ближайший сосед ищется
+одним умножением матрицы на вектор.
+"""
+import os
+import re
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Минимальное косинусное сходство, при котором ответ переиспользуется
+# (0.7 — без ложных попаданий на benchmarks/data/semantic_questions.json)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.7"))
+# Сколько вопросов помнит каждый режим; дальше старые вытесняются по кругу
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+EMBEDDING_DIM = 1024
+NGRAM_SIZES = (3, 4, 5)
+
+# Слова-обёртки вопроса: по ним «что такое ипотека» и «что такое налог»
+# были бы похожи сильнее, чем «ипотека» и «объясни ипотеку»
+FILLER_WORDS = frozenset("""
+а в во и к как какая какие какой мне мой на о об объясни объясните по
+подробно пожалуйста почему про просто простыми простым расскажи
+расскажите своими словами словах такое такая такой это что зачем
+чем я ли ну можешь можно нужно значит означает работает устроен
+устроено языком
+""".split())
+
+_WORD = re.compile(r"\w+")
+
+
+def embed(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Нормированный вектор хэшированных n-грамм значимых слов вопроса"""
+    words = [w for w in _WORD.findall(text.lower().replace("ё", "е"))
+             if w not in FILLER_WORDS]
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in words:
+        padded = f" {word} "
+        grams = [padded]
+        for n in NGRAM_SIZES:
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        for gram in grams:
+            # crc32 стабилен между перезапусками, в отличие от hash()
+            h = zlib.crc32(gram.encode("utf-8"))
+            vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class SemanticIndex:
+    """Векторы и ответы одного режима в кольцевом буфере фиксированного размера"""
+
+    def __init__(self, size: int, dim: int = EMBEDDING_DIM):
+        self.size = size
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.answers = []
+        self.tokens = []
+        self.expires_at = np.zeros(0, dtype=np.float64)
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def search(self, vector: np.ndarray,
+               now: float) -> Tuple[int, float]:
+        """Индекс и сходство ближайшего живого вопроса (-1, если пусто)"""
+        if not self.answers:
+            return -1, 0.0
+        scores = self.vectors @ vector
+        scores[self.expires_at < now] = -1.0
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def add(self, vector: np.ndarray, answer: str, tokens: int,
+            expires_at: float) -> None:
+        if len(self.answers) < self.size:
+            # Матрица растёт удвоением, чтобы не копировать её на каждом ответе
+            if len(self.answers) == len(self.vectors):
+                grow = min(self.size, max(16, 2 * len(self.vectors)))
+                vectors = np.zeros((grow, self.vectors.shape[1]),
+                                   dtype=np.float32)
+                vectors[:len(self.vectors)] = self.vectors
+                expires = np.zeros(grow, dtype=np.float64)
+                expires[:len(self.expires_at)] = self.expires_at
+                self.vectors, self.expires_at = vectors, expires
+            position = len(self.answers)
+            self.answers.append(answer)
+            self.tokens.append(tokens)
+        else:
+            position = self._next
+            self._next = (self._next + 1) % self.size
+            self.answers[position] = answer
+            self.tokens[position] = tokens
+        self.vectors[position] = vector
+        self.expires_at[position] = expires_at
+
+
+class SemanticCache:
+    """Индексы по режимам и счётчики семантических попаданий"""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 size: int = SEMANTIC_CACHE_SIZE,
+                 ttl: int = SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.size = size
+        self.ttl = ttl
+        self._indexes: Dict[str, SemanticIndex] = {}
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+    def lookup(self, mode: str, question: str) -> Optional[Tuple[str, int]]:
+        """Ответ и его цена в токенах для похожего вопроса, если такой был"""
+        index = self._indexes.get(mode)
+        if index is not None:
+            position, score = index.search(embed(question), time.time())
+            if position >= 0 and score >= self.threshold:
+                self.hits[mode] += 1
+                return index.answers[position], index.tokens[position]
+        self.misses[mode] += 1
+        return None
+
+    def add(self, mode: str, question: str, answer: str,
+            tokens: int = 0) -> None:
+        index = self._indexes.get(mode)
+        if index is None:
+            index = self._indexes[mode] = SemanticIndex(self.size)
+        index.add(embed(question), answer, tokens, time.time() + self.ttl)
+
+    def report(self) -> str:
+        lines = []
+        for mode in sorted(set(self.hits) | set(self.misses)):
+            total = self.hits[mode] + self.misses[mode]
+            lines.append(
+                f"{mode}: {self.hits[mode]} похожих из {total} "
+                f"({self.hits[mode] / total:.0%}), "
+                f"в индексе {len(self._indexes.get(mode) or ())}"
+            )
+        return "\n".join(lines) or "Семантический кэш ещё не использовался."
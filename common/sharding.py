@@ -0,0 +1,446 @@
+"""Шардирование сессий по процессам-воркерам.
+
+Один процесс Python упирается в одно ядро. В шардированном режиме
+процесс-диспетчер принимает апдейты (long polling или webhook) и
+раскладывает их по SHARD_WORKERS дочерним процессам по хэшу user_id.
+Воркер — обычное Application бота без собственного приёма апдейтов:
+сессии его пользователей живут только в нём, ответы он шлёт в Bot API сам.
+
+Пользователи хэшируются в SHARD_SLOTS слотов, слоты раздаются живым
+воркерам rendezvous-хэшированием. Упавший воркер отдаёт свои слоты
+остальным, поднявшийся — забирает их обратно, прочие слоты не двигаются.
+Перед сменой таблицы каждый воркер дорабатывает апдейты уходящих
+пользователей, сбрасывает их сессии на диск и забывает их; новый владелец
+прочитает сессии из общей базы. Поэтому режиму нужно хранилище SQLite:
+с CONVERSATION_STORE=memory переехавшие пользователи начнут диалог заново.
+
+Связь с воркерами — строки JSON через stdin/stdout дочерних процессов.
+Воркер подтверждает каждый обработанный апдейт; неподтверждённые апдейты
+упавшего воркера диспетчер отдаёт новому владельцу. Ответ, отправленный
+прямо перед падением, может поэтому прийти дважды.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import signal
+import sys
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from telegram import Update
+from telegram.ext import Application
+
+from common.conversation_store import ConversationStore
+from common.metrics import METRICS_PORT
+from common.telegram_app import (
+    BOT_MODE, TELEGRAM_API_URL, start_application, stop_applications
+)
+from common.webhook import (
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_REGISTER, WEBHOOK_URL, WebhookServer,
+    stop_on_signals
+)
+
+# Сколько процессов-воркеров; 0 или 1 — обычный запуск в одном процессе
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+# На сколько слотов делятся пользователи; должно быть заметно больше воркеров
+SHARD_SLOTS = int(os.getenv("SHARD_SLOTS", "1024"))
+# Пауза перед перезапуском упавшего воркера, секунды
+SHARD_RESTART_DELAY = float(os.getenv("SHARD_RESTART_DELAY", "1"))
+# Сколько ждать, пока воркеры отдадут пользователей при перебалансировке
+SHARD_REBALANCE_TIMEOUT = float(os.getenv("SHARD_REBALANCE_TIMEOUT", "30"))
+# Номер шарда; выставляется диспетчером в окружении воркера
+SHARD_INDEX_ENV = "SHARD_INDEX"
+# Длинный опрос getUpdates в диспетчере, секунды
+POLL_TIMEOUT = 30
+
+# Строки воркера с этим префиксом — служебные, остальные — его логи
+CONTROL_PREFIX = "@@shard "
+# Самая длинная строка в канале: апдейт или таблица слотов
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+def slot_of(user_id: int, slots: int = SHARD_SLOTS) -> int:
+    return zlib.crc32(str(user_id).encode()) % slots
+
+
+def _weight(shard: int, slot: int) -> bytes:
+    return hashlib.blake2b(f"{shard}:{slot}".encode(), digest_size=8).digest()
+
+
+def build_table(shards: List[int], slots: int = SHARD_SLOTS) -> List[int]:
+    """Владелец каждого слота среди живых воркеров (rendezvous-хэширование).
+
+    У слота побеждает воркер с наибольшим весом, поэтому при уходе или
+    возвращении воркера переезжают только его слоты.
+    """
+    if not shards:
+        return []
+    return [max(shards, key=lambda shard: _weight(shard, slot))
+            for slot in range(slots)]
+
+
+def user_of(data: dict) -> Optional[int]:
+    """id пользователя (или чата) из сырого апдейта без разбора в объекты PTB"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user.get("id")
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+    return None
+
+
+# ——— диспетчер ———
+
+class ShardWorker:
+    """Дочерний процесс и его состояние глазами диспетчера"""
+
+    __slots__ = ("index", "proc", "ready", "restarts", "dispatched", "acked",
+                 "in_flight")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.ready = False
+        self.restarts = 0
+        self.dispatched = 0
+        # Ответ на текущую перебалансировку
+        self.acked: Optional[asyncio.Future] = None
+        # Отправленные, но ещё не обработанные апдейты: update_id -> апдейт
+        self.in_flight: Dict[int, dict] = {}
+
+    def ack(self) -> None:
+        if self.acked is not None and not self.acked.done():
+            self.acked.set_result(None)
+
+
+class ShardDispatcher:
+    """Запускает воркеров, следит за ними и раскладывает апдейты по слотам"""
+
+    def __init__(self, command: List[str], workers: int = SHARD_WORKERS,
+                 slots: int = SHARD_SLOTS,
+                 env: Optional[Dict[str, str]] = None):
+        self.command = command
+        self.slots = slots
+        self.env = env or {}
+        self.workers = [ShardWorker(i) for i in range(workers)]
+        self.table: List[int] = []
+        self.epoch = 0
+        self.rebalances = 0
+        self.redelivered = 0
+        # Апдейты, которые ждут таблицы слотов или живого владельца
+        self._held: List[dict] = []
+        self._holding = True
+        self._rebalance_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        for worker in self.workers:
+            self._tasks.append(asyncio.create_task(self._supervise(worker)))
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Закрывает воркерам stdin: они дорабатывают начатое и выходят"""
+        self._stopping = True
+        procs = [w.proc for w in self.workers
+                 if w.proc is not None and w.proc.returncode is None]
+        for proc in procs:
+            proc.stdin.close()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(proc.wait() for proc in procs)), timeout
+            )
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._held:
+            print(f"Не доставлено апдейтов: {len(self._held)}")
+
+    async def _supervise(self, worker: ShardWorker) -> None:
+        """Держит воркер запущенным и перезапускает после падения"""
+        while not self._stopping:
+            env = dict(os.environ, **self.env, PYTHONUNBUFFERED="1")
+            env[SHARD_INDEX_ENV] = str(worker.index)
+            if METRICS_PORT:
+                # У каждого воркера свой /metrics: METRICS_PORT + 1 + номер
+                env["METRICS_PORT"] = str(int(METRICS_PORT) + 1 + worker.index)
+            worker.proc = await asyncio.create_subprocess_exec(
+                *self.command, env=env, limit=LINE_LIMIT,
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            )
+            await self._read(worker)
+            code = await worker.proc.wait()
+            was_ready, worker.ready = worker.ready, False
+            worker.ack()
+            if self._stopping:
+                return
+            worker.restarts += 1
+            # Необработанное упавшим уходит раньше всего, что пришло после
+            lost = list(worker.in_flight.values())
+            worker.in_flight.clear()
+            self._held[:0] = lost
+            self.redelivered += len(lost)
+            print(f"Воркер {worker.index} завершился с кодом {code}, "
+                  f"перезапуск через {SHARD_RESTART_DELAY:.0f} с, "
+                  f"переотправка апдейтов: {len(lost)}")
+            if was_ready:
+                # Слоты упавшего расходятся по остальным
+                await self.rebalance()
+            await asyncio.sleep(SHARD_RESTART_DELAY)
+
+    async def _read(self, worker: ShardWorker) -> None:
+        """Служебные сообщения воркера; остальные строки — в наш лог"""
+        async for raw in worker.proc.stdout:
+            line = raw.decode("utf-8", "replace").rstrip("\n")
+            if not line.startswith(CONTROL_PREFIX):
+                print(f"[воркер {worker.index}] {line}")
+                continue
+            message = json.loads(line[len(CONTROL_PREFIX):])
+            if "done" in message:
+                worker.in_flight.pop(message["done"], None)
+            elif "ready" in message:
+                worker.ready = True
+                # Таблицу меняем отдельной задачей: её подтверждения
+                # приходят через этот же цикл чтения
+                self._tasks.append(asyncio.create_task(self.rebalance()))
+            elif message.get("ack") == self.epoch:
+                worker.ack()
+
+    async def rebalance(self) -> None:
+        """Пересчитывает таблицу слотов по живым воркерам.
+
+        На время смены апдейты придерживаются, чтобы сообщения одного
+        пользователя не разошлись по двум воркерам.
+        """
+        async with self._rebalance_lock:
+            live = [w for w in self.workers if w.ready]
+            table = build_table([w.index for w in live], self.slots)
+            if table == self.table:
+                return
+            self._holding = True
+            self.epoch += 1
+            loop = asyncio.get_running_loop()
+            for worker in live:
+                worker.acked = loop.create_future()
+                try:
+                    await self._send(worker, {"rebalance": table,
+                                              "epoch": self.epoch})
+                except (BrokenPipeError, ConnectionResetError):
+                    # Упал прямо сейчас: его слоты уберёт следующий проход
+                    worker.ack()
+            if live:
+                _, late = await asyncio.wait(
+                    [w.acked for w in live], timeout=SHARD_REBALANCE_TIMEOUT
+                )
+                if late:
+                    print(f"Не дождались {len(late)} воркеров при "
+                          "перебалансировке")
+            self.table = table
+            self.rebalances += 1
+            print(f"Слоты перераспределены, живых воркеров: {len(live)}")
+            if not table:
+                return
+            # Придержанные апдейты уходят раньше новых
+            while self._held:
+                held, self._held = self._held, []
+                for data in held:
+                    await self._route(data)
+            self._holding = False
+
+    async def dispatch(self, data: dict) -> None:
+        """Отправляет сырой апдейт воркеру, который ведёт его пользователя"""
+        if self._holding:
+            self._held.append(data)
+            return
+        await self._route(data)
+
+    async def _route(self, data: dict) -> None:
+        key = user_of(data)
+        if key is None:
+            key = data.get("update_id", 0)
+        worker = self.workers[self.table[slot_of(key, self.slots)]]
+        if not worker.ready:
+            # Воркер упал, а таблица ещё старая: дождёмся перебалансировки
+            self._held.append(data)
+            return
+        worker.in_flight[data.get("update_id", 0)] = data
+        try:
+            await self._send(worker, {"update": data})
+        except (BrokenPipeError, ConnectionResetError):
+            # Апдейт уже в in_flight: его переотправят после перезапуска
+            return
+        worker.dispatched += 1
+
+    @staticmethod
+    async def _send(worker: ShardWorker, message: dict) -> None:
+        line = json.dumps(message, ensure_ascii=False) + "\n"
+        worker.proc.stdin.write(line.encode("utf-8"))
+        await worker.proc.stdin.drain()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rebalances": self.rebalances,
+            "redelivered": self.redelivered,
+            "held": len(self._held),
+            "workers": [
+                {"index": w.index, "ready": w.ready, "restarts": w.restarts,
+                 "dispatched": w.dispatched, "in_flight": len(w.in_flight)}
+                for w in self.workers
+            ],
+        }
+
+
+async def poll_updates(token: str, dispatcher: ShardDispatcher) -> None:
+    """Long polling в диспетчере: сырой JSON без разбора в объекты PTB"""
+    base = (TELEGRAM_API_URL or "https://api.telegram.org").rstrip("/")
+    url = f"{base}/bot{token}/"
+    offset = 0
+    async with httpx.AsyncClient(timeout=POLL_TIMEOUT + 10) as client:
+        await client.post(url + "deleteWebhook")
+        while True:
+            try:
+                response = await client.post(url + "getUpdates", json={
+                    "offset": offset, "timeout": POLL_TIMEOUT,
+                    "allowed_updates": Update.ALL_TYPES,
+                })
+                updates = response.json()["result"]
+            except Exception as e:
+                print(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for data in updates:
+                offset = data["update_id"] + 1
+                await dispatcher.dispatch(data)
+
+
+class ShardWebhook(WebhookServer):
+    """Webhook диспетчера: проверяет секрет и передаёт сырой апдейт воркеру"""
+
+    def parse(self, dispatcher: ShardDispatcher, data: Any) -> dict:
+        # Разбор в объекты PTB делает воркер; здесь нужен только update_id
+        if not isinstance(data, dict):
+            raise ValueError("апдейт должен быть JSON-объектом")
+        return data
+
+    async def deliver(self, dispatcher: ShardDispatcher, data: dict) -> None:
+        await dispatcher.dispatch(data)
+
+    async def register(self, token: str, url: str) -> None:
+        base = (TELEGRAM_API_URL or "https://api.telegram.org").rstrip("/")
+        async with httpx.AsyncClient() as client:
+            await client.post(f"{base}/bot{token}/setWebhook", json={
+                "url": url.rstrip("/") + self.path,
+                "secret_token": self.secret,
+                "allowed_updates": Update.ALL_TYPES,
+                "max_connections": WEBHOOK_MAX_CONNECTIONS,
+            })
+
+
+async def serve_sharded(token: str, command: List[str],
+                        workers: int = SHARD_WORKERS, mode: str = BOT_MODE,
+                        stop: Optional[asyncio.Event] = None) -> None:
+    """Диспетчер с воркерами до сигнала остановки"""
+    stop = stop_on_signals(stop)
+    if os.getenv("CONVERSATION_STORE") == "memory":
+        print("CONVERSATION_STORE=memory: при перебалансировке воркеров "
+              "переехавшие пользователи потеряют диалог")
+    dispatcher = ShardDispatcher(command, workers)
+    await dispatcher.start()
+    webhook: Optional[ShardWebhook] = None
+    polling: Optional[asyncio.Task] = None
+    try:
+        if mode == "webhook":
+            webhook = ShardWebhook(dispatcher)
+            webhook.check_secret(bool(WEBHOOK_URL and WEBHOOK_REGISTER))
+            await webhook.start()
+            if WEBHOOK_URL and WEBHOOK_REGISTER:
+                await webhook.register(token, WEBHOOK_URL)
+            print(f"Webhook слушает {webhook.url}, воркеров: {workers}")
+        else:
+            polling = asyncio.create_task(poll_updates(token, dispatcher))
+            print(f"Polling, воркеров: {workers}")
+        await stop.wait()
+    finally:
+        if polling is not None:
+            polling.cancel()
+        if webhook is not None:
+            await webhook.stop()
+        await dispatcher.stop()
+
+
+def run_sharded(token: str, command: List[str],
+                workers: int = SHARD_WORKERS) -> None:
+    try:
+        asyncio.run(serve_sharded(token, command, workers))
+    except KeyboardInterrupt:
+        pass
+
+
+# ——— воркер ———
+
+def _control(message: dict) -> None:
+    print(CONTROL_PREFIX + json.dumps(message), flush=True)
+
+
+async def release_users(app: Application, store: ConversationStore,
+                        moved: Callable[[int], bool]) -> int:
+    """Дорабатывает апдейты уходящих пользователей и отдаёт их сессии"""
+    processor = app.update_processor
+    while True:
+        # Апдейт из очереди доходит до процессора не сразу
+        await asyncio.sleep(0.01)
+        if app.update_queue.empty() and not any(
+                moved(key) for key in processor.busy_keys()):
+            break
+    return await store.release(moved)
+
+
+async def serve_shard(app: Application, store: ConversationStore,
+                      index: int) -> None:
+    """Воркер: апдейты из stdin, ответы — прямо в Bot API"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    # Ctrl+C в терминале получает вся группа процессов; воркеров
+    # останавливает диспетчер, закрывая им stdin
+    loop.add_signal_handler(signal.SIGINT, lambda: None)
+    loop.add_signal_handler(signal.SIGTERM, reader.feed_eof)
+    app.update_processor.on_done = lambda update: _control(
+        {"done": getattr(update, "update_id", 0)}
+    )
+    if not await start_application(app, polling=False):
+        return
+    try:
+        _control({"ready": index})
+        async for raw in reader:
+            message = json.loads(raw)
+            data = message.get("update")
+            if data is not None:
+                await app.update_queue.put(Update.de_json(data, app.bot))
+            elif "rebalance" in message:
+                table = message["rebalance"]
+                released = await release_users(
+                    app, store,
+                    lambda user_id: table[slot_of(user_id, len(table))] != index
+                )
+                if released:
+                    print(f"Отдано сессий другим воркерам: {released}")
+                _control({"ack": message["epoch"]})
+    finally:
+        await stop_applications([app])
+
+
+def run_shard_worker(app: Application, store: ConversationStore,
+                     index: int) -> None:
+    asyncio.run(serve_shard(app, store, index))
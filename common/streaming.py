@@ -0,0 +1,182 @@
+"""Потоковые ответы: текст модели появляется в одном сообщении по мере генерации"""
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import List, Optional
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from common import metrics, tracing
+from common.openai_client import get_async_client
+
+# Включает потоковые ответы во всех ботах
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "0") == "1"
+# Правки сообщения склеиваются: не чаще раза в STREAM_EDIT_INTERVAL_MS
+# или каждые STREAM_EDIT_EVERY_TOKENS токенов — так укладываемся в лимиты
+# Bot API на editMessageText
+STREAM_EDIT_INTERVAL = int(os.getenv("STREAM_EDIT_INTERVAL_MS", "1000")) / 1000
+STREAM_EDIT_EVERY_TOKENS = int(os.getenv("STREAM_EDIT_EVERY_TOKENS", "60"))
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+CURSOR = " ▌"
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Режет длинный текст на куски, которые влезают в одно сообщение"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+def retry_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        retry_after = retry_after.total_seconds()
+    return float(retry_after)
+
+
+class StreamingReply:
+    """Показывает ответ модели по мере генерации, редактируя одно сообщение"""
+
+    def __init__(self, message, prefix: str = "", reply_markup=None,
+                 interval: float = STREAM_EDIT_INTERVAL,
+                 every_tokens: int = STREAM_EDIT_EVERY_TOKENS):
+        self.message = message
+        self.prefix = prefix
+        self.reply_markup = reply_markup
+        self.interval = interval
+        self.every_tokens = every_tokens
+        self.text = ""
+        self.sent = None
+        self.shown = ""
+        self.pending = 0
+        self.last_edit_at = 0.0
+        self.blocked_until = 0.0
+        self.edits = 0
+        self.first_visible_at: Optional[float] = None
+
+    async def push(self, delta: Optional[str]) -> None:
+        """Добавляет кусок ответа и при необходимости обновляет сообщение"""
+        if not delta:
+            return
+        self.text += delta
+        self.pending += 1
+        now = time.monotonic()
+        if now < self.blocked_until:
+            # Bot API попросил подождать: ни первого сообщения, ни правок
+            return
+        # Первый токен показываем сразу — это и есть время до ответа
+        if (self.sent is None or self.pending >= self.every_tokens
+                or now - self.last_edit_at >= self.interval):
+            await self._show(self.text + CURSOR, now)
+
+    def restart(self) -> None:
+        """Начинает ответ заново: повтор запроса не дописывает к обрывку"""
+        self.text = ""
+        self.pending = 0
+
+    async def finish(self, final_text: Optional[str] = None) -> None:
+        """Показывает окончательный текст (или отправляет его, если стрима не было)"""
+        text = self.text if final_text is None else final_text
+        chunks = split_message(self.prefix + text)
+        first, rest = chunks[0], chunks[1:]
+        first_markup = None if rest else self.reply_markup
+        await self._wait_unblocked()
+        if self.sent is None:
+            self.sent = await self.message.reply_text(
+                first, reply_markup=first_markup
+            )
+        elif first != self.shown or first_markup is not None:
+            await self._final_edit(first, first_markup)
+        for i, chunk in enumerate(rest):
+            markup = self.reply_markup if i == len(rest) - 1 else None
+            await self.message.reply_text(chunk, reply_markup=markup)
+
+    async def _wait_unblocked(self) -> None:
+        delay = self.blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _final_edit(self, text: str, reply_markup) -> None:
+        """Окончательная правка: один повтор после RetryAfter, а если правка
+        так и не прошла — окончательный текст отдельным сообщением, чтобы в
+        чате не остался обрывок с курсором"""
+        for attempt in range(2):
+            try:
+                await self.sent.edit_text(text, reply_markup=reply_markup)
+                self.shown = text
+                return
+            except RetryAfter as e:
+                if attempt:
+                    break
+                await asyncio.sleep(retry_seconds(e))
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return
+                print(f"Окончательная правка ответа не прошла: {e}")
+                break
+            except TelegramError as e:
+                print(f"Окончательная правка ответа не прошла: {e}")
+                break
+        self.sent = await self.message.reply_text(
+            text, reply_markup=reply_markup
+        )
+        self.shown = text
+
+    async def _show(self, text: str, now: float) -> None:
+        visible = split_message(self.prefix + text)[0]
+        if visible == self.shown:
+            return
+        try:
+            if self.sent is None:
+                self.sent = await self.message.reply_text(visible)
+                self.first_visible_at = now
+            else:
+                await self.sent.edit_text(visible)
+                self.edits += 1
+        except RetryAfter as e:
+            self.blocked_until = now + retry_seconds(e)
+            return
+        except TelegramError as e:
+            # Промежуточная правка косметическая: сбой сети или Bot API не
+            # должен обрывать генерацию, окончательный текст покажет finish
+            if not isinstance(e, BadRequest):
+                print(f"Промежуточная правка ответа не прошла: {e}")
+            return
+        self.shown = visible
+        self.pending = 0
+        self.last_edit_at = now
+
+
+async def stream_chat_completion(reply: StreamingReply, **kwargs) -> str:
+    """Запрашивает ответ с stream=True и передаёт токены в StreamingReply"""
+    # Планировщик повторяет вызов целиком после обрыва стрима: уже показанный
+    # кусок заменит новый ответ, а не окажется в сообщении дважды
+    reply.restart()
+    stream = await get_async_client().chat.completions.create(
+        stream=True, stream_options={"include_usage": True}, **kwargs
+    )
+    parts = []
+    async for chunk in stream:
+        if not chunk.choices:
+            # Последний чанк без choices несёт usage всего ответа
+            usage = getattr(chunk, "usage", None)
+            metrics.observe_usage(kwargs.get("model", ""), usage)
+            if usage is not None:
+                tracing.annotate(**{
+                    "openai.prompt_tokens": usage.prompt_tokens or 0,
+                    "openai.completion_tokens": usage.completion_tokens or 0,
+                })
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            await reply.push(delta)
+    return "".join(parts)
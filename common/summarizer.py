@@ -0,0 +1,121 @@
+"""Фоновое сжатие старой истории диалога в краткое резюме"""
+import asyncio
+import os
+from itertools import islice
+from typing import Dict, List, Optional
+
+from common.context_builder import message_tokens
+from common.conversation_store import ConversationStore, Session
+from common.openai_client import get_async_client
+from common.openai_scheduler import PRIORITY_BACKGROUND, chat_scheduler
+
+# Модель для резюме: дешёвая, отвечать пользователю она не будет
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4.1-nano")
+# Резюмируем, когда за пределами окна контекста накопилось столько токенов
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "1500"))
+# ...или когда до переполнения кольцевого буфера истории осталось столько
+# сообщений — иначе старые сообщения пропадут, не попав в резюме
+SUMMARY_HEADROOM = int(os.getenv("SUMMARY_HEADROOM", "10"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+SUMMARY_PROMPT = (
+    "Ты ведёшь память о разговоре ассистента с собеседником. "
+    "Обнови резюме: добавь из новых сообщений важные факты о собеседнике, "
+    "его просьбы, договорённости и темы. Пиши кратко, до 150 слов, "
+    "от третьего лица, без приветствий и оценок."
+)
+ROLE_NAMES = {"user": "Собеседник", "assistant": "Ассистент"}
+
+
+class Summarizer:
+    """Сжимает вытесненную из контекста историю вне пути ответа"""
+
+    def __init__(self, store: ConversationStore,
+                 model: str = SUMMARY_MODEL,
+                 trigger_tokens: int = SUMMARY_TRIGGER_TOKENS,
+                 headroom: int = SUMMARY_HEADROOM):
+        self.store = store
+        self.model = model
+        self.trigger_tokens = trigger_tokens
+        self.headroom = headroom
+        self._running: Dict[int, asyncio.Task] = {}
+
+    def maybe_schedule(self, session: Session,
+                       evicted: int) -> Optional[asyncio.Task]:
+        """Запускает резюме, если evicted старейших сообщений пора сжать.
+
+        evicted — сколько сообщений из начала истории не попало в
+        последний контекст модели.
+        """
+        if evicted <= 0 or session.user_id in self._running:
+            return None
+        old = list(islice(session.history, evicted))
+        tokens = sum(message_tokens(m) for m in old)
+        limit = session.history.maxlen
+        near_full = (limit is not None
+                     and len(session.history) >= limit - self.headroom)
+        if tokens < self.trigger_tokens and not near_full:
+            return None
+
+        task = asyncio.create_task(self._summarize(session, old))
+        self._running[session.user_id] = task
+        task.add_done_callback(
+            lambda done: self._forget(session.user_id, done)
+        )
+        return task
+
+    def cancel(self, user_id: int) -> None:
+        """Отменяет резюме пользователя (например, после /reset)"""
+        task = self._running.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    def _forget(self, user_id: int, task: asyncio.Task) -> None:
+        if self._running.get(user_id) is task:
+            del self._running[user_id]
+
+    async def _summarize(self, session: Session, old: List[dict]) -> None:
+        dialog = "\n".join(
+            f"{ROLE_NAMES.get(m['role'], m['role'])}: {m['content']}"
+            for m in old
+        )
+        previous = session.summary or "пока пусто"
+        try:
+            response = await chat_scheduler.run(
+                get_async_client().chat.completions.create,
+                priority=PRIORITY_BACKGROUND,
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": (
+                        f"Текущее резюме: {previous}\n\n"
+                        f"Новые сообщения:\n{dialog}"
+                    )},
+                ],
+                max_tokens=SUMMARY_MAX_TOKENS,
+                temperature=0.2,
+            )
+            summary = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            print(f"Ошибка резюме для {session.user_id}: {e}")
+            return
+        if not summary or session.released:
+            # Пользователь переехал в другой процесс: сессию ведёт он
+            return
+
+        # Пока модель думала, сессию могли вытеснить из кэша и прочитать
+        # заново другим объектом: правим текущую копию, а не захваченную
+        current = await self.store.get(session.user_id)
+        # Кольцевой буфер мог уже выбросить часть сообщений — убираем
+        # только то, что действительно осталось в начале
+        for message in old:
+            if current.history and current.history[0] == message:
+                current.history.popleft()
+        current.summary = summary
+        self.store.save(current)
+
+    async def close(self) -> None:
+        """Дожидается уже запущенных резюме"""
+        if self._running:
+            await asyncio.gather(*self._running.values(),
+                                 return_exceptions=True)
@@ -0,0 +1,197 @@
+"""Сборка и запуск Telegram Application: polling или webhook"""
+import asyncio
+import os
+from typing import List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder
+from telegram.request import HTTPXRequest
+
+from common import metrics, tracing
+from common.update_processor import PerUserUpdateProcessor
+from common.webhook import (
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_PATH, WEBHOOK_REGISTER, WEBHOOK_URL,
+    WebhookServer, serve_webhook, stop_on_signals
+)
+
+# Адрес Bot API; меняется для локального Bot API сервера или бенчмарков
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# polling или webhook; по умолчанию webhook, если задан WEBHOOK_URL
+BOT_MODE = os.getenv("BOT_MODE", "webhook" if WEBHOOK_URL else "polling")
+
+
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest, который пишет вызовы Bot API из обработчиков в спаны send"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with tracing.span("send", tracing.KIND_CLIENT, **{
+            "telegram.method": url.rsplit("/", 1)[-1]
+        }):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+# Пул соединений к Bot API, общий для всех ботов процесса (см. launcher.py)
+_shared_request: Optional[HTTPXRequest] = None
+
+
+def share_connection_pool(size: int) -> HTTPXRequest:
+    """Все боты, собранные после вызова, ходят в Bot API через один пул"""
+    global _shared_request
+    _shared_request = TracedRequest(connection_pool_size=size)
+    return _shared_request
+
+
+def application_builder(token: str,
+                        concurrent_updates: int) -> ApplicationBuilder:
+    """ApplicationBuilder с общими для всех ботов настройками"""
+    bot_id = (token or "").split(":")[0]
+    processor = PerUserUpdateProcessor(concurrent_updates, bot_id=bot_id)
+    metrics.UPDATES_IN_PROGRESS.track((bot_id,),
+                                      lambda: processor.active_users)
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        # Разные пользователи обрабатываются параллельно, а сообщения одного
+        # не обгоняют друг друга в его машине состояний
+        .concurrent_updates(processor)
+    )
+    if _shared_request is not None:
+        builder = builder.request(_shared_request)
+    else:
+        builder = builder.request(
+            TracedRequest(connection_pool_size=concurrent_updates)
+        )
+    if TELEGRAM_API_URL:
+        base = TELEGRAM_API_URL.rstrip("/")
+        builder = builder.base_url(f"{base}/bot").base_file_url(
+            f"{base}/file/bot"
+        )
+    return builder
+
+
+def run_application(app: Application, mode: str = BOT_MODE) -> None:
+    """Запускает бота в выбранном режиме"""
+    if mode == "webhook":
+        try:
+            asyncio.run(serve_webhook(app))
+        except KeyboardInterrupt:
+            pass
+    else:
+        app.run_polling()
+
+
+# ——— несколько ботов в одном процессе ———
+
+def bot_id(app: Application) -> str:
+    return app.bot.token.split(":")[0]
+
+
+async def start_application(app: Application, polling: bool) -> bool:
+    """Жизненный цикл run_polling до приёма апдейтов; False, если не вышло"""
+    initialized = False
+    try:
+        await app.initialize()
+        if app.post_init:
+            await app.post_init(app)
+        initialized = True
+        if polling:
+            await app.updater.start_polling()
+        await app.start()
+    except Exception as e:
+        # Один бот с битым токеном не должен ронять остальных
+        print(f"Бот {bot_id(app)} не запустился: {e}")
+        if initialized:
+            await stop_applications([app])
+        else:
+            await app.shutdown()
+        return False
+    return True
+
+
+async def stop_applications(apps: List[Application]) -> None:
+    """Останавливает ботов в обратном порядке запуска.
+
+    Сначала все перестают принимать апдейты и дорабатывают начатое, и
+    только потом закрываются ресурсы: общий пул Bot API и клиент OpenAI
+    не пропадают из-под ещё работающего соседа.
+    """
+    for app in reversed(apps):
+        try:
+            if app.updater and app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+                if app.post_stop:
+                    await app.post_stop(app)
+        except Exception as e:
+            print(f"Ошибка остановки бота {bot_id(app)}: {e}")
+    for app in reversed(apps):
+        try:
+            await app.shutdown()
+            if app.post_shutdown:
+                await app.post_shutdown(app)
+        except Exception as e:
+            print(f"Ошибка остановки бота {bot_id(app)}: {e}")
+
+
+async def serve_polling(apps: List[Application],
+                        stop: Optional[asyncio.Event] = None) -> None:
+    """Несколько ботов через long polling в одном цикле событий"""
+    stop = stop_on_signals(stop)
+    started: List[Application] = []
+    try:
+        for app in apps:
+            if await start_application(app, polling=True):
+                started.append(app)
+        if started:
+            print(f"Запущено ботов: {len(started)} из {len(apps)}")
+            await stop.wait()
+    finally:
+        await stop_applications(started)
+
+
+async def serve_webhooks(apps: List[Application], url: str = WEBHOOK_URL,
+                         stop: Optional[asyncio.Event] = None) -> None:
+    """Несколько ботов за одним webhook-сервером: WEBHOOK_PATH/<id бота>"""
+    stop = stop_on_signals(stop)
+    server: Optional[WebhookServer] = None
+    started: List[Application] = []
+    try:
+        for app in apps:
+            if not await start_application(app, polling=False):
+                continue
+            started.append(app)
+            path = f"{WEBHOOK_PATH.rstrip('/')}/{bot_id(app)}"
+            if server is None:
+                server = WebhookServer(app, path=path)
+                server.check_secret(bool(url and WEBHOOK_REGISTER))
+            else:
+                server.add(app, path)
+            if url and WEBHOOK_REGISTER:
+                await app.bot.set_webhook(
+                    url.rstrip("/") + path,
+                    secret_token=server.secret,
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                )
+        if server is not None:
+            await server.start()
+            print(f"Webhook слушает {server.http.url} для "
+                  f"{len(started)} ботов")
+            await stop.wait()
+    finally:
+        if server is not None:
+            await server.stop()
+        await stop_applications(started)
+
+
+def run_applications(apps: List[Application], mode: str = BOT_MODE) -> None:
+    """Запускает несколько ботов в одном процессе"""
+    if len(apps) == 1:
+        run_application(apps[0], mode)
+        return
+    serve = serve_webhooks if mode == "webhook" else serve_polling
+    try:
+        asyncio.run(serve(apps))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,251 @@
+"""Трассировка апдейтов: спаны в формате OpenTelemetry (OTLP/JSON).
+
+Каждый апдейт, попавший в выборку (TRACE_SAMPLE_RATE), получает
+trace_id и корневой спан "update" в PerUserUpdateProcessor. Дочерние
+спаны: "dispatch" — ожидание очереди пользователя и слота обработки,
+"state_lookup" и "prompt_build" — в ботах, "model_call" с вложенным
+"queue" — в планировщике OpenAI, "send" — каждый вызов Bot API из
+обработчика. Текущий спан живёт в contextvars, поэтому протаскивать его
+через аргументы не нужно. Апдейты вне выборки не создают объектов:
+span() отдаёт общий пустой спан.
+
+Готовые спаны копятся в буфере и раз в TRACE_FLUSH_INTERVAL уходят
+пачкой в формате OTLP/JSON: строкой в TRACE_FILE или POST-запросом на
+TRACE_OTLP_URL (например, http://127.0.0.1:4318/v1/traces — коллектор
+OpenTelemetry или benchmarks/trace_collector.py).
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Доля апдейтов, которые трассируются: 0 — выключено, 1 — все
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Куда выгружать: URL приёмника OTLP/HTTP или, если он не задан, файл
+TRACE_OTLP_URL = os.getenv("TRACE_OTLP_URL", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SERVICE = os.getenv("TRACE_SERVICE", "bot-lab")
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "2"))
+# Сколько готовых спанов держим до выгрузки; лишние самые старые теряются
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "50000"))
+
+# OTLP: SPAN_KIND_INTERNAL / SERVER / CLIENT, STATUS_CODE_ERROR
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "trace_span", default=None
+)
+_sample_rate = TRACE_SAMPLE_RATE
+
+
+def set_sample_rate(rate: float) -> None:
+    global _sample_rate
+    _sample_rate = rate
+
+
+class Span:
+    """Отрезок работы внутри трассы; with делает его текущим"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, trace_id: str, parent_id: str, name: str,
+                 kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.error = ""
+        self.end_ns = 0
+        self._token = None
+        self.start_ns = time.time_ns()
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, error: str = "") -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if error:
+            self.error = error
+        exporter.add(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current.reset(self._token)
+        self.end(f"{exc_type.__name__}: {exc}" if exc_type else "")
+        return False
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v)
+                           for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class NoopSpan:
+    """Спан вне выборки: ничего не пишет и ничего не стоит"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def end(self, error: str = "") -> None:
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP = NoopSpan()
+
+
+def trace(name: str, kind: int = KIND_SERVER, **attributes):
+    """Корневой спан новой трассы, если она попала в выборку"""
+    if not _sample_rate or random.random() >= _sample_rate:
+        return NOOP
+    return Span(f"{random.getrandbits(128):032x}", "", name, kind, attributes)
+
+
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Дочерний спан текущего; вне трассы — пустой"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP
+    return Span(parent.trace_id, parent.span_id, name, kind, attributes)
+
+
+def annotate(**attributes) -> None:
+    """Добавляет атрибуты текущему спану, если он есть"""
+    current = _current.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Exporter:
+    """Копит готовые спаны и выгружает пачками в файл или OTLP/HTTP"""
+
+    def __init__(self, url: str = TRACE_OTLP_URL, path: str = TRACE_FILE,
+                 service: str = TRACE_SERVICE,
+                 buffer_size: int = TRACE_BUFFER):
+        self.url = url
+        self.path = path
+        self.service = service
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._users = 0
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def add(self, span: Span) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(span)
+
+    def payload(self, spans: List[Span]) -> dict:
+        """Тело запроса ExportTraceServiceRequest в JSON-кодировке OTLP"""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                _attribute("service.name", self.service)
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "common.tracing"},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+        spans = list(self._buffer)
+        self._buffer.clear()
+        body = json.dumps(self.payload(spans), ensure_ascii=False)
+        try:
+            if self.url:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(timeout=10)
+                response = await self._client.post(
+                    self.url, content=body,
+                    headers={"Content-Type": "application/json"},
+                )
+                response.raise_for_status()
+            else:
+                await asyncio.to_thread(self._append, body)
+        except Exception as e:
+            self.failed += len(spans)
+            print(f"Не удалось выгрузить спаны ({len(spans)}): {e}")
+            return 0
+        self.exported += len(spans)
+        return len(spans)
+
+    def _append(self, body: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(body + "\n")
+
+    async def run(self, interval: float = TRACE_FLUSH_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Запускает выгрузку один раз на процесс; парный вызов — stop"""
+        self._users += 1
+        if self._task is None and _sample_rate:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Выгружает остаток, когда трассировку отпустил последний бот"""
+        self._users = max(0, self._users - 1)
+        if self._users or self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+exporter = Exporter()
@@ -0,0 +1,97 @@
+"""Обработка апдейтов: один пользователь — строго по порядку, разные — параллельно"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from common import tracing
+
+# Сколько апдейтов может ждать своей очереди внутри процессора. Ожидающие
+# апдейты одного пользователя не занимают слоты обработки других
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "10000"))
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Сериализует апдейты по пользователю через блокировки по ключу.
+
+    Блокировка пользователя живёт, пока у него есть необработанные апдейты,
+    и удаляется сразу после последнего, так что память не растёт с числом
+    пользователей. asyncio.Lock будит ожидающих в порядке прихода.
+    """
+
+    def __init__(self, concurrency: int,
+                 max_pending: int = UPDATE_MAX_PENDING, bot_id: str = ""):
+        super().__init__(max(concurrency, max_pending))
+        self.concurrency = concurrency
+        # id бота для атрибутов трассировки
+        self.bot_id = bot_id
+        self._slots = asyncio.Semaphore(concurrency)
+        # ключ -> [блокировка, сколько апдейтов её ждут или держат]
+        self._locks: Dict[int, List[Any]] = {}
+        # Вызывается после обработки каждого апдейта (см. common/sharding.py)
+        self.on_done: Optional[Callable[[object], None]] = None
+
+    @property
+    def active_users(self) -> int:
+        return len(self._locks)
+
+    def busy_keys(self) -> List[int]:
+        """Пользователи, у которых есть необработанные апдейты"""
+        return list(self._locks)
+
+    @staticmethod
+    def key_of(update: object) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object,
+                                coroutine: Awaitable[Any]) -> None:
+        # Корневой спан апдейта: всё, что ниже, становится его детьми
+        root = tracing.trace(
+            "update", **{"telegram.bot_id": self.bot_id,
+                         "telegram.update_id": getattr(update, "update_id", 0)}
+        )
+        try:
+            with root:
+                await self._process(update, coroutine)
+        finally:
+            if self.on_done is not None:
+                self.on_done(update)
+
+    async def _process(self, update: object,
+                       coroutine: Awaitable[Any]) -> None:
+        key = self.key_of(update)
+        # Ожидание своей очереди и свободного слота
+        dispatch = tracing.span("dispatch")
+        if key is None:
+            async with self._slots:
+                dispatch.end()
+                await coroutine
+            return
+        tracing.annotate(**{"user.id": key})
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    dispatch.end()
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,218 @@
+"""Асинхронный учёт пользователей: одно соединение SQLite и пакетная запись"""
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+# Новые пользователи копятся в очереди и пишутся пачками
+REGISTRY_BATCH_SIZE = int(os.getenv("REGISTRY_BATCH_SIZE", "200"))
+REGISTRY_FLUSH_INTERVAL = float(os.getenv("REGISTRY_FLUSH_INTERVAL", "1.0"))
+# Если запись не успевает, add_user ждёт flush (обратное давление)
+REGISTRY_MAX_PENDING = int(os.getenv("REGISTRY_MAX_PENDING", "10000"))
+
+# Версия схемы users.db (PRAGMA user_version):
+# 0 — first_seen хранится ISO-строкой, статистика считается по всей таблице;
+# 1 — first_seen в секундах epoch с индексом и счётчики новых по дням;
+# 2 — общее число пользователей в одной строке user_totals
+SCHEMA_VERSION = 2
+SECONDS_PER_DAY = 86400
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_seen INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_users_first_seen ON users (first_seen)",
+    """
+    CREATE TABLE IF NOT EXISTS daily_new_users (
+        day INTEGER PRIMARY KEY,
+        new_users INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        users INTEGER NOT NULL
+    )
+    """,
+]
+# Срабатывает только на реально вставленные строки: INSERT OR IGNORE
+# для уже известного пользователя счётчик не трогает
+COUNT_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS users_count_new AFTER INSERT ON users
+BEGIN
+    INSERT INTO daily_new_users (day, new_users)
+    VALUES (NEW.first_seen / 86400, 1)
+    ON CONFLICT (day) DO UPDATE SET new_users = new_users + 1;
+    UPDATE user_totals SET users = users + 1 WHERE id = 0;
+END
+"""
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Приводит users.db к актуальной схеме, сохраняя пользователей"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    legacy = version == 0 and conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+    ).fetchone() is not None
+    with conn:
+        conn.execute("BEGIN")
+        if legacy:
+            conn.execute("ALTER TABLE users RENAME TO users_legacy")
+        for statement in TABLES:
+            conn.execute(statement)
+        if legacy:
+            # Старые ISO-даты переводим в epoch, а счётчики по дням один раз
+            # пересчитываем из таблицы
+            conn.execute("""
+            INSERT INTO users (user_id, username, first_seen)
+            SELECT user_id, username,
+                   COALESCE(CAST(strftime('%s', first_seen) AS INTEGER), 0)
+            FROM users_legacy
+            """)
+            conn.execute("""
+            INSERT INTO daily_new_users (day, new_users)
+            SELECT first_seen / 86400, COUNT(*) FROM users GROUP BY 1
+            """)
+            conn.execute("DROP TABLE users_legacy")
+        # Общий счётчик один раз считаем по таблице, дальше его ведёт триггер
+        conn.execute("""
+        INSERT OR REPLACE INTO user_totals (id, users)
+        SELECT 0, COUNT(*) FROM users
+        """)
+        conn.execute("DROP TRIGGER IF EXISTS users_count_new")
+        conn.execute(COUNT_TRIGGER)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+class UserRegistry:
+    """Реестр пользователей с отложенной записью (write-behind).
+
+    Все обращения к базе идут через одно долгоживущее соединение в
+    отдельном потоке, поэтому цикл событий бота не ждёт SQLite.
+    """
+
+    def __init__(self, path: str, batch_size: int = REGISTRY_BATCH_SIZE,
+                 flush_interval: float = REGISTRY_FLUSH_INTERVAL,
+                 max_pending: int = REGISTRY_MAX_PENDING):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, Tuple[Optional[str], int]] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="user-registry"
+        )
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._executor.submit(self._open).result()
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        migrate(self._conn)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def add_user(self, user_id: int, username: Optional[str]) -> None:
+        """Ставит пользователя в очередь на запись (повторы игнорируются)"""
+        if user_id not in self._pending:
+            self._pending[user_id] = (username, int(time.time()))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+    def _insert_many(self, rows) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, username, first_seen) "
+                "VALUES (?, ?, ?)",
+                rows
+            )
+
+    async def flush(self) -> int:
+        """Записывает накопленных пользователей одной транзакцией"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            rows = [
+                (user_id, username, first_seen)
+                for user_id, (username, first_seen) in pending.items()
+            ]
+            try:
+                await self._run(self._insert_many, rows)
+            except Exception:
+                for user_id, value in pending.items():
+                    self._pending.setdefault(user_id, value)
+                raise
+            return len(rows)
+
+    async def run_writer(self) -> None:
+        """Фоновая задача: пишет очередь по таймеру или при наборе пачки"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ошибка записи пользователей: {e}")
+
+    def _stats(self) -> Tuple[int, int, int]:
+        # Читаем одну строку общего счётчика и не больше восьми строк
+        # счётчиков по дням, а не таблицу пользователей
+        today = int(time.time()) // SECONDS_PER_DAY
+        cursor = self._conn.cursor()
+
+        cursor.execute("SELECT users FROM user_totals WHERE id = 0")
+        total = cursor.fetchone()[0]
+
+        cursor.execute(
+            "SELECT COALESCE(SUM(new_users), 0) FROM daily_new_users WHERE day = ?",
+            (today,)
+        )
+        today_count = cursor.fetchone()[0]
+
+        cursor.execute(
+            "SELECT COALESCE(SUM(new_users), 0) FROM daily_new_users WHERE day >= ?",
+            (today - 7,)
+        )
+        week = cursor.fetchone()[0]
+
+        return total, today_count, week
+
+    async def get_stats(self) -> Tuple[int, int, int]:
+        """Всего пользователей, новых за сегодня и за неделю"""
+        await self.flush()
+        return await self._run(self._stats)
+
+    async def close(self) -> None:
+        await self.flush()
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # Ручная миграция: python common/user_registry.py Valera_*/users.db
+    for db_path in sys.argv[1:]:
+        connection = sqlite3.connect(db_path)
+        migrate(connection)
+        connection.close()
+        print(f"{db_path}: схема версии {SCHEMA_VERSION}")
@@ -0,0 +1,154 @@
+"""Приём апдейтов Telegram через webhook вместо long polling"""
+import asyncio
+import hmac
+import os
+import secrets
+import signal
+from typing import Any, Dict, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from common.http_server import HTTPServer, Request, Response
+
+# Публичный адрес бота (https://bot.example.com); пустой — работаем через polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Секрет, который Telegram присылает в X-Telegram-Bot-Api-Secret-Token.
+# Пустой — процесс придумывает свой при регистрации webhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Где слушает воркер; TLS и балансировку делает прокси перед ним
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Регистрировать webhook в Telegram при старте. Когда воркеров несколько,
+# достаточно, чтобы это сделал один из них
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") == "1"
+# Сколько параллельных соединений Telegram открывает к webhook (до 100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class WebhookServer:
+    """HTTP-эндпоинт, который кладёт апдейты в очередь Application.
+
+    Несколько ботов одного процесса живут на одном сервере, каждый на
+    своём пути (см. add). Куда уходит апдейт после проверки секрета,
+    решают parse и deliver (см. ShardWebhook в common/sharding.py).
+    """
+
+    def __init__(self, app: Application, secret: str = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH, host: str = WEBHOOK_HOST,
+                 port: int = WEBHOOK_PORT):
+        self.app = app
+        # Без секрета любой, кто знает адрес, прислал бы апдейт от имени
+        # админа; случайный секрет уходит в Telegram через set_webhook
+        self.generated = not secret
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.path = path
+        self.routes: Dict[str, Application] = {path: app}
+        self.received = 0
+        self.rejected = 0
+        self.http = HTTPServer(self.handle, host, port)
+
+    @property
+    def url(self) -> str:
+        return f"{self.http.url}{self.path}"
+
+    def add(self, app: Application, path: str) -> None:
+        self.routes[path] = app
+
+    def check_secret(self, registers: bool) -> None:
+        """Случайный секрет знает только этот процесс: webhook должен
+        регистрировать он сам, иначе нужен общий WEBHOOK_SECRET"""
+        if self.generated and not registers:
+            raise RuntimeError(
+                "Задайте WEBHOOK_SECRET: webhook регистрирует другой процесс"
+            )
+
+    async def start(self) -> None:
+        await self.http.start()
+
+    async def stop(self) -> None:
+        await self.http.stop()
+
+    async def handle(self, request: Request) -> Response:
+        if request.path == "/health":
+            return Response(b"ok")
+        app = self.routes.get(request.path)
+        if app is None:
+            return Response(b"not found", 404)
+        if request.method != "POST":
+            return Response(b"method not allowed", 405)
+        if not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, "").encode("utf-8"),
+                self.secret.encode("utf-8")):
+            self.rejected += 1
+            return Response(b"forbidden", 403)
+
+        try:
+            update = self.parse(app, request.json())
+        except Exception as e:
+            print(f"Кривой апдейт в webhook: {e}")
+            return Response(b"bad request", 400)
+        await self.deliver(app, update)
+        self.received += 1
+        return Response(b"", 200)
+
+    def parse(self, app: Application, data: Any) -> Any:
+        """Апдейт из тела запроса; исключение означает ответ 400"""
+        return Update.de_json(data, app.bot)
+
+    async def deliver(self, app: Application, update: Any) -> None:
+        # Отвечаем сразу: обработку ведёт Application со своей
+        # конкурентностью, а Telegram не ждёт ответа модели
+        await app.update_queue.put(update)
+
+
+def stop_on_signals(stop: Optional[asyncio.Event] = None) -> asyncio.Event:
+    """Событие, которое выставят SIGINT/SIGTERM"""
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка по Ctrl+C через KeyboardInterrupt
+            pass
+    return stop
+
+
+async def serve_webhook(app: Application, url: str = WEBHOOK_URL,
+                        server: Optional[WebhookServer] = None,
+                        stop: Optional[asyncio.Event] = None) -> None:
+    """Запускает Application с webhook-сервером до сигнала остановки"""
+    server = server or WebhookServer(app)
+    server.check_secret(bool(url and WEBHOOK_REGISTER))
+    stop = stop_on_signals(stop)
+
+    # Тот же жизненный цикл, что и в run_polling: post_init/post_shutdown
+    # остаются точками подключения фоновых задач ботов
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        await server.start()
+        if url and WEBHOOK_REGISTER:
+            await app.bot.set_webhook(
+                url.rstrip("/") + server.path,
+                secret_token=server.secret,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+        print(f"Webhook слушает {server.url}")
+        await stop.wait()
+    finally:
+        await server.stop()
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
@@ -0,0 +1,144 @@
+"""Хаб и Валеры в одном процессе: несколько ботов на общем цикле событий.
+
+Каждый бот загружается из своего каталога (GPT_hub_bot/bot.py,
+Valera_*/main.py) и получает свой токен. Общими становятся интерпретатор,
+пул соединений к Bot API, клиент OpenAI с планировщиком запросов и
+загруженные модули. Настройки из .env тоже общие: первый прочитанный
+.env выигрывает, поэтому токены задаются только здесь. По той же причине
+mock_mode Валеры (подменный транспорт OpenAI) включается либо всем ботам
+процесса, либо никому.
+
+    BOTS="GPT_hub_bot=123:AAA,Valera_test_4.1_nano=456:BBB,\
+Valera_test_4.1_nano:nyasha=789:CCC" python launcher.py
+
+Запись — «каталог[:персонаж]=токен». Персонаж имеет смысл только для Валеры.
+Режим (polling или webhook) выбирается как обычно, через BOT_MODE и
+WEBHOOK_URL.
+"""
+import importlib.util
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(ROOT, ".env"))
+sys.path.append(ROOT)
+from common.conversation_store import create_store  # noqa: E402
+from common.telegram_app import (  # noqa: E402
+    run_applications, share_connection_pool
+)
+
+BOTS = os.getenv("BOTS", "")
+# Размер общего пула соединений к Bot API
+LAUNCHER_POOL_SIZE = int(os.getenv("LAUNCHER_POOL_SIZE", "256"))
+
+
+def parse_bots(value: str) -> List[Tuple[str, str, str]]:
+    """"dir:character=token,..." -> [(каталог, персонаж, токен), ...]"""
+    bots = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        key, _, token = item.partition("=")
+        bot_dir, _, character = key.strip().partition(":")
+        bots.append((bot_dir, character, token.strip()))
+    return bots
+
+
+@contextmanager
+def in_dir(path: str):
+    """Относительные пути (базы, tariffs.json) считаются от каталога бота"""
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+_modules: Dict[str, object] = {}
+
+
+def load_bot_module(bot_dir: str):
+    """Импортирует модуль бота под уникальным именем.
+
+    Модули из каталога бота (users.py, keyboards.py) после импорта убираются
+    из sys.modules, чтобы у второго бота был свой users, а не чужой.
+    """
+    if bot_dir in _modules:
+        return _modules[bot_dir]
+    path = os.path.join(ROOT, bot_dir)
+    filename = "bot.py" if os.path.exists(os.path.join(path, "bot.py")) \
+        else "main.py"
+    name = "bot_" + "".join(c if c.isalnum() else "_" for c in bot_dir)
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(path, filename)
+    )
+    module = importlib.util.module_from_spec(spec)
+    before = set(sys.modules)
+    sys.path.insert(0, path)
+    try:
+        with in_dir(path):
+            spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(path)
+        for local in set(sys.modules) - before:
+            local_file = getattr(sys.modules[local], "__file__", "") or ""
+            if local_file.startswith(path + os.sep):
+                del sys.modules[local]
+    _modules[bot_dir] = module
+    return module
+
+
+def build_bot(bot_dir: str, character: str, token: str, used: set):
+    module = load_bot_module(bot_dir)
+    path = os.path.join(ROOT, bot_dir)
+    if not hasattr(module, "ValeraBot"):
+        return module.build_application(token)
+    # Первый бот из каталога Валеры берёт его базу по умолчанию,
+    # следующие — свою базу на токен
+    bot = module.default_bot
+    if id(bot) in used:
+        with in_dir(path):
+            store = create_store(f"conversations_{token.split(':')[0]}.db")
+        bot = module.ValeraBot(character or bot.character, store)
+    elif character:
+        bot.character = character
+    used.add(id(bot))
+    return module.build_application(token, bot)
+
+
+def check_mock_mode() -> None:
+    """Подменный транспорт OpenAI общий на процесс: смешивать нельзя"""
+    mocked = [bot_dir for bot_dir, module in _modules.items()
+              if getattr(module, "MOCK_MODE", False)]
+    if mocked and len(mocked) != len(_modules):
+        real = [bot_dir for bot_dir in _modules if bot_dir not in mocked]
+        raise SystemExit(
+            f"mock_mode включён у {', '.join(mocked)}, но не у "
+            f"{', '.join(real)}: синтетические ответы получили бы все боты "
+            "процесса. Запустите их отдельными процессами"
+        )
+
+
+def main() -> None:
+    bots = parse_bots(BOTS)
+    if not bots:
+        raise SystemExit("Задайте BOTS=\"каталог[:персонаж]=токен,...\"")
+    started = time.perf_counter()
+    share_connection_pool(LAUNCHER_POOL_SIZE)
+    used: set = set()
+    apps = [build_bot(bot_dir, character, token, used)
+            for bot_dir, character, token in bots]
+    check_mock_mode()
+    print(f"Собрано ботов: {len(apps)} за "
+          f"{time.perf_counter() - started:.2f} с")
+    run_applications(apps)
+
+
+if __name__ == "__main__":
+    main()